@@ -44,6 +44,19 @@ class CDRWriterTest(unittest.TestCase):
         Assertions.assert_cdr_global_attributes(self, ds.attrs)
         Assertions.assert_gridded_global_attributes(self, ds.attrs)
 
+    def testCreateTemplate_chunked(self):
+        ds = CDRWriter.createTemplate('SST_ENSEMBLE', 409, 3000, num_samples=20, chunked=True)
+
+        self.assertEqual(((1280, 1280, 440), (409,)), ds.variables["latitude"].chunks)
+        self.assertTrue(CDRWriter.createTemplate('SST_ENSEMBLE', 409, 3000, num_samples=20).identical(ds.compute()))
+
+    def test_estimate_size(self):
+        estimate = CDRWriter.estimate_size('SST_ENSEMBLE', 409, 12000, num_samples=20)
+
+        ds = CDRWriter.createTemplate('SST_ENSEMBLE', 409, 12000, num_samples=20)
+        self.assertEqual(ds.nbytes, estimate.memory_bytes)
+        self.assertEqual(ds.nbytes, estimate.file_bytes)
+
     def test_create_file_name_CDR(self):
         start = datetime.datetime(2015, 8, 23, 14, 24, 52)
         end = datetime.datetime(2015, 8, 23, 15, 25, 53)
@@ -0,0 +1,278 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+
+from fiduceo.cdr.writer.ensemble_writer import EnsembleWriter
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+
+
+def create_template(width, height, num_samples):
+    ds = EnsembleWriter.create_template("SST_ENSEMBLE", width, height, num_samples)
+    for name, value in ds.attrs.items():
+        if value is None:
+            ds.attrs[name] = "test"
+
+    ds["latitude"].data[:] = np.linspace(-60.0, 60.0, height, dtype=np.float32)[:, np.newaxis]
+    ds["longitude"].data[:] = np.linspace(-20.0, 20.0, width, dtype=np.float32)[np.newaxis, :]
+    ds["time"].data[:] = np.arange(height, dtype=np.int32)
+    return ds
+
+
+def create_member(index, width, height):
+    return (270.0 + index + np.arange(height * width, dtype=np.float32).reshape(height, width) * 0.01).astype(np.float32)
+
+
+class EnsembleWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.temp_dir, "ensemble.nc")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_create_template(self):
+        ds = EnsembleWriter.create_template("SST_ENSEMBLE", 409, 2000, 100)
+
+        sst = ds.variables["sst"]
+        self.assertEqual((100, 2000, 409), sst.shape)
+        self.assertTrue(ChunkedTemplate.is_chunked(sst))
+        self.assertEqual(((1,) * 100, (1280, 720), (409,)), sst.data.chunks)
+        self.assertFalse(ChunkedTemplate.is_chunked(ds.variables["latitude"]))
+        self.assertEqual(["sst"], EnsembleWriter.get_ensemble_variables(ds))
+
+    def test_write_members(self):
+        ds = create_template(12, 9, 4)
+        writer = EnsembleWriter.create(ds, self.file)
+        self.assertEqual([], writer.get_written_members())
+
+        for index in [2, 0, 3, 1]:
+            writer.write_member(index, create_member(index, 12, 9))
+        self.assertEqual([0, 1, 2, 3], writer.get_written_members())
+
+        writer.close()
+        self.assertEqual(["ensemble.nc"], os.listdir(self.temp_dir))
+
+        with xr.open_dataset(self.file) as product:
+            self.assertEqual((4, 9, 12), product["sst"].shape)
+            for index in range(4):
+                np.testing.assert_array_equal(create_member(index, 12, 9), product["sst"].values[index])
+            np.testing.assert_allclose(ds["latitude"].values, product["latitude"].values, atol=0.003)
+            np.testing.assert_array_equal(np.arange(9), product["time"].values)
+            self.assertEqual((1, 9, 12), product["sst"].encoding["chunksizes"])
+
+    def test_write_member_pickled_writer(self):
+        ds = create_template(6, 5, 2)
+        writer = EnsembleWriter.create(ds, self.file)
+
+        # as in worker processes
+        pickle.loads(pickle.dumps(writer)).write_member(1, create_member(1, 6, 5))
+        pickle.loads(pickle.dumps(writer)).write_member(0, create_member(0, 6, 5))
+        writer.close()
+
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_array_equal(create_member(1, 6, 5), product["sst"].values[1])
+
+    def test_write_member_invalid(self):
+        ds = create_template(6, 5, 2)
+        writer = EnsembleWriter.create(ds, self.file)
+
+        for index, values in [(2, create_member(0, 6, 5)), (-1, create_member(0, 6, 5)), (0, np.zeros((5, 5), np.float32)), (0, {"sst_mean": create_member(0, 6, 5)})]:
+            try:
+                writer.write_member(index, values)
+                self.fail("ValueError expected")
+            except ValueError:
+                pass
+
+        writer.discard()
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_close_missing_members(self):
+        ds = create_template(6, 5, 3)
+        writer = EnsembleWriter.create(ds, self.file)
+        writer.write_member(1, create_member(1, 6, 5))
+
+        try:
+            writer.close()
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+        self.assertFalse(os.path.isfile(self.file))
+
+        writer.close(allow_missing=True)
+        with xr.open_dataset(self.file) as product:
+            self.assertTrue(np.all(np.isnan(product["sst"].values[0])))
+            np.testing.assert_array_equal(create_member(1, 6, 5), product["sst"].values[1])
+
+    def test_create_resume(self):
+        ds = create_template(6, 5, 2)
+        writer = EnsembleWriter.create(ds, self.file)
+        writer.write_member(0, create_member(0, 6, 5))
+
+        resumed = EnsembleWriter.create(ds, self.file, resume=True)
+        self.assertEqual([0], resumed.get_written_members())
+        resumed.write_member(1, create_member(1, 6, 5))
+        resumed.close()
+
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_array_equal(create_member(0, 6, 5), product["sst"].values[0])
+
+    def test_create_existing_file(self):
+        ds = create_template(6, 5, 2)
+        with open(self.file, "w") as existing:
+            existing.write("product")
+
+        try:
+            EnsembleWriter.create(ds, self.file)
+            self.fail("IOError expected")
+        except IOError:
+            pass
+
+    def test_close_writes_statistics(self):
+        ds = create_template(6, 5, 5)
+        writer = EnsembleWriter.create(ds, self.file, quantiles=[0.05, 0.5, 0.95])
+        self.assertEqual(["sst_mean", "sst_std", "sst_p5", "sst_p50", "sst_p95"], EnsembleWriter.get_statistics_names("sst", writer.quantiles))
+
+        members = np.stack([create_member(index, 6, 5) for index in range(5)])
+        members[:, 0, 0] = np.NaN
+        for index in range(5):
+            writer.write_member(index, members[index])
+        writer.close()
+
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(np.mean(members, axis=0), product["sst_mean"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.std(members, axis=0, ddof=1), product["sst_std"].values, rtol=1e-4)
+            # exact for up to five members
+            np.testing.assert_allclose(np.quantile(members, 0.05, axis=0), product["sst_p5"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.median(members, axis=0), product["sst_p50"].values, rtol=1e-6)
+            self.assertTrue(np.isnan(product["sst_mean"].values[0, 0]))
+            self.assertEqual("K", product["sst_p95"].attrs["units"])
+            self.assertEqual("Ensemble mean of sst", product["sst_mean"].attrs["description"])
+            self.assertEqual((5, 6), product["sst_std"].encoding["chunksizes"])
+
+    def test_close_exact_quantiles_of_small_ensembles(self):
+        ds = create_template(6, 5, 7)
+        writer = EnsembleWriter.create(ds, self.file, quantiles=[0.1, 0.5, 0.9])
+
+        members = np.stack([create_member(index, 6, 5) * (1.0 + 0.1 * (index % 3)) for index in range(7)])
+        members[2, 1, 1] = np.NaN
+        for index in range(7):
+            writer.write_member(index, members[index])
+
+        # pixels are read in blocks of rows
+        with mock.patch("fiduceo.cdr.writer.ensemble_writer.QUANTILE_BLOCK_ELEMENTS", 7 * 6 * 2):
+            writer.close()
+
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(np.nanquantile(members, 0.1, axis=0), product["sst_p10"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.nanquantile(members, 0.5, axis=0), product["sst_p50"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.nanquantile(members, 0.9, axis=0), product["sst_p90"].values, rtol=1e-6)
+            self.assertEqual("Ensemble quantile 0.9 of sst", product["sst_p90"].attrs["description"])
+
+    def test_close_estimated_quantiles_of_large_ensembles(self):
+        with mock.patch("fiduceo.cdr.writer.ensemble_writer.EXACT_QUANTILE_MEMBERS", 3):
+            ds = create_template(6, 5, 5)
+            writer = EnsembleWriter.create(ds, self.file, quantiles=[0.5])
+
+            members = np.stack([create_member(index, 6, 5) * (index % 2 + 1) for index in range(5)])
+            for index in range(5):
+                writer.write_member(index, members[index])
+            writer.close()
+
+        with xr.open_dataset(self.file) as product:
+            # P-square estimates are exact for up to five members
+            np.testing.assert_allclose(np.median(members, axis=0), product["sst_p50"].values, rtol=1e-6)
+            self.assertEqual("Ensemble quantile 0.5 of sst, P-square estimate", product["sst_p50"].attrs["description"])
+
+    def test_close_merges_statistics_of_workers(self):
+        ds = create_template(6, 5, 6)
+        writer = EnsembleWriter.create(ds, self.file, statistics=True)
+
+        # workers write disjoint members with their own copy of the writer
+        for members in [[0, 2, 4], [1, 3], [5]]:
+            worker = pickle.loads(pickle.dumps(writer))
+            for index in members:
+                worker.write_member(index, create_member(index, 6, 5) * (index % 2 + 1))
+            worker.save_statistics()
+        writer.close()
+        self.assertEqual(["ensemble.nc"], os.listdir(self.temp_dir))
+
+        members = np.stack([create_member(index, 6, 5) * (index % 2 + 1) for index in range(6)])
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(np.mean(members, axis=0), product["sst_mean"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.std(members, axis=0, ddof=1), product["sst_std"].values, rtol=1e-5)
+            self.assertNotIn("sst_p50", product.variables)
+
+    def test_close_statistics_not_saved(self):
+        ds = create_template(6, 5, 3)
+        writer = EnsembleWriter.create(ds, self.file, statistics=True)
+
+        # statistics of this worker are not saved, the member is read from the part file
+        worker = pickle.loads(pickle.dumps(writer))
+        worker.write_member(0, create_member(0, 6, 5))
+        writer.write_member(1, create_member(1, 6, 5))
+        writer.write_member(2, create_member(2, 6, 5) * 2)
+        writer.close()
+
+        members = np.stack([create_member(0, 6, 5), create_member(1, 6, 5), create_member(2, 6, 5) * 2])
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(np.mean(members, axis=0), product["sst_mean"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.std(members, axis=0, ddof=1), product["sst_std"].values, rtol=1e-5)
+
+    def test_close_statistics_resumed(self):
+        ds = create_template(6, 5, 4)
+        interrupted = EnsembleWriter.create(ds, self.file, statistics=True)
+        for index in range(2):
+            interrupted.write_member(index, create_member(index, 6, 5))
+
+        resumed = EnsembleWriter.create(ds, self.file, resume=True, statistics=True)
+        # member 1 is written again with other values, member 0 is not covered by statistics of any writer
+        for index in range(1, 4):
+            resumed.write_member(index, create_member(index, 6, 5) * 2)
+        resumed.close()
+
+        members = np.stack([create_member(0, 6, 5)] + [create_member(index, 6, 5) * 2 for index in range(1, 4)])
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(np.mean(members, axis=0), product["sst_mean"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.std(members, axis=0, ddof=1), product["sst_std"].values, rtol=1e-5)
+
+    def test_close_statistics_member_written_twice(self):
+        ds = create_template(6, 5, 3)
+        writer = EnsembleWriter.create(ds, self.file, statistics=True)
+
+        # the first worker saves statistics of member 0 overwritten later by the second worker
+        for members in [[0, 1], [0, 2]]:
+            worker = pickle.loads(pickle.dumps(writer))
+            for index in members:
+                worker.write_member(index, create_member(index, 6, 5) * (members[-1] + index + 1))
+            worker.save_statistics()
+        writer.close()
+
+        members = np.stack([create_member(0, 6, 5) * 3, create_member(1, 6, 5) * 3, create_member(2, 6, 5) * 5])
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(members, product["sst"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.mean(members, axis=0), product["sst_mean"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.std(members, axis=0, ddof=1), product["sst_std"].values, rtol=1e-5)
+
+    def test_close_quantiles_of_several_writers(self):
+        ds = create_template(6, 5, 3)
+        writer = EnsembleWriter.create(ds, self.file, quantiles=[0.5])
+
+        # quantiles are computed from the part file
+        worker = pickle.loads(pickle.dumps(writer))
+        worker.write_member(0, create_member(0, 6, 5))
+        worker.save_statistics()
+        writer.write_member(1, create_member(1, 6, 5))
+        writer.write_member(2, create_member(2, 6, 5) * 2)
+        writer.close()
+
+        members = np.stack([create_member(0, 6, 5), create_member(1, 6, 5), create_member(2, 6, 5) * 2])
+        with xr.open_dataset(self.file) as product:
+            np.testing.assert_allclose(np.median(members, axis=0), product["sst_p50"].values, rtol=1e-6)
+            np.testing.assert_allclose(np.mean(members, axis=0), product["sst_mean"].values, rtol=1e-6)
@@ -23,3 +23,15 @@ class TemplateFactoryTest(unittest.TestCase):
 
         uth = self.factory.get_cdr_template("UTH")
         self.assertIsNotNone(uth)
+
+    def test_get_schema(self):
+        schema = self.factory.get_schema("SST_ENSEMBLE", 409, num_samples=20)
+
+        self.assertIn("sst", schema.variable_names)
+        self.assertEqual(dict([("x", 409), ("y", 1200), ("samples", 20)]), dict(schema.get_dim_sizes(1200)))
+
+    def test_create_template(self):
+        dataset = self.factory.create_template("UTH", 360, 1200)
+
+        self.assertEqual(1200, dataset.dims["y"])
+        self.assertEqual([], self.factory.get_schema("UTH", 360).validate(dataset))
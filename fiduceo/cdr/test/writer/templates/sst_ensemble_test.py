@@ -33,4 +33,5 @@ class SSTEnsembleTest(unittest.TestCase):
         self.assertTrue(np.isnan(sst.attrs["_FillValue"]))
         self.assertEqual("sea_surface_temperature", sst.attrs["standard_name"])
         self.assertEqual("K", sst.attrs["units"])
-        self.assertEqual("longitude latitude", sst.attrs["coordinates"])
\ No newline at end of file
+        self.assertEqual("longitude latitude", sst.attrs["coordinates"])
+        self.assertEqual((1, 1280, 409), sst.encoding["chunksizes"])
\ No newline at end of file
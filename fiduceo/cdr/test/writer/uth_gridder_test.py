@@ -0,0 +1,228 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from fiduceo.cdr.writer.cdr_writer import CDRWriter
+from fiduceo.cdr.writer.uth_gridder import UTHGridder
+
+DAY = 86400
+
+
+class UTHGridderTest(unittest.TestCase):
+
+    def test_get_cell_indices(self):
+        gridder = UTHGridder(width=360, height=180)
+
+        cells = gridder.get_cell_indices(np.array([-90.0, -89.5, 0.0, 90.0, 45.2]), np.array([-180.0, 179.9, 0.5, 180.0, -90.7]))
+        self.assertEqual([0, 359, 90 * 360 + 180, 179 * 360, 135 * 360 + 89], cells.tolist())
+
+    def test_fill_counts_and_means_one_day(self):
+        gridder = UTHGridder(width=36, height=18)
+
+        gridder.add(np.array([0.5, 1.5, 2.5, -50.0]), np.array([0.5, 1.5, 2.5, 100.0]), np.array([240.0, 242.0, 250.0, 260.0]), np.array([30.0, 40.0, np.NaN, 10.0]), np.array([True, True, True, False]), np.array([3600, 3700, 3800, 7200]))
+
+        ds = gridder.create_dataset()
+
+        self.assertEqual(2, ds["observation_count_ascend"].values[9, 18])
+        self.assertEqual(3, ds["observation_count_all_ascend"].values[9, 18])
+        self.assertEqual(1, ds["overpass_count_ascend"].values[9, 18])
+        self.assertAlmostEqual(35.0, ds["uth_ascend"].values[9, 18], 5)
+        self.assertAlmostEqual(241.0, ds["BT_ascend"].values[9, 18], 5)
+        self.assertAlmostEqual(244.0, ds["BT_full_ascend"].values[9, 18], 4)
+        self.assertAlmostEqual(np.std([240.0, 242.0, 250.0], ddof=1), ds["BT_full_inhomogeneity_ascend"].values[9, 18], 4)
+        self.assertTrue(np.isnan(ds["uth_inhomogeneity_ascend"].values[9, 18]))
+        self.assertEqual([3600, 3800], ds["time_ranges_ascend"].values[:, 9, 18].tolist())
+
+        self.assertEqual(1, ds["observation_count_descend"].values[4, 28])
+        self.assertAlmostEqual(10.0, ds["uth_descend"].values[4, 28], 5)
+        self.assertEqual(0, ds["observation_count_descend"].values[9, 18])
+        self.assertTrue(np.isnan(ds["uth_descend"].values[9, 18]))
+        self.assertEqual(0, ds["observation_count_ascend"].values[4, 28])
+
+        self.assertAlmostEqual(-85.0, ds["lat"].values[0], 5)
+        self.assertAlmostEqual(175.0, ds["lon"].values[-1], 5)
+        self.assertEqual([-90.0, -80.0], ds["lat_bnds"].values[0].tolist())
+        self.assertEqual([170.0, 180.0], ds["lon_bnds"].values[-1].tolist())
+
+    def test_fill_monthly_mean_of_daily_means(self):
+        gridder = UTHGridder(width=36, height=18)
+
+        gridder.add(np.full(3, 10.0), np.full(3, 10.0), np.full(3, 250.0), np.array([10.0, 20.0, 30.0]), True, np.array([100, 200, 300]), overpass=1)
+        gridder.add(np.full(1, 10.0), np.full(1, 10.0), np.full(1, 260.0), np.array([60.0]), True, np.array([DAY + 100]), overpass=2)
+
+        ds = gridder.create_dataset()
+
+        # mean of the daily means 20 and 60, not of all four values
+        self.assertAlmostEqual(40.0, ds["uth_ascend"].values[10, 19], 5)
+        self.assertAlmostEqual(np.std([20.0, 60.0], ddof=1), ds["uth_inhomogeneity_ascend"].values[10, 19], 5)
+        self.assertAlmostEqual(255.0, ds["BT_ascend"].values[10, 19], 5)
+        self.assertAlmostEqual(np.std([250.0, 260.0], ddof=1), ds["BT_inhomogeneity_ascend"].values[10, 19], 4)
+        self.assertAlmostEqual(np.std([250.0, 250.0, 250.0, 260.0], ddof=1), ds["BT_full_inhomogeneity_ascend"].values[10, 19], 4)
+        self.assertEqual(4, ds["observation_count_ascend"].values[10, 19])
+        self.assertEqual(2, ds["overpass_count_ascend"].values[10, 19])
+        self.assertEqual([100, 300], ds["time_ranges_ascend"].values[:, 10, 19].tolist())
+
+    def test_add_blocks_equals_add_all(self):
+        random = np.random.RandomState(17)
+        num_pixels = 20000
+        latitude = random.uniform(-90.0, 90.0, num_pixels)
+        longitude = random.uniform(-180.0, 180.0, num_pixels)
+        bt = random.uniform(200.0, 280.0, num_pixels)
+        uth = np.where(random.uniform(size=num_pixels) > 0.3, random.uniform(0.0, 100.0, num_pixels), np.NaN)
+        ascending = random.uniform(size=num_pixels) > 0.5
+        time = np.sort(random.uniform(0, 5 * DAY, num_pixels))
+
+        single = UTHGridder(width=72, height=36)
+        single_days = np.floor(time / DAY)
+        for day in np.unique(single_days):
+            in_day = single_days == day
+            single.add(latitude[in_day], longitude[in_day], bt[in_day], uth[in_day], ascending[in_day], time[in_day], overpass=0)
+        expected = single.create_dataset()
+
+        blocks = UTHGridder(width=72, height=36)
+        for start in range(0, num_pixels, 777):
+            end = start + 777
+            blocks.add(latitude[start:end], longitude[start:end], bt[start:end], uth[start:end], ascending[start:end], time[start:end], overpass=0)
+        actual = blocks.create_dataset()
+
+        for name in ["uth_ascend", "BT_descend", "BT_full_ascend", "uth_inhomogeneity_descend", "BT_full_inhomogeneity_ascend", "observation_count_ascend", "observation_count_all_descend", "overpass_count_ascend", "time_ranges_descend"]:
+            np.testing.assert_allclose(expected[name].values, actual[name].values, rtol=1e-6, err_msg=name)
+
+    def test_add_overpass_counted_once_per_cell(self):
+        gridder = UTHGridder(width=36, height=18)
+
+        gridder.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([100]), overpass=4711)
+        gridder.add(np.array([0.6]), np.array([0.6]), np.array([250.0]), np.array([50.0]), True, np.array([110]), overpass=4711)
+        gridder.add(np.array([0.7]), np.array([0.7]), np.array([250.0]), np.array([50.0]), True, np.array([6000]), overpass=4712)
+        gridder.add(np.array([0.8]), np.array([0.8]), np.array([250.0]), np.array([50.0]), True, np.array([9000]))
+
+        ds = gridder.create_dataset()
+        self.assertEqual(3, ds["overpass_count_ascend"].values[9, 18])
+        self.assertEqual(4, ds["observation_count_ascend"].values[9, 18])
+
+    def test_add_anonymous_overpasses(self):
+        gridder = UTHGridder(width=36, height=18)
+
+        for index in range(200):
+            gridder.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([index]))
+
+        self.assertEqual(200, gridder.create_dataset()["overpass_count_ascend"].values[9, 18])
+        # anonymous overpasses are counted without being recorded
+        self.assertEqual({}, gridder._overpass_ids)
+
+    def test_merge_continues_overpasses(self):
+        gridder = UTHGridder(width=36, height=18, complete_days=False)
+        gridder.add(np.array([0.5, 10.5]), np.array([0.5, 0.5]), np.array([250.0, 250.0]), np.array([50.0, 50.0]), True, np.array([100, 100]), overpass=4711)
+
+        other = UTHGridder(width=36, height=18, complete_days=False)
+        other.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([200]), overpass=4712)
+        other.add(np.array([20.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([300]))
+        gridder.merge(other)
+
+        # both overpasses continue in the cells they touched last, a new anonymous overpass is counted
+        gridder.add(np.array([10.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([400]), overpass=4711)
+        gridder.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([500]), overpass=4712)
+        gridder.add(np.array([20.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([600]))
+
+        ds = gridder.create_dataset()
+        self.assertEqual(2, ds["overpass_count_ascend"].values[9, 18])
+        self.assertEqual(1, ds["overpass_count_ascend"].values[10, 18])
+        self.assertEqual(2, ds["overpass_count_ascend"].values[11, 18])
+
+    def test_add_datetime64_and_invalid_pixels(self):
+        gridder = UTHGridder(width=36, height=18)
+
+        time = np.array(["2010-06-01T01:00:00", "2010-06-01T02:00:00", "NaT", "2010-06-01T03:00:00"], dtype="datetime64[ms]")
+        gridder.add(np.array([0.5, np.NaN, 0.5, 0.5]), np.array([0.5, 0.5, 0.5, 0.5]), np.array([250.0, 250.0, 250.0, 260.0]), np.array([50.0, 50.0, 50.0, 70.0]), False, time)
+
+        ds = gridder.create_dataset()
+        self.assertEqual(2, ds["observation_count_all_descend"].values[9, 18])
+        self.assertAlmostEqual(60.0, ds["uth_descend"].values[9, 18], 5)
+        self.assertEqual([3600, 10800], ds["time_ranges_descend"].values[:, 9, 18].tolist())
+
+    def test_add_completed_day(self):
+        gridder = UTHGridder(width=36, height=18)
+
+        gridder.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([2 * DAY + 100]))
+        gridder.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([3 * DAY + 100]))
+
+        try:
+            gridder.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([2 * DAY + 200]))
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_fill_wrong_template_size(self):
+        gridder = UTHGridder(width=36, height=18)
+        ds = CDRWriter.createTemplate("UTH", 36, 17)
+
+        try:
+            gridder.fill(ds)
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_merge_files_equals_single_pass(self):
+        random = np.random.RandomState(5)
+        num_pixels = 30000
+        latitude = random.uniform(-90.0, 90.0, num_pixels)
+        longitude = random.uniform(-180.0, 180.0, num_pixels)
+        bt = random.uniform(200.0, 280.0, num_pixels)
+        uth = np.where(random.uniform(size=num_pixels) > 0.3, random.uniform(0.0, 100.0, num_pixels), np.NaN)
+        ascending = random.uniform(size=num_pixels) > 0.5
+        time = np.sort(random.uniform(0, 6 * DAY, num_pixels))
+        orbits = (time // 6000).astype(np.int64)
+
+        single = UTHGridder(width=72, height=36)
+        for orbit in np.unique(orbits):
+            in_orbit = orbits == orbit
+            single.add(latitude[in_orbit], longitude[in_orbit], bt[in_orbit], uth[in_orbit], ascending[in_orbit], time[in_orbit], overpass=orbit)
+        expected = single.create_dataset()
+
+        # orbits crossing midnight contribute to the days of two workers
+        temp_dir = tempfile.mkdtemp()
+        try:
+            files = []
+            for worker in range(4):
+                gridder = UTHGridder(width=72, height=36, complete_days=False)
+                for orbit in np.unique(orbits)[worker::4]:
+                    in_orbit = orbits == orbit
+                    gridder.add(latitude[in_orbit], longitude[in_orbit], bt[in_orbit], uth[in_orbit], ascending[in_orbit], time[in_orbit], overpass=orbit)
+
+                file = os.path.join(temp_dir, "worker_{}.npz".format(worker))
+                gridder.save(file)
+                files.append(file)
+
+            merged = UTHGridder.merge_files(files)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual([0, 1, 2, 3, 4, 5], merged.get_days())
+        actual = merged.create_dataset()
+        for name in ["uth_ascend", "BT_descend", "BT_full_ascend", "uth_inhomogeneity_descend", "BT_inhomogeneity_ascend", "BT_full_inhomogeneity_ascend", "observation_count_ascend",
+                     "observation_count_all_descend", "overpass_count_ascend", "time_ranges_descend"]:
+            np.testing.assert_allclose(expected[name].values, actual[name].values, rtol=1e-6, err_msg=name)
+
+    def test_merge_completed_day_in_other(self):
+        first = UTHGridder(width=36, height=18)
+        first.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([100]))
+        first.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([DAY + 100]))
+
+        second = UTHGridder(width=36, height=18, complete_days=False)
+        second.add(np.array([0.5]), np.array([0.5]), np.array([250.0]), np.array([50.0]), True, np.array([200]))
+
+        try:
+            first.merge(second)
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_merge_different_grid(self):
+        try:
+            UTHGridder(width=36, height=18).merge(UTHGridder(width=72, height=36))
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
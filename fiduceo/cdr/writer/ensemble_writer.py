@@ -0,0 +1,504 @@
+import glob
+import json
+import os
+import uuid
+import warnings
+from collections import OrderedDict
+
+import dask.array as da
+import netCDF4
+import numpy as np
+from xarray import Variable
+
+from fiduceo.cdr.writer.templates.cdr_template_factory import CDR_TemplateFactory
+from fiduceo.common.writer.atomic_writer import AtomicWriter
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+from fiduceo.common.writer.chunked_writer import ChunkedWriter, LOCK_SUFFIX
+from fiduceo.common.writer.encoding_plan import EncodingPlan
+from fiduceo.common.writer.grid_accumulator import GridAccumulator
+from fiduceo.common.writer.quantile_sketch import QuantileSketch
+from fiduceo.common.writer.templates.templateutil import TemplateUtil as tu
+
+SAMPLES_DIM = "samples"
+
+STATISTICS_SUFFIX = ".statistics"
+MEAN_SUFFIX = "_mean"
+STD_SUFFIX = "_std"
+
+# up to this number of members quantiles are computed exactly from the part file, P-square estimates are biased for small ensembles
+EXACT_QUANTILE_MEMBERS = 100
+# number of member values read at a time for exact quantiles
+QUANTILE_BLOCK_ELEMENTS = 4 * 1024 * 1024
+
+
+class EnsembleWriter:
+    """
+    Writes ensemble products member by member. The product file is created from the template with all variables
+    except the ensemble variables, i.e. the variables with a "samples" dimension, which are defined but not written.
+    The members are written one at a time, each into its own chunks, so that only one member is held in memory.
+
+    Members can be written in any order and by parallel processes: the writer can be pickled, every write opens the
+    file under an exclusive file lock and records the member in a journal. The product is written to a part file
+    which is renamed to the product file by close() once all members are written. An interrupted product is continued
+    by creating the writer again with resume=True.
+
+    Optionally, the ensemble mean, standard deviation and quantiles of every pixel are accumulated while the members
+    are written and stored as additional variables by close(), so that the members need not be read again for them.
+    Mean and standard deviation are merged exactly from the statistics checkpoints of parallel workers, see
+    save_statistics(). The journal records which writer instance wrote a member last; members not covered by the
+    statistics of that writer, e.g. written before an interruption, are read again from the part file by close().
+    Quantiles of up to EXACT_QUANTILE_MEMBERS members are computed exactly by close(), reading the members from the
+    part file block by block. Quantiles of larger ensembles are estimated with the P-square algorithm while the members
+    are written; the estimates cannot be merged, the quantiles are computed exactly unless one writer wrote all members.
+    """
+
+    def __init__(self, file, ensemble_variables, num_samples, overwrite=False, member_shapes=None, quantiles=None):
+        self.file = file
+        self.ensemble_variables = ensemble_variables
+        self.num_samples = num_samples
+        self.overwrite = overwrite
+        self.member_shapes = member_shapes
+        self.quantiles = quantiles
+
+        self._reset_statistics()
+
+    def __getstate__(self):
+        # statistics are accumulated per writer instance, copies in worker processes start empty
+        state = dict(self.__dict__)
+        for name in ("_statistics_id", "_statistics_members", "_accumulators", "_sketches"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_statistics()
+
+    @property
+    def statistics(self):
+        return self.member_shapes is not None
+
+    @staticmethod
+    def create_template(data_type, width, height, num_samples):
+        """
+        Create a template for an ensemble product without allocating the ensemble variables, these are lazy dask
+        arrays never computed. Fill the other variables, e.g. geolocation and flags, and pass the template to create().
+        :param data_type: the CDR data type, e.g. "SST_ENSEMBLE"
+        :param width: the width in pixels of the data product
+        :param height: the height in pixels of the data product
+        :param num_samples: the number of ensemble members
+        :return the template dataset
+         """
+        template_factory = CDR_TemplateFactory()
+        schema = template_factory.get_schema(data_type, width, num_samples)
+        if schema is None or height < schema.min_height:
+            dataset = template_factory.create_template(data_type, width, height, num_samples)
+            for name in EnsembleWriter.get_ensemble_variables(dataset):
+                variable = dataset.variables[name]
+                variable.data = EnsembleWriter._create_lazy_data(variable.dims, variable.shape, variable.dtype, variable.encoding, np.NaN)
+            return dataset
+
+        return schema.instantiate(height, allocator=EnsembleWriter._allocate, initialise=False)
+
+    @staticmethod
+    def create(ds, file, compression_level=None, overwrite=False, resume=False, statistics=False, quantiles=None):
+        """
+        Create the part file of an ensemble product, writing all variables except the ensemble variables.
+        :param ds: the template dataset, see create_template()
+        :param file: the product file path
+        :param compression_level: the file compression level, 0 - 9, default is 5
+        :param overwrite: set true to overwrite an existing product file when the writer is closed
+        :param resume: set true to continue an interrupted product of the same layout, the members written already are kept. Statistics of members written
+        before the interruption and not saved with save_statistics() are computed from the part file by close()
+        :param statistics: set true to store the ensemble mean and standard deviation of every ensemble variable as variables "<name>_mean" and "<name>_std"
+        :param quantiles: probabilities of ensemble quantiles to store, e.g. [0.05, 0.5, 0.95] as variables "<name>_p5", "<name>_p50" and "<name>_p95", optional.
+        For up to 100 members (EXACT_QUANTILE_MEMBERS), the quantiles are exact, computed from the part file by close(). For larger ensembles
+        written by one writer, they are estimated with the P-square algorithm, which is accurate for large ensembles only: the mean absolute error of the
+        5% and 95% quantiles is about 0.8 standard deviations for 7 members, 0.3 for 20 and 0.1 for 100
+        :return the EnsembleWriter
+         """
+        if os.path.isfile(file):
+            if overwrite is not True:
+                raise IOError("The file already exists: " + file)
+
+        ensemble_variables = EnsembleWriter.get_ensemble_variables(ds)
+        if len(ensemble_variables) == 0:
+            raise ValueError("dataset has no variables with dimension " + SAMPLES_DIM)
+
+        if quantiles is not None:
+            statistics = True
+            quantiles = [float(probability) for probability in quantiles]
+            if any(probability <= 0.0 or probability >= 1.0 for probability in quantiles):
+                raise ValueError("quantile probabilities must be within (0, 1)")
+
+        frame = ds.copy(deep=False)
+        member_shapes = None
+        if statistics is True:
+            member_shapes = OrderedDict()
+            for name in ensemble_variables:
+                statistics_variables = EnsembleWriter._create_statistics_variables(name, frame.variables[name], quantiles, ds.dims[SAMPLES_DIM] > EXACT_QUANTILE_MEMBERS)
+                member_shapes[name] = next(iter(statistics_variables.values())).shape
+                for statistics_name, statistics_variable in statistics_variables.items():
+                    frame[statistics_name] = statistics_variable
+
+        for name in ensemble_variables:
+            variable = frame.variables[name]
+            if not ChunkedTemplate.is_chunked(variable):
+                variable.data = EnsembleWriter._create_lazy_data(variable.dims, variable.shape, variable.dtype, variable.encoding, np.NaN)
+
+        writer = EnsembleWriter(file, ensemble_variables, ds.dims[SAMPLES_DIM], overwrite=overwrite, member_shapes=member_shapes, quantiles=quantiles)
+        header = EnsembleWriter._create_journal_header(frame)
+        part_file = writer.get_part_file_path()
+        if resume is True and os.path.isfile(part_file) and writer._read_journal(header) is not None:
+            return writer
+
+        writer._remove_statistics_files()
+        if compression_level is None:
+            compression_level = 5
+
+        encoding = EncodingPlan.get(frame, compression_level).get_encoding(frame)
+        EnsembleWriter._write_frame(frame, part_file, encoding)
+
+        with open(writer.get_journal_file_path(), "w") as journal:
+            journal.write(json.dumps(header) + "\n")
+
+        return writer
+
+    @staticmethod
+    def get_ensemble_variables(ds):
+        """
+        :param ds: the dataset
+        :return the names of the variables with a "samples" dimension
+         """
+        return [name for name in ds.data_vars if SAMPLES_DIM in ds.variables[name].dims]
+
+    def write_member(self, index, values):
+        """
+        Write one ensemble member. A member written before is overwritten; with statistics, every member must be written once.
+        :param index: the member index, 0 <= index < num_samples
+        :param values: the member data of the ensemble variable, an array of the variable shape without the samples dimension.
+        For products with more than one ensemble variable, a dictionary variable name -> array
+         """
+        if index < 0 or index >= self.num_samples:
+            raise ValueError("member index out of range: " + str(index))
+
+        if not isinstance(values, dict):
+            if len(self.ensemble_variables) != 1:
+                raise ValueError("values of all ensemble variables required: " + ", ".join(self.ensemble_variables))
+            values = {self.ensemble_variables[0]: values}
+
+        with self._get_lock():
+            with netCDF4.Dataset(self.get_part_file_path(), "a") as dataset:
+                for name, data in values.items():
+                    if name not in self.ensemble_variables:
+                        raise ValueError("not an ensemble variable: " + name)
+
+                    variable = dataset.variables[name]
+                    sample_axis = variable.dimensions.index(SAMPLES_DIM)
+                    member_shape = variable.shape[:sample_axis] + variable.shape[sample_axis + 1:]
+                    data = np.asarray(data)
+                    if data.shape != member_shape:
+                        raise ValueError("member data of " + name + " has shape " + str(data.shape) + ", expected " + str(member_shape))
+
+                    region = [slice(None)] * len(variable.shape)
+                    region[sample_axis] = index
+                    variable[tuple(region)] = data
+
+            with open(self.get_journal_file_path(), "a") as journal:
+                journal.write(json.dumps({"member": int(index), "writer": self._statistics_id}) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+        if self.statistics:
+            self._add_statistics(index, values)
+
+    def save_statistics(self):
+        """
+        Write the statistics of the members written by this writer instance to a checkpoint next to the product and
+        reset them. Parallel workers call this after writing their members, close() merges the checkpoints.
+         """
+        if not self.statistics or len(self._statistics_members) == 0:
+            return
+
+        arrays = {"writer": np.array(self._statistics_id), "members": np.array(self._statistics_members, np.int64)}
+        for name in self.ensemble_variables:
+            arrays.update(self._accumulators[name].to_arrays(prefix=name + ".accumulator."))
+            if self._sketches is not None:
+                arrays.update(self._sketches[name].to_arrays(prefix=name + ".sketch."))
+
+        GridAccumulator.save_arrays(self.file + STATISTICS_SUFFIX + "." + self._statistics_id + ".npz", arrays)
+        self._reset_statistics()
+
+    def get_written_members(self):
+        """
+        :return the sorted list of the indices of the members written
+         """
+        writers = self._read_journal()
+        if writers is None:
+            return []
+        return sorted(writers)
+
+    def close(self, allow_missing=False):
+        """
+        Complete the product: the part file is renamed to the product file.
+        :param allow_missing: set true to complete a product with members not written, these contain fill values
+         """
+        if os.path.isfile(self.file) and self.overwrite is not True:
+            raise IOError("The file already exists: " + self.file)
+
+        if allow_missing is not True:
+            missing = sorted(set(range(self.num_samples)).difference(self.get_written_members()))
+            if len(missing) > 0:
+                raise ValueError("members not written: " + ", ".join(str(index) for index in missing))
+
+        if self.statistics:
+            self._write_statistics()
+
+        AtomicWriter.commit(self.get_part_file_path(), self.file)
+        EnsembleWriter._remove_if_exists(self.get_journal_file_path())
+        EnsembleWriter._remove_if_exists(self.file + LOCK_SUFFIX)
+        self._remove_statistics_files()
+
+    def discard(self):
+        """
+        Delete the part file, the journal and the statistics checkpoints without completing the product.
+         """
+        EnsembleWriter._remove_if_exists(self.get_part_file_path())
+        EnsembleWriter._remove_if_exists(self.get_journal_file_path())
+        EnsembleWriter._remove_if_exists(self.file + LOCK_SUFFIX)
+        self._remove_statistics_files()
+
+    def get_part_file_path(self):
+        return AtomicWriter.get_part_file_path(self.file)
+
+    def get_journal_file_path(self):
+        return AtomicWriter.get_journal_file_path(self.file)
+
+    @staticmethod
+    def get_statistics_names(name, quantiles=None):
+        """
+        Get the names of the statistics variables of an ensemble variable.
+        :param name: the ensemble variable name
+        :param quantiles: the quantile probabilities, optional
+        :return list of variable names: mean, standard deviation and the quantiles in the order of the probabilities
+         """
+        names = [name + MEAN_SUFFIX, name + STD_SUFFIX]
+        if quantiles is not None:
+            names.extend(name + "_p" + "{:g}".format(probability * 100.0).replace(".", "_") for probability in quantiles)
+        return names
+
+    def _reset_statistics(self):
+        # identifies the statistics of the members written from now on in the journal and the checkpoint
+        self._statistics_id = uuid.uuid4().hex[:12]
+        self._statistics_members = []
+        self._accumulators = None
+        self._sketches = None
+
+    def _add_statistics(self, index, values):
+        if self._accumulators is None:
+            self._accumulators = dict((name, GridAccumulator(shape)) for name, shape in self.member_shapes.items())
+            if self._estimates_quantiles():
+                self._sketches = dict((name, QuantileSketch(shape, self.quantiles)) for name, shape in self.member_shapes.items())
+
+        for name, data in values.items():
+            self._accumulators[name].add_grid(data)
+            if self._sketches is not None:
+                self._sketches[name].add_grid(data)
+        self._statistics_members.append(int(index))
+
+    def _write_statistics(self):
+        writers = self._read_journal()
+        if writers is None:
+            writers = dict()
+
+        # merged into new accumulators, the statistics of this writer are kept if closing fails
+        accumulators = dict((name, GridAccumulator(shape)) for name, shape in self.member_shapes.items())
+        covered = set()
+        sketches = None
+        num_sources = 0
+        for writer_id, members, source_accumulators, source_sketches in self._get_statistics_sources():
+            # statistics of members written again later by another writer, or twice by this one, cannot be taken apart
+            if len(set(members)) != len(members) or any(writers.get(index) != writer_id for index in members):
+                continue
+
+            for name in self.ensemble_variables:
+                accumulators[name].merge(source_accumulators[name])
+            covered.update(members)
+            sketches = source_sketches
+            num_sources += 1
+
+        uncovered = set(writers).difference(covered)
+        exact_quantiles = self.quantiles is not None and (not self._estimates_quantiles() or num_sources != 1 or len(uncovered) > 0)
+
+        with self._get_lock():
+            with netCDF4.Dataset(self.get_part_file_path(), "a") as dataset:
+                for index in sorted(uncovered):
+                    for name in self.ensemble_variables:
+                        accumulators[name].add_grid(EnsembleWriter._read_member(dataset.variables[name], index))
+
+                if len(writers) == 0:
+                    return
+
+                for name in self.ensemble_variables:
+                    names = EnsembleWriter.get_statistics_names(name, self.quantiles)
+                    dataset.variables[names[0]][:] = accumulators[name].get_mean()
+                    dataset.variables[names[1]][:] = accumulators[name].get_standard_deviation()
+                    if exact_quantiles:
+                        self._write_exact_quantiles(dataset, name, names[2:])
+                    elif sketches is not None:
+                        for quantile_name, quantile in zip(names[2:], sketches[name].get_quantiles()):
+                            dataset.variables[quantile_name][:] = quantile
+
+    def _estimates_quantiles(self):
+        return self.quantiles is not None and self.num_samples > EXACT_QUANTILE_MEMBERS
+
+    def _write_exact_quantiles(self, dataset, name, quantile_names):
+        variable = dataset.variables[name]
+        sample_axis = variable.dimensions.index(SAMPLES_DIM)
+        member_axes = [axis for axis in range(len(variable.shape)) if axis != sample_axis]
+
+        # the pixels are processed in blocks along the first member dimension, with the values of all members
+        block_axis = member_axes[0] if len(member_axes) > 0 else sample_axis
+        size = variable.shape[block_axis] if len(member_axes) > 0 else 1
+        block_elements = int(np.prod(variable.shape, dtype=np.int64)) // max(1, size)
+        block_size = max(1, QUANTILE_BLOCK_ELEMENTS // max(1, block_elements))
+
+        for start in range(0, size, block_size):
+            region = [slice(None)] * len(variable.shape)
+            if len(member_axes) > 0:
+                region[block_axis] = slice(start, start + block_size)
+            data = np.ma.filled(np.ma.asarray(variable[tuple(region)], np.float64), np.NaN)
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # pixels without valid members
+                quantiles = np.nanquantile(data, self.quantiles, axis=sample_axis)
+
+            del region[sample_axis]
+            for quantile_name, quantile in zip(quantile_names, quantiles):
+                dataset.variables[quantile_name][tuple(region)] = quantile
+
+        for quantile_name, probability in zip(quantile_names, self.quantiles):
+            dataset.variables[quantile_name].setncattr("description", EnsembleWriter._get_quantile_description(name, probability, False))
+
+    def _get_statistics_sources(self):
+        if self._accumulators is not None:
+            yield self._statistics_id, self._statistics_members, self._accumulators, self._sketches
+
+        for file in self._get_statistics_files():
+            with np.load(file) as arrays:
+                GridAccumulator.check_version(arrays, file)
+
+                accumulators = dict((name, GridAccumulator.from_arrays(arrays, prefix=name + ".accumulator.")) for name in self.ensemble_variables)
+                sketches = None
+                if self._estimates_quantiles():
+                    sketches = dict((name, QuantileSketch.from_arrays(arrays, prefix=name + ".sketch.")) for name in self.ensemble_variables)
+                yield str(arrays["writer"]), arrays["members"].tolist(), accumulators, sketches
+
+    @staticmethod
+    def _read_member(variable, index):
+        region = [slice(None)] * len(variable.shape)
+        region[variable.dimensions.index(SAMPLES_DIM)] = index
+        return np.ma.filled(np.ma.asarray(variable[tuple(region)], np.float64), np.NaN)
+
+    def _get_statistics_files(self):
+        return sorted(glob.glob(glob.escape(self.file + STATISTICS_SUFFIX) + ".*.npz"))
+
+    def _remove_statistics_files(self):
+        for file in self._get_statistics_files():
+            EnsembleWriter._remove_if_exists(file)
+
+    @staticmethod
+    def _get_quantile_description(name, probability, estimated):
+        description = "Ensemble quantile " + "{:g}".format(probability) + " of " + name
+        if estimated:
+            return description + ", P-square estimate"
+        return description
+
+    @staticmethod
+    def _create_statistics_variables(name, variable, quantiles, estimated):
+        sample_axis = variable.dims.index(SAMPLES_DIM)
+        dims = variable.dims[:sample_axis] + variable.dims[sample_axis + 1:]
+        shape = variable.shape[:sample_axis] + variable.shape[sample_axis + 1:]
+
+        encoding = dict()
+        chunk_sizes = variable.encoding.get("chunksizes")
+        if chunk_sizes is not None:
+            encoding["chunksizes"] = tuple(chunk_sizes[:sample_axis]) + tuple(chunk_sizes[sample_axis + 1:])
+
+        descriptions = ["Ensemble mean of " + name, "Ensemble standard deviation of " + name]
+        if quantiles is not None:
+            descriptions.extend(EnsembleWriter._get_quantile_description(name, probability, estimated) for probability in quantiles)
+
+        statistics_variables = OrderedDict()
+        for statistics_name, description in zip(EnsembleWriter.get_statistics_names(name, quantiles), descriptions):
+            statistics_variable = Variable(dims, EnsembleWriter._create_lazy_data(dims, shape, np.float32, encoding, np.NaN))
+            tu.add_fill_value(statistics_variable, np.NaN)
+            statistics_variable.attrs["description"] = description
+            for attribute in ("units", "coordinates"):
+                if attribute in variable.attrs:
+                    statistics_variable.attrs[attribute] = variable.attrs[attribute]
+            statistics_variable.encoding = dict(encoding)
+            statistics_variables[statistics_name] = statistics_variable
+        return statistics_variables
+
+    def _get_lock(self):
+        return ChunkedWriter.get_process_lock(self.file + LOCK_SUFFIX)
+
+    def _read_journal(self, header=None):
+        journal_file = self.get_journal_file_path()
+        if not os.path.isfile(journal_file):
+            return None
+
+        with open(journal_file, "r") as journal:
+            lines = journal.readlines()
+
+        if len(lines) == 0:
+            return None
+
+        try:
+            if header is not None and json.loads(lines[0]) != header:
+                return None  # journal belongs to a different product layout - start from scratch
+        except ValueError:
+            return None
+
+        # member index -> the writer instance that wrote it last
+        writers = dict()
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+                writers[entry["member"]] = entry.get("writer")
+            except (ValueError, KeyError):
+                break  # incomplete last line of an interrupted write
+        return writers
+
+    @staticmethod
+    def _create_journal_header(ds):
+        dimensions = dict((str(name), int(size)) for name, size in ds.dims.items())
+        return {"dimensions": dimensions, "variables": [str(name) for name in ds.data_vars], "ensemble_variables": EnsembleWriter.get_ensemble_variables(ds)}
+
+    @staticmethod
+    def _write_frame(frame, part_file, encoding):
+        # numpy variables are written immediately, the lazy ensemble variables are only defined
+        ChunkedWriter.set_up_file(frame, part_file, encoding)
+
+    @staticmethod
+    def _allocate(variable_schema, shape):
+        if SAMPLES_DIM in variable_schema.dims:
+            return EnsembleWriter._create_lazy_data(variable_schema.dims, shape, variable_schema.dtype, variable_schema.encoding, variable_schema.value)
+
+        data = np.empty(shape, variable_schema.dtype)
+        variable_schema.initialise(data)
+        return data
+
+    @staticmethod
+    def _create_lazy_data(dims, shape, dtype, encoding, fill_value):
+        chunk_sizes = encoding.get("chunksizes")
+        if chunk_sizes is None:
+            chunks = tuple(1 if dim == SAMPLES_DIM else size for dim, size in zip(dims, shape))
+        else:
+            chunks = ChunkedTemplate.get_chunks(chunk_sizes, shape)
+        return da.full(shape, fill_value, dtype=dtype, chunks=chunks)
+
+    @staticmethod
+    def _remove_if_exists(file):
+        if os.path.isfile(file):
+            os.remove(file)
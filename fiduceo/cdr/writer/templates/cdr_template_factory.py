@@ -1,8 +1,16 @@
+import xarray as xr
+
 from fiduceo.cdr.writer.templates.albedo import Albedo
 from fiduceo.cdr.writer.templates.aot import AOT
 from fiduceo.cdr.writer.templates.sst import SST
 from fiduceo.cdr.writer.templates.sst_ensemble import SST_ENSEMBLE
 from fiduceo.cdr.writer.templates.uth import UTH
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+from fiduceo.common.writer.disk_template import DiskTemplate
+from fiduceo.common.writer.packed_data import PackedData
+from fiduceo.common.writer.shared_template import SharedTemplate
+from fiduceo.common.writer.template_schema import TemplateSchema
+from fiduceo.common.writer.writer_utils import WriterUtils
 
 
 class CDR_TemplateFactory:
@@ -12,3 +20,73 @@ class CDR_TemplateFactory:
 
     def get_cdr_template(self, name):
         return self.templates[name]
+
+    def get_schema(self, name, width, num_samples=None, packed=False):
+        """
+        Get the schema of a product, the layout is known without allocating a template.
+        :param name: the CDR data type
+        :param width: the width in pixels of the data product
+        :param num_samples: the number of samples, for data types having a sample dimension
+        :param packed: set true to hold scaled variables in their packed integer data type, see PackedData
+        :return the schema, None if the template cannot be represented by a schema
+         """
+        key, build_function = self._get_template_builder(name, width, num_samples, packed)
+        return TemplateSchema.get(key, build_function)
+
+    def create_template(self, name, width, height, num_samples=None, shared_memory=False, pool=None, packed=False, chunked=False, disk_file=None, write_function=None):
+        """
+        Create a template dataset.
+        :param name: the CDR data type
+        :param width: the width in pixels of the data product
+        :param height: the height in pixels of the data product
+        :param num_samples: the number of samples, for data types having a sample dimension
+        :param shared_memory: set true to allocate the template data in one shared memory block
+        :param pool: TemplatePool to take the template from, optional
+        :param packed: set true to hold scaled variables in their packed integer data type, see PackedData
+        :param chunked: set true to hold chunked variables in dask arrays, see ChunkedTemplate
+        :param disk_file: the product file path, if set the template data is memory mapped from a scratch file next to it, see DiskTemplate
+        :param write_function: the function writing the product when a disk backed template is closed
+        :return the template dataset, a SharedTemplate if shared_memory is set, a DiskTemplate if disk_file is set
+         """
+        key, build_function = self._get_template_builder(name, width, num_samples, packed)
+        if disk_file is not None:
+            if chunked is True or shared_memory is True or pool is not None:
+                raise ValueError("disk backed templates cannot be chunked, shared or pooled")
+            return DiskTemplate.create(key, build_function, height, disk_file, write_function)
+
+        if chunked is True:
+            if shared_memory is True or pool is not None:
+                raise ValueError("chunked templates cannot be shared or pooled")
+            return ChunkedTemplate.create(key, build_function, height)
+
+        if shared_memory is True:
+            if pool is not None:
+                raise ValueError("shared memory templates cannot be pooled")
+            return SharedTemplate.create(key, build_function, height)
+
+        if pool is not None:
+            return pool.acquire(key, build_function, height)
+
+        return TemplateSchema.create(key, build_function, height)
+
+    def _get_template_builder(self, name, width, num_samples, packed):
+        cdr_template = self.get_cdr_template(name)
+        key = ("CDR", name, width, num_samples)
+        build_function = lambda height: CDR_TemplateFactory._build_template(cdr_template, width, height, num_samples)
+
+        if packed is True:
+            return PackedData.wrap_builder(key, build_function)
+        return key, build_function
+
+    @staticmethod
+    def _build_template(cdr_template, width, height, num_samples):
+        dataset = xr.Dataset()
+        WriterUtils.add_standard_global_attributes(dataset)
+        WriterUtils.add_cdr_global_attributes(dataset)
+
+        if num_samples is None:
+            cdr_template.add_variables(dataset, width, height)
+        else:
+            cdr_template.add_variables(dataset, width, height, num_samples)
+
+        return dataset
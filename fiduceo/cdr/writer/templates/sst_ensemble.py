@@ -25,6 +25,8 @@ class SST_ENSEMBLE:
         default_array = DefaultData.create_default_array_3d(width, height, num_samples, np.float32, fill_value=np.NaN)
         variable = Variable(["samples","y", "x"], default_array)
         tu.add_fill_value(variable, np.NaN)
+        # one member per chunk, members are written and read independently
+        tu.add_chunking(variable, (1,) + CHUNKING)
         variable.attrs["standard_name"] = "sea_surface_temperature"
         variable.attrs["units"] = "K"
         variable.attrs["coordinates"] = "longitude latitude"
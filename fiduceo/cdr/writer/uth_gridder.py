@@ -0,0 +1,383 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from fiduceo.cdr.writer.cdr_writer import CDRWriter
+from fiduceo.common.writer.grid_accumulator import GridAccumulator
+
+ASCEND = 0
+DESCEND = 1
+NODE_SUFFIXES = ("_ascend", "_descend")
+
+# quantities averaged per day first, the monthly values are the mean and standard deviation of the daily means
+UTH = "uth"
+BT = "BT"
+BT_FULL = "BT_full"
+DAILY_QUANTITIES = (UTH, BT, BT_FULL)
+
+SECONDS_PER_DAY = 86400
+
+MAX_OBSERVATION_COUNT = np.iinfo(np.int16).max
+MAX_OVERPASS_COUNT = np.iinfo(np.uint8).max - 1
+
+
+class UTHGridder:
+    """
+    Streaming gridder for UTH CDRs: swath data of HIRS, AMSU-B or MHS is added block by block and accumulated on a
+    regular global grid, separately for ascending and descending nodes. Pixels are binned with numpy.bincount() on
+    flat cell indices, the memory used is bounded by the grid size and independent of the number of swaths, so that
+    a month of orbits is gridded in one pass.
+
+    Daily statistics are kept for the days in progress only. A day is completed as soon as a block of a later day is
+    added; its means are accumulated into the monthly GridAccumulators of daily means. Swaths must therefore be added
+    in time order. The grid rows run from south to north, the columns from 180 degrees west to east.
+
+    A month can be gridded in parallel: every worker grids a part of the swaths with complete_days=False and saves a
+    checkpoint, merge_files() combines the checkpoints exactly. The swaths of one overpass must be gridded by one worker.
+    """
+
+    def __init__(self, width=360, height=180, complete_days=True):
+        """
+        :param width: the number of grid columns, covering 360 degrees of longitude
+        :param height: the number of grid rows, covering 180 degrees of latitude
+        :param complete_days: set false for workers gridding a part of the swaths in parallel: days are kept in progress until
+        the gridder is merged and filled, as other workers may contribute to the same days
+         """
+        self.width = width
+        self.height = height
+        self.complete_days = complete_days
+        self._lat_step = 180.0 / height
+        self._lon_step = 360.0 / width
+
+        self._num_cells = width * height
+        size = 2 * self._num_cells
+        self._shape = (2, height, width)
+
+        self._open_days = OrderedDict()
+        self._completed_days = set()
+
+        self._daily_means = dict((quantity, GridAccumulator(self._shape)) for quantity in DAILY_QUANTITIES)
+        self._bt_full = GridAccumulator(self._shape)
+
+        self._observation_counts = np.zeros(size, np.int64)
+        self._observation_counts_all = np.zeros(size, np.int64)
+
+        # index of the next overpass, identifiers of named overpasses -> their index
+        self._num_overpasses = 0
+        self._overpass_ids = dict()
+        self._overpass_counts = np.zeros(size, np.int32)
+        self._last_overpass = np.full(size, -1, np.int64)
+
+        self._time_min = np.full(size, SECONDS_PER_DAY, np.int32)
+        self._time_max = np.full(size, -1, np.int32)
+
+    def add(self, latitude, longitude, bt, uth, ascending, time, overpass=None):
+        """
+        Add a block of swath pixels. All arrays must have the same shape, or be broadcastable to the shape of latitude.
+        :param latitude: the pixel latitudes in degrees north
+        :param longitude: the pixel longitudes in degrees east
+        :param bt: the brightness temperatures in K of all pixels including cloudy ones, NaN where invalid
+        :param uth: the UTH retrievals in %, NaN where filtered. The brightness temperatures of these pixels are the BT_* averages
+        :param ascending: true for pixels of ascending nodes, a scalar or array
+        :param time: the acquisition time as datetime64 or seconds since 1970-01-01, a scalar or array
+        :param overpass: hashable identifier of the overpass, e.g. the orbit number; blocks of the same overpass are counted once per grid cell. If None, every block is an overpass
+         """
+        latitude = np.asarray(latitude, np.float64).ravel()
+        shape = latitude.shape
+        longitude = np.broadcast_to(np.asarray(longitude, np.float64).ravel(), shape)
+        bt = np.broadcast_to(np.asarray(bt, np.float64).ravel(), shape)
+        uth = np.broadcast_to(np.asarray(uth, np.float64).ravel(), shape)
+        ascending = np.broadcast_to(np.asarray(ascending, bool).ravel(), shape)
+        seconds = np.broadcast_to(UTHGridder._to_seconds(time).ravel(), shape)
+
+        valid = np.isfinite(latitude) & np.isfinite(longitude) & (np.abs(latitude) <= 90.0) & (seconds != np.iinfo(np.int64).min)
+        if not np.any(valid):
+            return
+
+        cells = self.get_cell_indices(latitude[valid], longitude[valid])
+        cells += np.where(ascending[valid], ASCEND, DESCEND) * self._num_cells
+        bt = bt[valid]
+        uth = uth[valid]
+        seconds = seconds[valid]
+
+        days = seconds // SECONDS_PER_DAY
+        unique_days = np.unique(days)
+        if any(int(day) in self._completed_days for day in unique_days):
+            raise ValueError("swath data of a completed day added, swaths must be added in time order")
+
+        if self.complete_days:
+            # all earlier days are complete now
+            for day in [day for day in self._open_days if day < unique_days[0]]:
+                self._complete_day(day)
+
+        size = 2 * self._num_cells
+        self._observation_counts_all += np.bincount(cells, minlength=size)
+
+        bt_valid = np.isfinite(bt)
+        uth_valid = bt_valid & np.isfinite(uth)
+        self._observation_counts += np.bincount(cells[uth_valid], minlength=size)
+
+        bt_cells = cells[bt_valid]
+        self._bt_full.add(bt_cells, bt[bt_valid])
+
+        seconds_of_day = (seconds[bt_valid] - days[bt_valid] * SECONDS_PER_DAY).astype(np.int32)
+        np.minimum.at(self._time_min, bt_cells, seconds_of_day)
+        np.maximum.at(self._time_max, bt_cells, seconds_of_day)
+
+        for day in unique_days:
+            in_day = days == day
+            daily = self._get_daily_grids(int(day))
+            daily[UTH].add(cells[in_day & uth_valid], uth[in_day & uth_valid])
+            daily[BT].add(cells[in_day & uth_valid], bt[in_day & uth_valid])
+            daily[BT_FULL].add(cells[in_day & bt_valid], bt[in_day & bt_valid])
+
+        self._count_overpass(cells, overpass)
+
+    def get_cell_indices(self, latitude, longitude):
+        """
+        Get the flat grid cell indices, row * width + column, of geolocated pixels.
+        :param latitude: the latitudes in degrees north, within [-90, 90]
+        :param longitude: the longitudes in degrees east
+        :return the cell indices, int64
+         """
+        rows = np.floor((np.asarray(latitude) + 90.0) / self._lat_step).astype(np.int64)
+        np.clip(rows, 0, self.height - 1, out=rows)
+
+        columns = np.floor(np.mod(np.asarray(longitude) + 180.0, 360.0) / self._lon_step).astype(np.int64)
+        np.clip(columns, 0, self.width - 1, out=columns)
+
+        return rows * self.width + columns
+
+    def fill(self, dataset):
+        """
+        Complete all days in progress and write the gridded values to a UTH template. Uncertainty variables and the
+        quality bitmask are not modified. Cells without observations keep the fill values, except the counts which are zero.
+        :param dataset: the UTH template dataset of the width and height of the grid
+        :return the dataset
+         """
+        if dataset.dims["x"] != self.width or dataset.dims["y"] != self.height:
+            raise ValueError("template dimensions do not match the grid")
+
+        for day in list(self._open_days):
+            self._complete_day(day)
+
+        self._fill_geolocation(dataset)
+
+        shape = (self.height, self.width)
+        for node, suffix in enumerate(NODE_SUFFIXES):
+            node_cells = slice(node * self._num_cells, (node + 1) * self._num_cells)
+
+            dataset["observation_count" + suffix].data[:] = np.minimum(self._observation_counts[node_cells], MAX_OBSERVATION_COUNT).reshape(shape)
+            dataset["observation_count_all" + suffix].data[:] = np.minimum(self._observation_counts_all[node_cells], MAX_OBSERVATION_COUNT).reshape(shape)
+            dataset["overpass_count" + suffix].data[:] = np.minimum(self._overpass_counts[node_cells], MAX_OVERPASS_COUNT).reshape(shape)
+
+            for quantity in DAILY_QUANTITIES:
+                daily_means = self._daily_means[quantity]
+                dataset[quantity + suffix].data[:] = daily_means.get_mean()[node]
+                if quantity != BT_FULL:
+                    dataset[quantity + "_inhomogeneity" + suffix].data[:] = daily_means.get_standard_deviation()[node]
+
+            # the BT_full inhomogeneity is the standard deviation of all brightness temperatures, not of the daily means
+            dataset["BT_full_inhomogeneity" + suffix].data[:] = self._bt_full.get_standard_deviation()[node]
+
+            time_ranges = dataset["time_ranges" + suffix].data
+            observed = (self._time_max[node_cells] >= 0).reshape(shape)
+            time_ranges[0][observed] = self._time_min[node_cells].reshape(shape)[observed]
+            time_ranges[1][observed] = self._time_max[node_cells].reshape(shape)[observed]
+
+        return dataset
+
+    def create_dataset(self):
+        """
+        Create a UTH template of the grid size and fill it with the gridded values, see fill().
+        :return the dataset
+         """
+        return self.fill(CDRWriter.createTemplate("UTH", self.width, self.height))
+
+    def merge(self, other):
+        """
+        Add everything gridded by another gridder of the same grid, e.g. of a parallel worker. Days in progress in both
+        gridders are combined, a day completed in one of them must not have data in the other one. Overpasses of the other
+        gridder are carried over, blocks added afterwards continue them, cells touched by both gridders keep the last
+        overpass of the other one.
+        :param other: the UTHGridder
+        :return this gridder
+         """
+        if other.width != self.width or other.height != self.height:
+            raise ValueError("gridders of different grid sizes cannot be merged")
+
+        own_days = self._completed_days.union(self._open_days)
+        other_days = other._completed_days.union(other._open_days)
+        if self._completed_days.intersection(other_days) or other._completed_days.intersection(own_days):
+            raise ValueError("a day completed in one gridder has data in the other, grid in parallel with complete_days=False")
+
+        for day, other_daily in other._open_days.items():
+            daily = self._get_daily_grids(day)
+            for quantity in DAILY_QUANTITIES:
+                daily[quantity].merge(other_daily[quantity])
+        self._open_days = OrderedDict(sorted(self._open_days.items()))
+        self._completed_days.update(other._completed_days)
+
+        for quantity in DAILY_QUANTITIES:
+            self._daily_means[quantity].merge(other._daily_means[quantity])
+        self._bt_full.merge(other._bt_full)
+
+        self._observation_counts += other._observation_counts
+        self._observation_counts_all += other._observation_counts_all
+        self._overpass_counts += other._overpass_counts
+        self._merge_overpasses(other)
+        np.minimum(self._time_min, other._time_min, out=self._time_min)
+        np.maximum(self._time_max, other._time_max, out=self._time_max)
+        return self
+
+    def get_days(self):
+        """
+        :return the sorted list of days in progress and completed, as days since 1970-01-01
+         """
+        return sorted(self._completed_days.union(self._open_days))
+
+    def save(self, file):
+        """
+        Write a checkpoint of the gridder, see GridAccumulator.save(). Days in progress are stored as they are. The
+        identifiers of the overpasses are not stored, blocks of an overpass added after restoring count as a new overpass.
+        :param file: the checkpoint file path, conventionally ending with ".npz"
+         """
+        arrays = dict()
+        arrays["grid_size"] = np.array([self.width, self.height], np.int64)
+        arrays["complete_days"] = np.array(self.complete_days)
+        arrays["completed_days"] = np.array(sorted(self._completed_days), np.int64)
+        arrays["open_days"] = np.array(list(self._open_days), np.int64)
+
+        for day, daily in self._open_days.items():
+            for quantity in DAILY_QUANTITIES:
+                arrays.update(daily[quantity].to_arrays(prefix="day_{}.{}.".format(day, quantity)))
+        for quantity in DAILY_QUANTITIES:
+            arrays.update(self._daily_means[quantity].to_arrays(prefix="daily_means." + quantity + "."))
+        arrays.update(self._bt_full.to_arrays(prefix="BT_full."))
+
+        arrays["observation_counts"] = self._observation_counts
+        arrays["observation_counts_all"] = self._observation_counts_all
+        arrays["overpass_counts"] = self._overpass_counts
+        arrays["time_min"] = self._time_min
+        arrays["time_max"] = self._time_max
+
+        GridAccumulator.save_arrays(file, arrays)
+
+    @staticmethod
+    def load(file):
+        """
+        Read a checkpoint written by save().
+        :param file: the checkpoint file path
+        :return the UTHGridder
+         """
+        with np.load(file) as arrays:
+            GridAccumulator.check_version(arrays, file)
+
+            width, height = arrays["grid_size"].tolist()
+            gridder = UTHGridder(width=width, height=height, complete_days=bool(arrays["complete_days"]))
+            gridder._completed_days.update(arrays["completed_days"].tolist())
+
+            for day in arrays["open_days"].tolist():
+                gridder._open_days[day] = dict((quantity, GridAccumulator.from_arrays(arrays, prefix="day_{}.{}.".format(day, quantity))) for quantity in DAILY_QUANTITIES)
+            for quantity in DAILY_QUANTITIES:
+                gridder._daily_means[quantity] = GridAccumulator.from_arrays(arrays, prefix="daily_means." + quantity + ".")
+            gridder._bt_full = GridAccumulator.from_arrays(arrays, prefix="BT_full.")
+
+            gridder._observation_counts[:] = arrays["observation_counts"]
+            gridder._observation_counts_all[:] = arrays["observation_counts_all"]
+            gridder._overpass_counts[:] = arrays["overpass_counts"]
+            gridder._time_min[:] = arrays["time_min"]
+            gridder._time_max[:] = arrays["time_max"]
+
+        return gridder
+
+    @staticmethod
+    def merge_files(files):
+        """
+        Merge the checkpoints of parallel workers. A day is completed as soon as the last checkpoint containing it is
+        merged, so that only the days spanned by neighbouring checkpoints are held in memory.
+        :param files: the checkpoint file paths, preferably in time order
+        :return the merged UTHGridder, fill it or write a checkpoint
+         """
+        files = list(files)
+        if len(files) == 0:
+            raise ValueError("no checkpoint files to merge")
+
+        last_file_index = dict()
+        for index, file in enumerate(files):
+            with np.load(file) as arrays:
+                GridAccumulator.check_version(arrays, file)
+                for day in arrays["open_days"].tolist():
+                    last_file_index[day] = index
+
+        merged = None
+        for index, file in enumerate(files):
+            gridder = UTHGridder.load(file)
+            if merged is None:
+                merged = gridder
+            else:
+                merged.merge(gridder)
+
+            for day in [day for day in merged._open_days if last_file_index[day] <= index]:
+                merged._complete_day(day)
+
+        merged.complete_days = True
+        return merged
+
+    def _get_daily_grids(self, day):
+        daily = self._open_days.get(day)
+        if daily is None:
+            daily = dict((quantity, GridAccumulator(self._shape)) for quantity in DAILY_QUANTITIES)
+            self._open_days[day] = daily
+        return daily
+
+    def _complete_day(self, day):
+        daily = self._open_days.pop(day)
+        for quantity in DAILY_QUANTITIES:
+            self._daily_means[quantity].add_grid(daily[quantity].get_mean())
+
+        self._completed_days.add(day)
+
+    def _count_overpass(self, cells, overpass):
+        # anonymous overpasses are not recorded, they cannot be continued
+        overpass_index = self._num_overpasses
+        if overpass is not None:
+            overpass_index = self._overpass_ids.setdefault(overpass, overpass_index)
+        if overpass_index == self._num_overpasses:
+            self._num_overpasses += 1
+
+        touched = np.unique(cells)
+        new_cells = touched[self._last_overpass[touched] != overpass_index]
+        self._overpass_counts[new_cells] += 1
+        self._last_overpass[new_cells] = overpass_index
+
+    def _merge_overpasses(self, other):
+        # the overpasses of the other gridder are appended to the own ones, named overpasses of both keep the own index
+        indices = np.arange(other._num_overpasses, dtype=np.int64) + self._num_overpasses
+        for overpass, other_index in other._overpass_ids.items():
+            indices[other_index] = self._overpass_ids.setdefault(overpass, int(indices[other_index]))
+        self._num_overpasses += other._num_overpasses
+
+        touched = other._last_overpass >= 0
+        self._last_overpass[touched] = indices[other._last_overpass[touched]]
+
+    def _fill_geolocation(self, dataset):
+        lat_bounds = np.linspace(-90.0, 90.0, self.height + 1)
+        dataset["lat"].data[:] = (lat_bounds[:-1] + lat_bounds[1:]) * 0.5
+        dataset["lat_bnds"].data[:, 0] = lat_bounds[:-1]
+        dataset["lat_bnds"].data[:, 1] = lat_bounds[1:]
+
+        lon_bounds = np.linspace(-180.0, 180.0, self.width + 1)
+        dataset["lon"].data[:] = (lon_bounds[:-1] + lon_bounds[1:]) * 0.5
+        dataset["lon_bnds"].data[:, 0] = lon_bounds[:-1]
+        dataset["lon_bnds"].data[:, 1] = lon_bounds[1:]
+
+    @staticmethod
+    def _to_seconds(time):
+        time = np.asarray(time)
+        if np.issubdtype(time.dtype, np.datetime64):
+            # NaT is converted to the minimal int64 value
+            return time.astype("datetime64[s]").astype(np.int64)
+
+        seconds = np.floor(time.astype(np.float64))
+        return np.where(np.isfinite(seconds), seconds, np.iinfo(np.int64).min).astype(np.int64)
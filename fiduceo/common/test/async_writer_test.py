@@ -0,0 +1,185 @@
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from fiduceo.common.writer.async_writer import AsyncWriter, DefaultAsyncWriter
+
+
+class RecordingWriter:
+
+    def __init__(self):
+        self.written = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, ds, file, suffix=""):
+        self.release.wait(5)
+        if ds is None:
+            raise IOError("nothing to write")
+        self.written.append(file + suffix)
+
+
+# writes with a thread pool, as dask and the statistics do, and flushes before exiting
+FLUSHING_SCRIPT = """
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from fiduceo.common.writer.async_writer import DefaultAsyncWriter
+
+def write(ds, file):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        content = executor.submit(str, ds).result()
+    with open(file, "w") as target:
+        target.write(content)
+
+DefaultAsyncWriter.get(write).submit("dataset", sys.argv[1])
+DefaultAsyncWriter.get(write).flush()
+"""
+
+# writes after a delay, so that the writes are pending at exit
+EXITING_SCRIPT = """
+import sys, time
+from fiduceo.common.writer.async_writer import DefaultAsyncWriter
+
+def write(ds, file):
+    time.sleep(0.2)
+    if ds is None:
+        raise IOError("nothing to write")
+    with open(file, "w") as target:
+        target.write(ds)
+
+DefaultAsyncWriter.get(write).submit("dataset", sys.argv[1])
+DefaultAsyncWriter.get(write).submit(None, sys.argv[1] + ".failed")
+"""
+
+
+class SlowQueue(queue.Queue):
+
+    def __init__(self):
+        queue.Queue.__init__(self)
+        self.putting = threading.Event()
+
+    def put(self, item, block=True, timeout=None):
+        if item is not None:
+            self.putting.set()
+            time.sleep(0.2)
+        queue.Queue.put(self, item, block, timeout)
+
+
+class SlowAsyncWriter(AsyncWriter):
+
+    def __setattr__(self, name, value):
+        if name == "_queue":
+            value = SlowQueue()
+        AsyncWriter.__setattr__(self, name, value)
+
+
+class AsyncWriterTest(unittest.TestCase):
+
+    def test_submit_and_flush(self):
+        recorder = RecordingWriter()
+        writer = AsyncWriter(recorder.write)
+        try:
+            futures = [writer.submit("dataset", "file_" + str(i), suffix=".nc") for i in range(0, 5)]
+            writer.flush()
+
+            self.assertEqual(["file_0.nc", "file_1.nc", "file_2.nc", "file_3.nc", "file_4.nc"], recorder.written)
+            self.assertEqual("file_3", futures[3].result(1))
+        finally:
+            writer.shutdown()
+
+    def test_submit_returns_before_write_completes(self):
+        recorder = RecordingWriter()
+        recorder.release.clear()
+        writer = AsyncWriter(recorder.write, max_pending=2)
+        try:
+            future = writer.submit("dataset", "file")
+            self.assertFalse(future.done())
+
+            recorder.release.set()
+            self.assertEqual("file", future.result(5))
+        finally:
+            writer.shutdown()
+
+    def test_failure_is_reported_by_future(self):
+        recorder = RecordingWriter()
+        writer = AsyncWriter(recorder.write)
+        try:
+            failing = writer.submit(None, "broken")
+            succeeding = writer.submit("dataset", "file")
+
+            self.assertTrue(isinstance(failing.exception(5), IOError))
+            self.assertEqual("file", succeeding.result(5))
+        finally:
+            writer.shutdown()
+
+    def test_submit_after_shutdown(self):
+        writer = AsyncWriter(RecordingWriter().write)
+        writer.shutdown()
+
+        try:
+            writer.submit("dataset", "file")
+            self.fail("RuntimeError expected")
+        except RuntimeError:
+            pass
+
+    def test_shutdown_writes_pending(self):
+        recorder = RecordingWriter()
+        writer = AsyncWriter(recorder.write, max_pending=3)
+        for i in range(0, 3):
+            writer.submit("dataset", "file_" + str(i))
+
+        writer.shutdown(wait=True)
+        self.assertEqual(3, len(recorder.written))
+
+    def test_submit_racing_shutdown(self):
+        writer = SlowAsyncWriter(RecordingWriter().write)
+
+        futures = []
+        submitting = threading.Thread(target=lambda: futures.append(writer.submit("dataset", "file")))
+        submitting.start()
+
+        # shutdown() is called while the dataset is being queued
+        writer._queue.putting.wait(5)
+        writer.shutdown(wait=True)
+        submitting.join(5)
+
+        self.assertEqual("file", futures[0].result(1))
+
+    def test_flush_before_exit(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file = os.path.join(temp_dir, "product.nc")
+            result = subprocess.run([sys.executable, "-c", FLUSHING_SCRIPT, file], stderr=subprocess.PIPE, timeout=60)
+
+            self.assertEqual(0, result.returncode, result.stderr)
+            with open(file) as written:
+                self.assertEqual("dataset", written.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_pending_writes_completed_at_exit(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file = os.path.join(temp_dir, "product.nc")
+            result = subprocess.run([sys.executable, "-c", EXITING_SCRIPT, file], stderr=subprocess.PIPE, timeout=60)
+
+            self.assertEqual(0, result.returncode, result.stderr)
+            with open(file) as written:
+                self.assertEqual("dataset", written.read())
+            self.assertIn(b"writing " + file.encode() + b".failed failed at interpreter exit", result.stderr)
+            self.assertIn(b"OSError: nothing to write", result.stderr)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_default_writer_is_shared(self):
+        recorder = RecordingWriter()
+
+        writer = DefaultAsyncWriter.get(recorder.write)
+        self.assertIs(writer, DefaultAsyncWriter.get(recorder.write))
+        self.assertIsNot(writer, DefaultAsyncWriter.get(RecordingWriter().write))
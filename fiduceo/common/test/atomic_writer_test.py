@@ -0,0 +1,260 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.writer.atomic_writer import AtomicWriter
+from fiduceo.common.writer.block_statistics import BlockStatistics
+from fiduceo.common.writer.write_profiler import WriteProfiler
+
+
+class AtomicWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.target_path = os.path.join(self.temp_dir, "atomic_writer_test.nc")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write(self):
+        dataset = self._create_dataset()
+
+        AtomicWriter.write(dataset, self.target_path, self._create_encoding())
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+            self.assertEqual(2, target_data["flags"].data[2, 0])
+            self.assertEqual("test", target_data.attrs["institution"])
+        finally:
+            target_data.close()
+
+    def test_write_computations(self):
+        dataset = self._create_dataset()
+        dataset["brightness"] = dataset["brightness"].chunk({"y": 2})
+        computations = lambda ds: BlockStatistics.calculate_all({"brightness": ds["brightness"].data}, compute=False)
+
+        def finalise(statistics):
+            dataset["brightness"].attrs["data_max"] = statistics["brightness"]["max"]
+            return {"brightness": {"data_max": statistics["brightness"]["max"]}}
+
+        AtomicWriter.write(dataset, self.target_path, self._create_encoding(), computations=computations, finalise=finalise)
+
+        self.assertAlmostEqual(1.5, dataset["brightness"].attrs["data_max"], 5)
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].attrs["data_max"], 5)
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+        finally:
+            target_data.close()
+
+    def test_write_computations_rejected(self):
+        dataset = self._create_dataset()
+        dataset["brightness"] = dataset["brightness"].chunk({"y": 2})
+
+        def finalise(statistics):
+            raise ValueError("data scaling range violations")
+
+        for resume in [False, True]:
+            try:
+                AtomicWriter.write(dataset, self.target_path, self._create_encoding(), resume=resume, computations=lambda ds: [da.ones(3)], finalise=finalise)
+                self.fail("ValueError expected")
+            except ValueError:
+                pass
+            self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_write_replaces_existing_file(self):
+        with open(self.target_path, "w") as existing:
+            existing.write("old content")
+
+        AtomicWriter.write(self._create_dataset(), self.target_path, self._create_encoding())
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertEqual(2, target_data["flags"].data[2, 0])
+        finally:
+            target_data.close()
+
+    def test_write_failure_keeps_existing_file(self):
+        with open(self.target_path, "w") as existing:
+            existing.write("old content")
+
+        encoding = self._create_encoding()
+        encoding["brightness"]["chunksizes"] = (1, 2, 3, 4)  # invalid, raises when the variable is created
+
+        try:
+            AtomicWriter.write(self._create_dataset(), self.target_path, encoding)
+            self.fail("Exception expected")
+        except Exception:
+            pass
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        with open(self.target_path, "r") as existing:
+            self.assertEqual("old content", existing.read())
+
+    def test_commit_syncs_before_rename(self):
+        temp_file = AtomicWriter.get_temp_file_path(self.target_path)
+        with open(temp_file, "w") as written:
+            written.write("content")
+
+        synced = []
+        with mock.patch("os.fsync", side_effect=lambda fd: synced.append(os.path.isfile(temp_file))):
+            AtomicWriter.commit(temp_file, self.target_path)
+
+        # the file is synced while still at its temporary path, the directory after the rename
+        self.assertEqual([True, False], synced)
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+
+    def test_get_temp_file_path(self):
+        temp_file = AtomicWriter.get_temp_file_path(self.target_path)
+
+        self.assertEqual(self.temp_dir, os.path.dirname(temp_file))
+        self.assertTrue(os.path.basename(temp_file).startswith(".atomic_writer_test.nc."))
+        self.assertNotEqual(temp_file, AtomicWriter.get_temp_file_path(self.target_path))
+
+    def test_write_resumable(self):
+        AtomicWriter.write(self._create_dataset(), self.target_path, self._create_encoding(), resume=True)
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+            self.assertEqual(2, target_data["flags"].data[2, 0])
+            self.assertEqual(np.int16, target_data["brightness"].encoding["dtype"])
+            self.assertEqual("test", target_data.attrs["institution"])
+        finally:
+            target_data.close()
+
+    def test_write_resumable_continues_after_interruption(self):
+        dataset = self._create_dataset()
+        self._interrupt_at_second_variable(dataset)
+
+        self.assertFalse(os.path.isfile(self.target_path))
+        self.assertTrue(os.path.isfile(AtomicWriter.get_part_file_path(self.target_path)))
+        self.assertTrue(os.path.isfile(AtomicWriter.get_journal_file_path(self.target_path)))
+
+        # the completed variable is not written again - the modification must not reach the file
+        dataset["brightness"].data[1, 1] = 8.0
+
+        AtomicWriter.write(dataset, self.target_path, self._create_encoding(), resume=True)
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+            self.assertEqual(2, target_data["flags"].data[2, 0])
+        finally:
+            target_data.close()
+
+    def test_write_resumable_restarts_on_damaged_part_file(self):
+        dataset = self._create_dataset()
+        self._interrupt_at_second_variable(dataset)
+
+        part_file = AtomicWriter.get_part_file_path(self.target_path)
+        with open(part_file, "r+b") as part:
+            part.truncate(os.path.getsize(part_file) // 2)
+
+        AtomicWriter.write(dataset, self.target_path, self._create_encoding(), resume=True)
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+            self.assertEqual(2, target_data["flags"].data[2, 0])
+        finally:
+            target_data.close()
+
+    def test_write_resumable_restarts_on_changed_encoding(self):
+        dataset = self._create_dataset()
+        self._interrupt_at_second_variable(dataset)
+
+        dataset["brightness"].data[1, 1] = 8.0
+        encoding = self._create_encoding()
+        encoding["brightness"]["complevel"] = 9
+
+        AtomicWriter.write(dataset, self.target_path, encoding, resume=True)
+
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            # the completed variable is written again with the new encoding
+            self.assertAlmostEqual(8.0, target_data["brightness"].data[1, 1], 5)
+            self.assertEqual(9, target_data["brightness"].encoding["complevel"])
+        finally:
+            target_data.close()
+
+    def test_write_resumable_ignores_journal_of_other_layout(self):
+        journal_file = AtomicWriter.get_journal_file_path(self.target_path)
+        with open(journal_file, "w") as journal:
+            journal.write('{"dimensions": {"y": 12}, "variables": ["other"]}\n')
+            journal.write('{"completed": "brightness"}\n')
+        with open(AtomicWriter.get_part_file_path(self.target_path), "w") as part:
+            part.write("garbage")
+
+        AtomicWriter.write(self._create_dataset(), self.target_path, self._create_encoding(), resume=True)
+
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+        finally:
+            target_data.close()
+
+    def test_write_profiled(self):
+        profiler = WriteProfiler()
+
+        AtomicWriter.write(self._create_dataset(), self.target_path, self._create_encoding(), profiler=profiler)
+
+        self.assertEqual(["atomic_writer_test.nc"], os.listdir(self.temp_dir))
+        report = profiler.finish(self.target_path, 0)
+        self.assertEqual(["write", "commit"], list(report["phases"].keys()))
+        self.assertEqual(["brightness", "flags"], list(report["variables"].keys()))
+        self.assertEqual(48, report["variables"]["brightness"]["raw_bytes"])
+        self.assertEqual(12, report["variables"]["flags"]["raw_bytes"])
+        self.assertTrue(report["variables"]["brightness"]["compressed_bytes"] > 0)
+
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            self.assertAlmostEqual(1.5, target_data["brightness"].data[1, 1], 5)
+            self.assertEqual(np.int16, target_data["brightness"].encoding["dtype"])
+            self.assertEqual(2, target_data["flags"].data[2, 0])
+        finally:
+            target_data.close()
+
+    def _interrupt_at_second_variable(self, dataset):
+        append_variable = AtomicWriter._append_variable
+
+        def interrupt(ds, var_name, target_file, encoding, profiler):
+            if var_name == "flags":
+                raise IOError("interrupted")
+            append_variable(ds, var_name, target_file, encoding, profiler)
+
+        with mock.patch.object(AtomicWriter, "_append_variable", side_effect=interrupt):
+            with self.assertRaises(IOError):
+                AtomicWriter.write(dataset, self.target_path, self._create_encoding(), resume=True)
+
+        self.assertTrue(os.path.isfile(AtomicWriter.get_journal_file_path(self.target_path)))
+
+    @staticmethod
+    def _create_dataset():
+        dataset = xr.Dataset()
+        dataset.attrs["institution"] = "test"
+
+        data = np.full([4, 3], 1.5, np.float32)
+        dataset["brightness"] = Variable(["y", "x"], data)
+
+        data = np.full([4, 3], 2, np.uint8)
+        dataset["flags"] = Variable(["y", "x"], data)
+        return dataset
+
+    @staticmethod
+    def _create_encoding():
+        return {"brightness": {"dtype": np.int16, "scale_factor": 0.01, "_FillValue": -32768, "zlib": True},
+                "flags": {"zlib": True, "complevel": 5}}
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.writer.batch_writer import BatchWriter, WriteJob
+from fiduceo.common.writer.size_estimator import SizeEstimate
+
+
+def write_dataset(ds, file, fill_value=None):
+    if fill_value is not None:
+        ds["data"].data[:] = fill_value
+    ds.to_netcdf(file, format='netCDF4', engine='netcdf4')
+
+
+def create_dataset():
+    dataset = xr.Dataset()
+    dataset["data"] = Variable(["y", "x"], np.full([6, 4], 7, np.int16))
+    return dataset
+
+
+def raise_error():
+    raise ValueError("no input data")
+
+
+def terminate_worker():
+    os._exit(1)
+
+
+class BatchWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write(self):
+        files = [os.path.join(self.temp_dir, "batch_" + str(i) + ".nc") for i in range(0, 5)]
+        jobs = [(create_dataset(), files[0]), (create_dataset, files[1]), WriteJob(create_dataset, files[2], memory_estimate=100, fill_value=3),
+                (create_dataset(), files[3]), (create_dataset, files[4])]
+
+        batch_writer = BatchWriter(write_dataset, workers=2, memory_budget=10000)
+        written = batch_writer.write(jobs)
+
+        self.assertEqual(files, written)
+        for file in files:
+            self.assertTrue(os.path.isfile(file))
+
+        target_data = xr.open_dataset(files[2])
+        try:
+            self.assertEqual(3, target_data["data"].data[2, 2])
+        finally:
+            target_data.close()
+
+    def test_write_reports_all_failures(self):
+        files = [os.path.join(self.temp_dir, "batch_" + str(i) + ".nc") for i in range(0, 3)]
+        jobs = [(raise_error, files[0]), (create_dataset, files[1]), (raise_error, files[2])]
+
+        batch_writer = BatchWriter(write_dataset, workers=2)
+        try:
+            batch_writer.write(jobs)
+            self.fail("IOError expected")
+        except IOError as e:
+            self.assertTrue("2 of 3" in str(e))
+            self.assertTrue(files[0] in str(e))
+            self.assertTrue(files[2] in str(e))
+
+        self.assertTrue(os.path.isfile(files[1]))
+
+    def test_select_next_respects_budget(self):
+        estimates = [800, 500, 300, 100]
+        pending = [0, 1, 2, 3]
+
+        self.assertEqual(0, BatchWriter._select_next(pending, estimates, 0, 0, 4, 1000))
+        self.assertEqual(2, BatchWriter._select_next(pending, estimates, 600, 1, 4, 1000))
+        self.assertEqual(3, BatchWriter._select_next(pending, estimates, 850, 2, 4, 1000))
+        self.assertIsNone(BatchWriter._select_next(pending, estimates, 950, 2, 4, 1000))
+
+    def test_select_next_respects_workers(self):
+        self.assertIsNone(BatchWriter._select_next([0], [10], 0, 2, 2, None))
+        self.assertEqual(0, BatchWriter._select_next([0], [10], 0, 1, 2, None))
+
+    def test_select_next_oversized_job_runs_alone(self):
+        self.assertEqual(0, BatchWriter._select_next([0], [5000], 0, 0, 4, 1000))
+        self.assertIsNone(BatchWriter._select_next([0], [5000], 10, 1, 4, 1000))
+
+    def test_memory_estimate(self):
+        batch_writer = BatchWriter(write_dataset, workers=4, memory_budget=4000)
+
+        self.assertEqual(72, batch_writer._get_memory_estimate(WriteJob(create_dataset(), "file")))
+        self.assertEqual(1000, batch_writer._get_memory_estimate(WriteJob(create_dataset, "file")))
+        self.assertEqual(17, batch_writer._get_memory_estimate(WriteJob(create_dataset, "file", memory_estimate=17)))
+        self.assertEqual(150, batch_writer._get_memory_estimate(WriteJob(create_dataset, "file", memory_estimate=SizeEstimate(100, 150, 20, dict()))))
+
+    def test_write_survives_dying_worker(self):
+        files = [os.path.join(self.temp_dir, "batch_" + str(i) + ".nc") for i in range(0, 4)]
+        jobs = [(create_dataset, files[0]), (terminate_worker, files[1]), (create_dataset, files[2]), (create_dataset, files[3])]
+
+        batch_writer = BatchWriter(write_dataset, workers=1)
+        try:
+            batch_writer.write(jobs)
+            self.fail("IOError expected")
+        except IOError as e:
+            self.assertTrue("1 of 4" in str(e))
+            self.assertTrue(files[1] in str(e))
+
+        for index in [0, 2, 3]:
+            self.assertTrue(os.path.isfile(files[index]))
@@ -0,0 +1,129 @@
+import unittest
+
+import dask.array as da
+import numpy as np
+
+from fiduceo.common.writer.block_statistics import BlockStatistics
+
+
+class BlockStatisticsTest(unittest.TestCase):
+
+    def test_calculate_float_array(self):
+        data = np.arange(0, 100, dtype=np.float32).reshape(10, 10)
+        data[2, 3] = np.NaN
+        data[7, 7] = np.NaN
+
+        statistics = BlockStatistics.calculate(data, block_elements=20)
+        self.assertEqual(0.0, statistics["min"])
+        self.assertEqual(99.0, statistics["max"])
+        self.assertEqual(2, statistics["nan_count"])
+        self.assertEqual(100, statistics["count"])
+
+    def test_calculate_nan_block_does_not_hide_extrema(self):
+        data = np.full([6, 4], np.NaN, dtype=np.float64)
+        data[5, 1] = -12.5
+        data[5, 2] = 14.25
+
+        statistics = BlockStatistics.calculate(data, block_elements=4)
+        self.assertEqual(-12.5, statistics["min"])
+        self.assertEqual(14.25, statistics["max"])
+        self.assertEqual(22, statistics["nan_count"])
+
+    def test_calculate_only_nan(self):
+        data = np.full([3, 3], np.NaN, dtype=np.float32)
+
+        statistics = BlockStatistics.calculate(data)
+        self.assertTrue(np.isnan(statistics["min"]))
+        self.assertTrue(np.isnan(statistics["max"]))
+        self.assertEqual(9, statistics["nan_count"])
+        self.assertEqual(9, statistics["count"])
+
+    def test_calculate_integer_vector(self):
+        data = np.array([7, -3, 12, 5], dtype=np.int16)
+
+        statistics = BlockStatistics.calculate(data, block_elements=3)
+        self.assertEqual(-3, statistics["min"])
+        self.assertEqual(12, statistics["max"])
+        self.assertEqual(0, statistics["nan_count"])
+        self.assertEqual(4, statistics["count"])
+
+    def test_calculate_scalar(self):
+        statistics = BlockStatistics.calculate(np.float32(3.5))
+        self.assertEqual(3.5, statistics["min"])
+        self.assertEqual(3.5, statistics["max"])
+        self.assertEqual(1, statistics["count"])
+
+    def test_calculate_dask_array(self):
+        data = np.arange(0, 64, dtype=np.float32).reshape(8, 8)
+        data[0, 0] = np.NaN
+        dask_data = da.from_array(data, chunks=(3, 5))
+
+        statistics = BlockStatistics.calculate(dask_data)
+        self.assertEqual(1.0, statistics["min"])
+        self.assertEqual(63.0, statistics["max"])
+        self.assertEqual(1, statistics["nan_count"])
+        self.assertEqual(64, statistics["count"])
+
+    def test_calculate_all_mixed(self):
+        arrays = dict()
+        arrays["numpy"] = np.array([[1.0, 2.0], [3.0, np.NaN]], dtype=np.float32)
+        arrays["dask"] = da.from_array(np.array([4, 9, -2], dtype=np.int32), chunks=2)
+
+        results = BlockStatistics.calculate_all(arrays, max_workers=2)
+        self.assertEqual(2, len(results))
+        self.assertEqual(1.0, results["numpy"]["min"])
+        self.assertEqual(3.0, results["numpy"]["max"])
+        self.assertEqual(1, results["numpy"]["nan_count"])
+        self.assertEqual(-2, results["dask"]["min"])
+        self.assertEqual(9, results["dask"]["max"])
+
+    def test_calculate_mean_std_combined_over_blocks(self):
+        data = np.arange(0, 60, dtype=np.float64).reshape(12, 5) * 0.5 + 1000.0
+        data[3, 2] = np.NaN
+
+        statistics = BlockStatistics.calculate(data, block_elements=7, moments=True)
+
+        valid = data[~np.isnan(data)]
+        self.assertEqual(59, statistics["valid_count"])
+        self.assertAlmostEqual(np.mean(valid), statistics["mean"], 10)
+        self.assertAlmostEqual(np.std(valid), statistics["std"], 10)
+
+    def test_calculate_without_moments(self):
+        data = np.array([[1.0, np.NaN, 3.0], [4.0, 5.0, 6.0]], dtype=np.float32)
+
+        for statistics in [BlockStatistics.calculate(data, block_elements=3), BlockStatistics.calculate(da.from_array(data, chunks=1))]:
+            self.assertEqual({"min", "max", "nan_count", "count", "valid_count"}, set(statistics))
+            self.assertEqual(5, statistics["valid_count"])
+            self.assertEqual(6.0, statistics["max"])
+
+    def test_calculate_fill_value_excluded(self):
+        data = np.array([[-32768, 4, 6], [8, -32768, -32768]], dtype=np.int16)
+
+        statistics = BlockStatistics.calculate(data, block_elements=3, fill_value=-32768, moments=True)
+
+        self.assertEqual(4, statistics["min"])
+        self.assertEqual(8, statistics["max"])
+        self.assertEqual(6, statistics["count"])
+        self.assertEqual(3, statistics["valid_count"])
+        self.assertAlmostEqual(6.0, statistics["mean"], 10)
+        self.assertAlmostEqual(np.sqrt(8.0 / 3.0), statistics["std"], 10)
+
+    def test_calculate_no_valid_data(self):
+        data = np.full([2, 2], 255, dtype=np.uint8)
+
+        statistics = BlockStatistics.calculate(data, fill_value=255, moments=True)
+
+        self.assertEqual(0, statistics["valid_count"])
+        self.assertTrue(np.isnan(statistics["min"]))
+        self.assertTrue(np.isnan(statistics["mean"]))
+        self.assertTrue(np.isnan(statistics["std"]))
+
+    def test_calculate_all_dask_fill_value(self):
+        arrays = {"dask": da.from_array(np.array([4, 9, -1, 5], dtype=np.int32), chunks=3)}
+
+        results = BlockStatistics.calculate_all(arrays, fill_values={"dask": -1}, moments=True)
+
+        self.assertEqual(4, results["dask"]["min"])
+        self.assertEqual(3, results["dask"]["valid_count"])
+        self.assertAlmostEqual(6.0, results["dask"]["mean"], 10)
+        self.assertAlmostEqual(np.std([4, 9, 5]), results["dask"]["std"], 10)
@@ -0,0 +1,80 @@
+import unittest
+from functools import partial
+
+import dask.array as da
+import numpy as np
+
+from fiduceo.common.test import template_test_support
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+
+build_template = partial(template_test_support.build_template, chunk_width=4, time=True)
+
+
+class ChunkedTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        TemplateSchema.clear_cache()
+
+    def tearDown(self):
+        TemplateSchema.clear_cache()
+
+    def test_create(self):
+        dataset = ChunkedTemplate.create("TEST", build_template, 150)
+
+        bt = dataset.variables["bt"]
+        self.assertTrue(ChunkedTemplate.is_chunked(bt))
+        self.assertEqual(((64, 64, 22), (4, 4)), bt.chunks)
+        self.assertEqual((64, 4), bt.encoding["chunksizes"])
+        self.assertEqual(((64, 64, 22),), dataset.variables["time"].chunks)
+
+        self.assertFalse(ChunkedTemplate.is_chunked(dataset.variables["y"]))
+        self.assertFalse(ChunkedTemplate.is_chunked(dataset.variables["srf"]))
+        self.assertTrue(build_template(150).identical(dataset.compute()))
+
+    def test_create_smaller_than_chunks(self):
+        dataset = ChunkedTemplate.create("TEST", build_template, 20)
+
+        self.assertEqual(((20,), (4, 4)), dataset.variables["bt"].chunks)
+        self.assertTrue(build_template(20).identical(dataset.compute()))
+
+    def test_chunk(self):
+        dataset = ChunkedTemplate.chunk(build_template(100))
+
+        self.assertEqual(((64, 36), (4, 4)), dataset.variables["bt"].chunks)
+        self.assertIsNone(dataset.variables["y"].chunks)
+        self.assertIsNone(dataset.variables["srf"].chunks)
+
+    def test_map_blocks(self):
+        dataset = ChunkedTemplate.create("TEST", build_template, 100)
+
+        ChunkedTemplate.map_blocks(dataset, "bt", lambda block, block_info=None: np.full(block.shape, block_info[0]["chunk-location"][0], block.dtype))
+
+        bt = dataset.variables["bt"]
+        self.assertTrue(ChunkedTemplate.is_chunked(bt))
+        self.assertEqual(np.int16, bt.dtype)
+        self.assertEqual(0, bt.values[63, 0])
+        self.assertEqual(1, bt.values[64, 7])
+
+    def test_map_blocks_with_arguments(self):
+        dataset = ChunkedTemplate.create("TEST", build_template, 100)
+        offsets = da.ones((100, 8), dtype=np.int16, chunks=(64, 4))
+
+        ChunkedTemplate.map_blocks(dataset, "bt", lambda block, offset, scale: offset * scale, offsets, scale=3)
+
+        np.testing.assert_array_equal(np.full((100, 8), 3, dtype=np.int16), dataset.variables["bt"].values)
+
+    def test_map_blocks_not_chunked(self):
+        dataset = ChunkedTemplate.create("TEST", build_template, 100)
+
+        try:
+            ChunkedTemplate.map_blocks(dataset, "srf", lambda block: block)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertEqual("variable is not chunked: srf", str(e))
+
+    def test_get_chunks(self):
+        self.assertEqual((64, 4), ChunkedTemplate.get_chunks((64, 4), (100, 8)))
+        self.assertEqual((20, 4), ChunkedTemplate.get_chunks((64, 4), (20, 8)))
+        self.assertEqual((1,), ChunkedTemplate.get_chunks((64,), (0,)))
@@ -0,0 +1,141 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import dask.array as da
+import netCDF4
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.writer.block_statistics import BlockStatistics
+from fiduceo.common.writer.chunked_writer import ChunkedWriter, ProcessFileLock
+
+evaluated_blocks = []
+evaluated_blocks_lock = threading.Lock()
+
+
+def fill_block(block, block_info=None):
+    with evaluated_blocks_lock:
+        evaluated_blocks.append(block_info[0]["chunk-location"])
+    return np.full(block.shape, block_info[0]["chunk-location"][0] + 1, block.dtype)
+
+
+class ChunkedWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.target_path = os.path.join(self.temp_dir, "chunked_writer_test.nc")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_is_chunked(self):
+        self.assertTrue(ChunkedWriter.is_chunked(self._create_dataset()))
+        self.assertFalse(ChunkedWriter.is_chunked(self._create_dataset().compute()))
+
+    def test_write_threads(self):
+        ChunkedWriter.write(self._create_dataset(), self.target_path, self._create_encoding())
+
+        self._assert_written()
+
+    def test_write_threads_keeps_file_open(self):
+        with mock.patch("fiduceo.common.writer.chunked_writer.netCDF4", wraps=netCDF4) as netcdf_module:
+            ChunkedWriter.write(self._create_dataset(), self.target_path, self._create_encoding(), num_workers=2)
+
+        # once to define the dask backed variables, once for writing all three chunks
+        self.assertEqual(2, netcdf_module.Dataset.call_count)
+        self._assert_written()
+
+    def test_write_with_computations(self):
+        dataset = self._create_dataset()
+        del evaluated_blocks[:]
+
+        statistics = ChunkedWriter.write(dataset, self.target_path, self._create_encoding(), computations=lambda stored: BlockStatistics.calculate_all({"brightness": stored["brightness"].data}, compute=False))
+
+        self._assert_written()
+        self.assertEqual(3.0, statistics["brightness"]["max"])
+        self.assertEqual(100, statistics["brightness"]["valid_count"])
+        # the chunks are evaluated once, for writing and the statistics
+        self.assertEqual([(0, 0), (1, 0), (2, 0)], sorted(evaluated_blocks))
+
+    def test_write_processes_with_computations(self):
+        dataset = self._create_dataset()
+
+        statistics = ChunkedWriter.write(dataset, self.target_path, self._create_encoding(), scheduler="processes", num_workers=2,
+                                         computations=lambda stored: BlockStatistics.calculate_all({"brightness": stored["brightness"].data}, compute=False))
+
+        self._assert_written()
+        self.assertEqual(1.0, statistics["brightness"]["min"])
+
+    def test_write_processes(self):
+        ChunkedWriter.write(self._create_dataset(), self.target_path, self._create_encoding(), scheduler="processes", num_workers=2)
+
+        self._assert_written()
+        self.assertEqual(["chunked_writer_test.nc"], os.listdir(self.temp_dir))
+
+    def test_process_file_lock(self):
+        lock = ProcessFileLock(os.path.join(self.temp_dir, "test.lock"))
+
+        with lock:
+            self.assertTrue(lock.locked)
+            self.assertFalse(ProcessFileLock(lock.path).acquire(blocking=False))
+        self.assertFalse(lock.locked)
+
+        copy = pickle.loads(pickle.dumps(lock))
+        self.assertEqual(lock.path, copy.path)
+        self.assertTrue(copy.acquire(blocking=False))
+        copy.release()
+
+    def test_set_up_file(self):
+        names = ChunkedWriter.set_up_file(self._create_dataset(), self.target_path, self._create_encoding())
+
+        self.assertEqual(["brightness"], names)
+        with netCDF4.Dataset(self.target_path) as dataset:
+            self.assertEqual(2, dataset.variables["flags"][5, 1])
+            brightness = dataset.variables["brightness"]
+            self.assertEqual((25, 4), brightness.shape)
+            self.assertEqual(np.int16, brightness.dtype)
+            self.assertEqual(-32768, brightness._FillValue)
+            self.assertAlmostEqual(0.01, brightness.scale_factor, 8)
+            self.assertEqual([10, 4], brightness.chunking())
+            self.assertTrue(np.all(np.ma.getmaskarray(brightness[:])))
+
+    def test_store_targets(self):
+        dataset = self._create_dataset()
+        encoding = self._create_encoding()
+        names = ChunkedWriter.set_up_file(dataset, self.target_path, encoding)
+        targets = [pickle.loads(pickle.dumps(target)) for target in ChunkedWriter.get_store_targets(dataset, self.target_path, encoding, names)]
+
+        da.store([dataset["brightness"].data], targets, lock=threading.Lock())
+
+        self._assert_written()
+
+    def _assert_written(self):
+        target_data = xr.open_dataset(self.target_path)
+        try:
+            brightness = target_data["brightness"]
+            self.assertAlmostEqual(1.0, brightness.values[9, 3], 5)
+            self.assertAlmostEqual(3.0, brightness.values[24, 0], 5)
+            self.assertEqual(np.int16, brightness.encoding["dtype"])
+            self.assertEqual((10, 4), brightness.encoding["chunksizes"])
+            self.assertEqual(2, target_data["flags"].values[5, 1])
+        finally:
+            target_data.close()
+
+    @staticmethod
+    def _create_dataset():
+        dataset = xr.Dataset()
+        data = da.zeros((25, 4), dtype=np.float32, chunks=(10, 4))
+        dataset["brightness"] = Variable(["y", "x"], da.map_blocks(fill_block, data, dtype=np.float32))
+        dataset["flags"] = Variable(["y", "x"], np.full([25, 4], 2, np.uint8))
+        return dataset
+
+    @staticmethod
+    def _create_encoding():
+        return {"brightness": {"dtype": np.int16, "scale_factor": 0.01, "_FillValue": -32768, "chunksizes": (10, 4), "zlib": True, "complevel": 5},
+                "flags": {"zlib": True, "complevel": 5}}
@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.writer.chunking_advisor import ChunkingAdvisor, FULL_SCAN, SCANLINE_BLOCKS, SPATIAL_TILES, PER_CHANNEL
+from fiduceo.common.writer.encoding_plan import EncodingPlan
+from fiduceo.common.writer.templates.templateutil import TemplateUtil as tu
+
+
+class ChunkingAdvisorTest(unittest.TestCase):
+
+    def test_compute_chunk_sizes_vector(self):
+        self.assertEqual((128,), ChunkingAdvisor.compute_chunk_sizes((128,), 4, SCANLINE_BLOCKS, target_bytes=4096))
+        self.assertEqual((1024,), ChunkingAdvisor.compute_chunk_sizes((12000,), 4, FULL_SCAN, target_bytes=4096))
+
+    def test_compute_chunk_sizes_scanline_blocks(self):
+        self.assertEqual((640, 409), ChunkingAdvisor.compute_chunk_sizes((12000, 409), 4, SCANLINE_BLOCKS, target_bytes=1048576))
+        self.assertEqual((19, 27, 56), ChunkingAdvisor.compute_chunk_sizes((19, 944, 56), 4, SCANLINE_BLOCKS, target_bytes=115000))
+
+    def test_compute_chunk_sizes_short_height_is_clamped(self):
+        self.assertEqual((128, 409), ChunkingAdvisor.compute_chunk_sizes((128, 409), 2, SCANLINE_BLOCKS))
+        self.assertEqual((128, 409), ChunkingAdvisor.compute_chunk_sizes((128, 409), 2, SPATIAL_TILES))
+        self.assertEqual((1, 128, 56), ChunkingAdvisor.compute_chunk_sizes((19, 128, 56), 2, PER_CHANNEL))
+
+    def test_compute_chunk_sizes_spatial_tiles(self):
+        self.assertEqual((512, 512), ChunkingAdvisor.compute_chunk_sizes((5000, 5000), 4, SPATIAL_TILES, target_bytes=1048576))
+        self.assertEqual((1, 4681, 56), ChunkingAdvisor.compute_chunk_sizes((19, 12000, 56), 4, SPATIAL_TILES, target_bytes=1048576))
+
+    def test_compute_chunk_sizes_per_channel(self):
+        self.assertEqual((1, 4681, 56), ChunkingAdvisor.compute_chunk_sizes((19, 12000, 56), 4, PER_CHANNEL, target_bytes=1048576))
+
+    def test_compute_chunk_sizes_full_scan(self):
+        self.assertEqual((4, 944, 56), ChunkingAdvisor.compute_chunk_sizes((19, 944, 56), 2, FULL_SCAN, target_bytes=524288))
+        self.assertEqual((1, 100, 56), ChunkingAdvisor.compute_chunk_sizes((19, 944, 56), 2, FULL_SCAN, target_bytes=11200))
+
+    def test_compute_chunk_sizes_never_zero(self):
+        self.assertEqual((3, 1, 5000), ChunkingAdvisor.compute_chunk_sizes((3, 5000, 5000), 4, SCANLINE_BLOCKS, target_bytes=16))
+        self.assertEqual((1, 1, 4), ChunkingAdvisor.compute_chunk_sizes((3, 5000, 5000), 4, FULL_SCAN, target_bytes=16))
+
+    def test_compute_chunk_sizes_invalid_pattern(self):
+        try:
+            ChunkingAdvisor.compute_chunk_sizes((12, 12), 4, "random_access")
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_apply(self):
+        dataset = xr.Dataset()
+        variable = Variable(["y", "x"], np.full([128, 409], np.NaN, np.float32))
+        tu.add_encoding(variable, np.int16, -32768, 0.01, chunksizes=(1280, 409))
+        dataset["angle"] = variable
+
+        variable = Variable(["y", "x"], np.full([128, 409], 0, np.uint8))
+        dataset["flags"] = variable
+
+        dataset["scalar"] = Variable([], np.float32(1.0))
+
+        chunk_sizes = ChunkingAdvisor.apply(dataset, access_pattern=SCANLINE_BLOCKS, target_bytes=409 * 64)
+
+        self.assertEqual(2, len(chunk_sizes))
+        angle = dataset.variables["angle"]
+        self.assertEqual((32, 409), angle.encoding["chunksizes"])
+        self.assertEqual(np.int16, angle.encoding["dtype"])
+        self.assertEqual(0.01, angle.encoding["scale_factor"])
+        self.assertEqual((64, 409), dataset.variables["flags"].encoding["chunksizes"])
+        self.assertFalse("chunksizes" in dataset.variables["scalar"].encoding)
+
+    def test_apply_template_encoding_plan(self):
+        EncodingPlan.clear_cache()
+        dataset = xr.Dataset()
+        dataset.attrs["template_key"] = "TEST"
+        dataset["flags"] = Variable(["y", "x"], np.full([128, 409], 0, np.uint8))
+        dataset["flags"].encoding = dict([("chunksizes", (128, 409))])
+        self.assertEqual((128, 409), EncodingPlan.get(dataset, 5).get_encoding(dataset)["flags"]["chunksizes"])
+
+        ChunkingAdvisor.apply(dataset, access_pattern=SCANLINE_BLOCKS, target_bytes=409 * 64)
+
+        self.assertEqual((64, 409), EncodingPlan.get(dataset, 5).get_encoding(dataset)["flags"]["chunksizes"])
+        EncodingPlan.clear_cache()
+
+    def test_get_chunk_sizes_does_not_modify(self):
+        dataset = xr.Dataset()
+        dataset["sst"] = Variable(["y", "x"], np.full([64, 64], np.NaN, np.float32))
+
+        chunk_sizes = ChunkingAdvisor.get_chunk_sizes(dataset, access_pattern=SPATIAL_TILES, target_bytes=1024)
+
+        self.assertEqual((16, 16), chunk_sizes["sst"])
+        self.assertFalse("chunksizes" in dataset.variables["sst"].encoding)
@@ -25,3 +25,14 @@ class DefaultDataTest(unittest.TestCase):
         self.assertEqual(np.float32(9.96921E36), DefaultData.get_default_fill_value(np.float32))
         self.assertEqual(9.969209968386869E36, DefaultData.get_default_fill_value(np.float64))
 
+
+    def test_create_default_array_probe(self):
+        with DefaultData.probe():
+            default_array = DefaultData.create_default_array(20000, 30000, np.float32)
+
+        self.assertEqual((30000, 20000), default_array.shape)
+        self.assertEqual(np.float32(9.96921E36), default_array.data[12, 13])
+        self.assertTrue(DefaultData.is_probe_array(default_array.data))
+
+        default_array = DefaultData.create_default_array(2, 3, np.float32)
+        self.assertFalse(DefaultData.is_probe_array(default_array.data))
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import unittest
+from functools import partial
+
+import numpy as np
+
+from fiduceo.common.test import template_test_support
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+from fiduceo.common.writer.default_data import DefaultData
+from fiduceo.common.writer.disk_template import DiskTemplate
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+
+build_template = partial(template_test_support.build_template, scalar=True)
+
+
+class DiskTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        TemplateSchema.clear_cache()
+        self.temp_dir = tempfile.mkdtemp()
+        self.target_path = os.path.join(self.temp_dir, "disk_template_test.nc")
+        self.written = []
+
+    def tearDown(self):
+        TemplateSchema.clear_cache()
+        shutil.rmtree(self.temp_dir)
+
+    def test_create(self):
+        template = DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write)
+        try:
+            dataset = template.dataset
+            self.assertTrue(build_template(100).identical(dataset))
+            self._assert_writes_through(template, "bt", 12345)
+            self._assert_writes_through(template, "srf", 0.125)
+            self.assertEqual([os.path.basename(template.scratch_file)], os.listdir(self.temp_dir))
+            self.assertTrue(template.scratch_file.endswith(".scratch"))
+        finally:
+            template.discard()
+
+    def test_create_smaller_than_chunks(self):
+        template = DiskTemplate.create("TEST", build_template, 20, self.target_path, self._write)
+        try:
+            self.assertTrue(build_template(20).identical(template.dataset))
+            self._assert_writes_through(template, "bt", 12345)
+        finally:
+            template.discard()
+
+    def test_assignment_writes_through(self):
+        template = DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write)
+        try:
+            template.dataset["bt"][10:20, :] = 7
+
+            scratch_data = np.memmap(template.scratch_file, dtype=np.int16, mode="r", shape=(100, 8))
+            self.assertEqual(7, scratch_data[15, 3])
+            self.assertEqual(DefaultData.get_default_fill_value(np.int16), scratch_data[20, 3])
+        finally:
+            template.discard()
+
+    def test_close(self):
+        template = DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write)
+        template.dataset["bt"][:, :] = 3
+
+        template.close(overwrite=True)
+
+        self.assertEqual(1, len(self.written))
+        values, chunks, file, write_args = self.written[0]
+        self.assertEqual(self.target_path, file)
+        self.assertEqual(((64, 36), (8,)), chunks)
+        self.assertTrue(np.all(values == 3))
+        self.assertEqual(dict([("overwrite", True), ("scheduler", "threads")]), write_args)
+
+        self.assertIsNone(template.dataset)
+        self.assertEqual([], os.listdir(self.temp_dir))
+        template.close()
+        self.assertEqual(1, len(self.written))
+
+    def test_close_failed_write_keeps_scratch_file(self):
+        template = DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write)
+        template.dataset["bt"][:, :] = 5
+        scratch_file = os.path.basename(template.scratch_file)
+
+        try:
+            template.close(fail=True)
+            self.fail("IOError expected")
+        except IOError:
+            pass
+        self.assertEqual([scratch_file], os.listdir(self.temp_dir))
+
+        template.close()
+        self.assertTrue(np.all(self.written[0][0] == 5))
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_close_processes_scheduler(self):
+        template = DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write)
+        try:
+            template.close(scheduler="processes")
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+        self.assertEqual([], self.written)
+
+        template.close(scheduler="threads")
+        self.assertEqual(1, len(self.written))
+
+    def test_context_manager(self):
+        with DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write) as template:
+            template.dataset["bt"][0, 0] = 11
+
+        self.assertEqual(11, self.written[0][0][0, 0])
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_context_manager_discards_on_error(self):
+        try:
+            with DiskTemplate.create("TEST", build_template, 100, self.target_path, self._write):
+                raise RuntimeError("processing failed")
+        except RuntimeError:
+            pass
+
+        self.assertEqual([], self.written)
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def _assert_writes_through(self, template, name, value):
+        data = template.dataset.variables[name].data
+        value_bytes = np.asarray(value, data.dtype).tobytes()
+        self.assertNotIn(value_bytes, np.fromfile(template.scratch_file, dtype=np.uint8).tobytes())
+
+        data.flat[0] = value
+
+        self.assertIn(value_bytes, np.fromfile(template.scratch_file, dtype=np.uint8).tobytes())
+
+    def _write(self, ds, file, fail=False, **write_args):
+        if fail:
+            raise IOError("target file exists")
+        variable = ds.variables["bt"]
+        self.assertTrue(ChunkedTemplate.is_chunked(variable))
+        self.written.append((variable.values, variable.chunks, file, write_args))
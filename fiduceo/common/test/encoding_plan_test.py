@@ -0,0 +1,179 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.writer.encoding_plan import EncodingPlan
+
+
+class EncodingPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        EncodingPlan.clear_cache()
+
+    def tearDown(self):
+        EncodingPlan.clear_cache()
+
+    def test_compile(self):
+        dataset = self._create_dataset(20)
+
+        plan = EncodingPlan.compile(dataset, 7)
+
+        encoding = plan.get_encoding(dataset)
+        self.assertEqual({"zlib": True, "complevel": 7, "dtype": np.int16, "scale_factor": 0.01, "_FillValue": -32768, "chunksizes": (10, 4)}, encoding["brightness"])
+        self.assertEqual({"zlib": True, "complevel": 7}, encoding["flags"])
+        self.assertEqual({"y": 10, "x": 4}, plan.max_chunk_extents)
+
+    def test_compile_variable_encoding_overrides_compression(self):
+        dataset = self._create_dataset(20)
+        dataset["flags"].encoding = {"zlib": False}
+
+        encoding = EncodingPlan.compile(dataset, 5).get_encoding(dataset)
+
+        self.assertEqual({"zlib": False, "complevel": 5}, encoding["flags"])
+
+    def test_compile_clamps_chunks_to_dimensions(self):
+        dataset = self._create_dataset(6)
+
+        encoding = EncodingPlan.compile(dataset, 5).get_encoding(dataset)
+
+        self.assertEqual((6, 4), encoding["brightness"]["chunksizes"])
+
+    def test_compile_reports_all_problems(self):
+        dataset = self._create_dataset(20)
+        dataset["brightness"].encoding["scale_factor"] = 0.0
+        dataset["brightness"].encoding["chunksizes"] = (10, 4, 2)
+        dataset["flags"].encoding = {"dtype": np.uint8, "_FillValue": -1}
+
+        try:
+            EncodingPlan.compile(dataset, 5)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertEqual("invalid encoding: brightness: invalid scale factor 0.0; brightness: chunk sizes (10, 4, 2) do not match dimensions ('y', 'x'); flags: fill value -1 not representable as uint8",
+                             str(e))
+
+    def test_compile_invalid_compression_level(self):
+        try:
+            EncodingPlan.compile(self._create_dataset(20), 10)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertEqual("invalid compression level: 10", str(e))
+
+    def test_get_is_cached_per_layout(self):
+        plan = EncodingPlan.get(self._create_dataset(20), 5)
+
+        self.assertIs(plan, EncodingPlan.get(self._create_dataset(30), 5))
+        self.assertIsNot(plan, EncodingPlan.get(self._create_dataset(20), 6))
+
+        dataset = self._create_dataset(20)
+        dataset.attrs["template_key"] = "AVHRR"
+        self.assertIsNot(plan, EncodingPlan.get(dataset, 5))
+
+    def test_get_is_cached_per_data_type(self):
+        plan = EncodingPlan.get(self._create_dataset(20), 5)
+
+        dataset = self._create_dataset(20)
+        dataset["flags"] = dataset["flags"].astype(np.uint16)
+        self.assertIsNot(plan, EncodingPlan.get(dataset, 5))
+
+    def test_get_is_cached_per_variable_encoding(self):
+        plan = EncodingPlan.get(self._create_dataset(20), 5)
+
+        dataset = self._create_dataset(20)
+        dataset["brightness"].encoding["chunksizes"] = (5, 2)
+        rechunked = EncodingPlan.get(dataset, 5)
+        self.assertIsNot(plan, rechunked)
+        self.assertEqual((5, 2), rechunked.get_encoding(dataset)["brightness"]["chunksizes"])
+
+        dataset = self._create_dataset(20)
+        dataset["brightness"].encoding["scale_factor"] = 0.5
+        self.assertEqual(0.5, EncodingPlan.get(dataset, 5).get_encoding(dataset)["brightness"]["scale_factor"])
+
+        dataset = self._create_dataset(20)
+        dataset["flags"].attrs["_FillValue"] = 255
+        self.assertIsNot(plan, EncodingPlan.get(dataset, 5))
+
+        self.assertIs(plan, EncodingPlan.get(self._create_dataset(20), 5))
+
+    def test_get_template_by_key(self):
+        dataset = self._create_dataset(20)
+        dataset.attrs["template_key"] = "AVHRR"
+        plan = EncodingPlan.get(dataset, 5)
+
+        dataset = self._create_dataset(30)
+        dataset.attrs["template_key"] = "AVHRR"
+        with mock.patch.object(EncodingPlan, "_get_encoding_key") as get_encoding_key:
+            self.assertIs(plan, EncodingPlan.get(dataset, 5))
+        get_encoding_key.assert_not_called()
+
+        self.assertIsNot(plan, EncodingPlan.get(dataset, 6))
+
+    def test_get_template_other_layout(self):
+        dataset = self._create_dataset(20)
+        dataset.attrs["template_key"] = "AVHRR"
+        plan = EncodingPlan.get(dataset, 5)
+
+        packed = self._create_dataset(20)
+        packed.attrs["template_key"] = "AVHRR"
+        packed["brightness"] = packed["brightness"].astype(np.int16)
+        packed_plan = EncodingPlan.get(packed, 5)
+        self.assertIsNot(plan, packed_plan)
+
+        self.assertIs(plan, EncodingPlan.get(dataset, 5))
+        self.assertIs(packed_plan, EncodingPlan.get(packed, 5))
+
+    def test_get_template_modified(self):
+        dataset = self._create_dataset(20)
+        dataset.attrs["template_key"] = "AVHRR"
+        plan = EncodingPlan.get(dataset, 5)
+
+        dataset["brightness"].encoding["chunksizes"] = (5, 2)
+        EncodingPlan.mark_modified(dataset, ("chunking", 5))
+        rechunked = EncodingPlan.get(dataset, 5)
+        self.assertIsNot(plan, rechunked)
+        self.assertEqual((5, 2), rechunked.get_encoding(dataset)["brightness"]["chunksizes"])
+
+        dataset = self._create_dataset(20)
+        dataset.attrs["template_key"] = "AVHRR"
+        dataset["brightness"].encoding["scale_factor"] = 0.5
+        EncodingPlan.mark_modified(dataset)
+        self.assertEqual(0.5, EncodingPlan.get(dataset, 5).get_encoding(dataset)["brightness"]["scale_factor"])
+
+    def test_get_height_class(self):
+        dataset = self._create_dataset(20)
+        plan = EncodingPlan.get(dataset, 5)
+
+        self.assertEqual((), EncodingPlan.get_height_class(dataset, plan))
+        self.assertEqual((("y", 6),), EncodingPlan.get_height_class(self._create_dataset(6), plan))
+
+    def test_get_small_products(self):
+        plan = EncodingPlan.get(self._create_dataset(20), 5)
+
+        short_dataset = self._create_dataset(6)
+        short_plan = EncodingPlan.get(short_dataset, 5)
+
+        self.assertIsNot(plan, short_plan)
+        self.assertIs(short_plan, EncodingPlan.get(self._create_dataset(6), 5))
+        self.assertEqual((6, 4), short_plan.get_encoding(short_dataset)["brightness"]["chunksizes"])
+
+    def test_get_encoding_returns_copies(self):
+        dataset = self._create_dataset(20)
+        plan = EncodingPlan.get(dataset, 5)
+
+        plan.get_encoding(dataset)["flags"]["complevel"] = 1
+
+        self.assertEqual(5, plan.get_encoding(dataset)["flags"]["complevel"])
+
+    @staticmethod
+    def _create_dataset(height):
+        dataset = xr.Dataset()
+
+        data = np.full([height, 4], 1.5, np.float32)
+        dataset["brightness"] = Variable(["y", "x"], data)
+        dataset["brightness"].encoding = {"dtype": np.int16, "scale_factor": 0.01, "_FillValue": -32768, "chunksizes": (10, 4)}
+
+        data = np.full([height, 4], 2, np.uint8)
+        dataset["flags"] = Variable(["y", "x"], data)
+        return dataset
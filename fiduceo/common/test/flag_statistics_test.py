@@ -0,0 +1,99 @@
+import unittest
+
+import dask
+import dask.array as da
+import numpy as np
+import xarray as xr
+from dask.delayed import Delayed
+from xarray import Variable
+
+from fiduceo.common.writer.flag_statistics import FlagStatistics
+
+
+class FlagStatisticsTest(unittest.TestCase):
+
+    def test_count_uint8(self):
+        data = np.array([[0, 1, 3], [2, 7, 128]], dtype=np.uint8)
+
+        counts = FlagStatistics.count(data, [1, 2, 4, 128])
+
+        np.testing.assert_array_equal([3, 3, 1, 1], counts)
+        self.assertEqual(np.int64, counts.dtype)
+
+    def test_count_fill_value_excluded(self):
+        data = np.array([[0, 1, 255], [255, 7, 128]], dtype=np.uint8)
+
+        counts = FlagStatistics.count(data, [1, 128], fill_value=255)
+
+        np.testing.assert_array_equal([2, 1], counts)
+
+    def test_count_int16_sign_bit(self):
+        data = np.array([-1, 1, -32768, 256], dtype=np.int16)
+
+        counts = FlagStatistics.count(data, [1, 256, 32768])
+
+        np.testing.assert_array_equal([2, 2, 2], counts)
+
+    def test_count_int32(self):
+        data = np.array([0, 33554432, 33554433, -2147483648], dtype=np.int32)
+
+        counts = FlagStatistics.count(data, [1, 33554432, 2147483648], fill_value=0)
+
+        np.testing.assert_array_equal([1, 2, 1], counts)
+
+    def test_histogram_dask(self):
+        data = da.from_array(np.array([[0, 1, 3], [2, 7, 3]], dtype=np.uint8), chunks=(1, 2))
+
+        histogram = FlagStatistics.histogram(data, fill_value=7).compute()
+
+        self.assertEqual(256, histogram.shape[0])
+        self.assertEqual(1, histogram[0])
+        self.assertEqual(2, histogram[3])
+        self.assertEqual(0, histogram[7])
+
+    def test_parse_masks(self):
+        self.assertEqual([1, 2, 4], FlagStatistics.parse_masks("1, 2, 4"))
+        self.assertEqual([1, 2], FlagStatistics.parse_masks("1,2"))
+        self.assertEqual([8, 16], FlagStatistics.parse_masks(np.array([8, 16], dtype=np.uint8)))
+
+    def test_apply(self):
+        dataset = xr.Dataset()
+        variable = Variable(["y", "x"], np.array([[0, 1, 3], [2, 2, 9]], dtype=np.uint8))
+        variable.attrs["flag_masks"] = "1, 2, 8"
+        variable.attrs["flag_meanings"] = "invalid use_with_caution invalid_geoloc"
+        dataset["quality_pixel_bitmask"] = variable
+
+        variable = Variable(["y"], da.from_array(np.array([4, 255], dtype=np.uint8), chunks=1))
+        variable.attrs["flag_masks"] = [4, 128]
+        variable.encoding["_FillValue"] = 255
+        dataset["quality_scanline_bitmask"] = variable
+
+        dataset["brightness"] = Variable(["y", "x"], np.ones([2, 3], dtype=np.float32))
+
+        statistics = FlagStatistics.apply(dataset)
+
+        self.assertEqual(["quality_pixel_bitmask", "quality_scanline_bitmask"], sorted(statistics.keys()))
+        self.assertEqual([("invalid", 3), ("use_with_caution", 3), ("invalid_geoloc", 1)], list(statistics["quality_pixel_bitmask"].items()))
+        self.assertEqual({"4": 1, "128": 0}, statistics["quality_scanline_bitmask"])
+        np.testing.assert_array_equal([3, 3, 1], dataset["quality_pixel_bitmask"].attrs["flag_counts"])
+        np.testing.assert_array_equal([1, 0], dataset["quality_scanline_bitmask"].attrs["flag_counts"])
+        self.assertNotIn("flag_counts", dataset["brightness"].attrs)
+
+    def test_calculate_lazy(self):
+        dataset = xr.Dataset()
+        variable = Variable(["y", "x"], da.from_array(np.array([[0, 1, 3], [2, 2, 9]], dtype=np.uint8), chunks=(1, 3)))
+        variable.attrs["flag_masks"] = "1, 2, 8"
+        dataset["quality_pixel_bitmask"] = variable
+
+        variable = Variable(["scanline"], da.from_array(np.array([65536, 0, 65537], dtype=np.uint32), chunks=2))
+        variable.attrs["flag_masks"] = [1, 65536]
+        variable.encoding["_FillValue"] = 0
+        dataset["quality_scanline_bitmask"] = variable
+
+        counts = FlagStatistics.calculate(dataset, compute=False)
+        self.assertTrue(all(isinstance(var_counts, Delayed) for var_counts in counts.values()))
+
+        counts = dask.compute(counts)[0]
+        np.testing.assert_array_equal([3, 3, 1], counts["quality_pixel_bitmask"])
+        np.testing.assert_array_equal([1, 2], counts["quality_scanline_bitmask"])
+        np.testing.assert_array_equal([1, 2], FlagStatistics.get_attributes(counts)["quality_scanline_bitmask"]["flag_counts"])
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from fiduceo.common.writer.grid_accumulator import GridAccumulator
+
+
+class GridAccumulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_add(self):
+        accumulator = GridAccumulator((2, 3))
+
+        accumulator.add(np.array([0, 0, 0, 4, 5, 5]), np.array([1.0, 2.0, 6.0, 7.0, 3.0, np.NaN]))
+
+        np.testing.assert_array_equal([[3, 0, 0], [0, 1, 1]], accumulator.get_count())
+        np.testing.assert_allclose([[3.0, np.NaN, np.NaN], [np.NaN, 7.0, 3.0]], accumulator.get_mean())
+        np.testing.assert_allclose([[np.var([1.0, 2.0, 6.0], ddof=1), np.NaN, np.NaN], [np.NaN, np.NaN, np.NaN]], accumulator.get_variance())
+        np.testing.assert_allclose([[np.std([1.0, 2.0, 6.0]), np.NaN, np.NaN], [np.NaN, 0.0, 0.0]], accumulator.get_standard_deviation(ddof=0))
+
+    def test_add_batches_large_offset(self):
+        random = np.random.RandomState(11)
+        indices = random.randint(0, 50, 100000)
+        values = 1.0e6 + random.normal(0.0, 0.1, 100000)
+
+        accumulator = GridAccumulator(50)
+        for start in range(0, 100000, 3333):
+            accumulator.add(indices[start:start + 3333], values[start:start + 3333])
+
+        for cell in [0, 17, 49]:
+            cell_values = values[indices == cell]
+            self.assertEqual(len(cell_values), accumulator.get_count()[cell])
+            self.assertAlmostEqual(np.mean(cell_values), accumulator.get_mean()[cell], 8)
+            self.assertAlmostEqual(np.var(cell_values, ddof=1), accumulator.get_variance()[cell], 8)
+
+    def test_add_grid(self):
+        accumulator = GridAccumulator((2, 2))
+
+        accumulator.add_grid(np.array([[1.0, np.NaN], [3.0, 4.0]]))
+        accumulator.add_grid(np.array([[3.0, 5.0], [np.NaN, 8.0]]))
+
+        np.testing.assert_array_equal([[2, 1], [1, 2]], accumulator.get_count())
+        np.testing.assert_allclose([[2.0, 5.0], [3.0, 6.0]], accumulator.get_mean())
+        np.testing.assert_allclose([[2.0, np.NaN], [np.NaN, 8.0]], accumulator.get_variance())
+
+    def test_add_grid_wrong_shape(self):
+        accumulator = GridAccumulator((2, 2))
+
+        try:
+            accumulator.add_grid(np.zeros(5))
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_merge_equals_add_all(self):
+        random = np.random.RandomState(3)
+        indices = random.randint(0, 20, 3000)
+        values = random.uniform(200.0, 300.0, 3000)
+
+        expected = GridAccumulator(20)
+        expected.add(indices, values)
+
+        merged = GridAccumulator(20)
+        for start in range(0, 3000, 100):
+            part = GridAccumulator(20)
+            part.add(indices[start:start + 100], values[start:start + 100])
+            merged.merge(part)
+
+        np.testing.assert_array_equal(expected.get_count(), merged.get_count())
+        np.testing.assert_allclose(expected.get_mean(), merged.get_mean(), rtol=1e-12)
+        np.testing.assert_allclose(expected.get_variance(), merged.get_variance(), rtol=1e-9)
+
+    def test_merge_different_shape(self):
+        try:
+            GridAccumulator((2, 3)).merge(GridAccumulator((3, 2)))
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_save_load_merge_files(self):
+        files = []
+        expected = GridAccumulator((3, 4))
+        for index in range(3):
+            accumulator = GridAccumulator((3, 4))
+            accumulator.add(np.array([index, 5, 11]), np.array([index + 0.5, 2.0 * index, 7.0]))
+            expected.merge(accumulator)
+
+            file = os.path.join(self.temp_dir, "part_{}.npz".format(index))
+            accumulator.save(file)
+            files.append(file)
+
+        loaded = GridAccumulator.load(files[1])
+        self.assertEqual((3, 4), loaded.shape)
+        self.assertEqual(1.5, loaded.get_mean()[0, 1])
+
+        merged = GridAccumulator.merge_files(files)
+        np.testing.assert_array_equal(expected.get_count(), merged.get_count())
+        np.testing.assert_allclose(expected.get_mean(), merged.get_mean())
+        np.testing.assert_allclose(expected.get_variance(), merged.get_variance())
+        self.assertEqual(3, len(os.listdir(self.temp_dir)))
+
+    def test_load_unsupported_format(self):
+        file = os.path.join(self.temp_dir, "other.npz")
+        np.savez(file, count=np.zeros(3))
+
+        try:
+            GridAccumulator.load(file)
+            self.fail("IOError expected")
+        except IOError:
+            pass
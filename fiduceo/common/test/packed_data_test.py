@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+
+from fiduceo.common.test.template_test_support import build_packed_template
+from fiduceo.common.writer.packed_data import PackedData, PackedVariable
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+
+class PackedDataTest(unittest.TestCase):
+
+    def setUp(self):
+        TemplateSchema.clear_cache()
+
+    def tearDown(self):
+        TemplateSchema.clear_cache()
+
+    def test_pack(self):
+        dataset = PackedData.pack(build_packed_template(3))
+
+        angle = dataset.variables["angle"]
+        self.assertEqual(np.int16, angle.dtype)
+        self.assertEqual(-32768, angle.data[0, 0])
+        self.assertEqual(0.01, angle.attrs["scale_factor"])
+        self.assertEqual(100.0, angle.attrs["add_offset"])
+        self.assertEqual(-32768, angle.attrs["_FillValue"])
+        self.assertEqual(np.int16, angle.encoding["dtype"])
+
+        self.assertEqual(np.float32, dataset.variables["radiance"].dtype)
+        self.assertEqual(np.int16, dataset.variables["scanline"].dtype)
+        self.assertEqual(["angle", "radiance", "scanline"], list(dataset.data_vars))
+
+    def test_unpack(self):
+        dataset = PackedData.pack(build_packed_template(3))
+        dataset.variables["angle"].data[1, 2] = 250
+
+        PackedData.unpack(dataset)
+
+        angle = dataset.variables["angle"]
+        self.assertEqual(np.float32, angle.dtype)
+        self.assertAlmostEqual(102.5, angle.data[1, 2], 5)
+        self.assertTrue(np.isnan(angle.data[0, 0]))
+        self.assertEqual(0.01, angle.encoding["scale_factor"])
+
+    def test_is_packable(self):
+        dataset = build_packed_template(2)
+
+        self.assertTrue(PackedData.is_packable(dataset.variables["angle"]))
+        self.assertFalse(PackedData.is_packable(dataset.variables["radiance"]))
+        self.assertFalse(PackedData.is_packable(dataset.variables["scanline"]))
+
+    def test_wrap_builder(self):
+        key, build_function = PackedData.wrap_builder("TEST", build_packed_template)
+
+        self.assertEqual(("PACKED", "TEST"), key)
+        self.assertEqual(np.int16, build_function(2).variables["angle"].dtype)
+
+    def test_pack_template_probe(self):
+        key, build_function = PackedData.wrap_builder("TEST", build_packed_template)
+
+        dataset = TemplateSchema.create(key, build_function, 50)
+
+        angle = dataset.variables["angle"]
+        self.assertEqual(np.int16, angle.dtype)
+        self.assertEqual((50, 4), angle.shape)
+        self.assertTrue(np.all(angle.data == -32768))
+        self.assertTrue(angle.data.flags.writeable)
+        self.assertEqual(100.0, angle.attrs["add_offset"])
+
+
+class PackedVariableTest(unittest.TestCase):
+
+    def test_set_get_packed(self):
+        dataset = PackedData.pack(build_packed_template(3))
+        angle = PackedVariable(dataset["angle"])
+
+        angle[1, :] = np.array([100.0, 101.23, np.NaN, 427.0])
+
+        np.testing.assert_array_equal(np.array([0, 123, -32768, 32700], dtype=np.int16), dataset.variables["angle"].data[1, :])
+        values = angle[1, :]
+        self.assertAlmostEqual(101.23, values[1], 5)
+        self.assertTrue(np.isnan(values[2]))
+        self.assertTrue(angle.packed)
+
+    def test_set_packed_out_of_range(self):
+        dataset = PackedData.pack(build_packed_template(3))
+        angle = PackedVariable(dataset["angle"])
+
+        angle[0, 0] = 427.67
+        self.assertEqual(32767, dataset.variables["angle"].data[0, 0])
+
+        for values in [np.array([101.0, 428.0]), np.array([-228.0, 101.0]), np.array([np.inf, 101.0])]:
+            try:
+                angle[1, :2] = values
+                self.fail("ValueError expected")
+            except ValueError:
+                pass
+        np.testing.assert_array_equal([-32768, -32768], dataset.variables["angle"].data[1, :2])
+
+    def test_set_get_unpacked(self):
+        dataset = build_packed_template(3)
+        angle = PackedVariable(dataset.variables["angle"])
+
+        angle[0, 0] = 101.23
+
+        self.assertFalse(angle.packed)
+        self.assertAlmostEqual(101.23, dataset.variables["angle"].data[0, 0], 5)
+        self.assertAlmostEqual(101.23, angle[0, 0], 5)
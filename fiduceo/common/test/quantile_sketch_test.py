@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from fiduceo.common.writer.quantile_sketch import QuantileSketch
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_get_quantiles_exact_up_to_five_values(self):
+        sketch = QuantileSketch((3,), [0.25, 0.5])
+
+        sketch.add_grid(np.array([1.0, 2.0, np.NaN]))
+        sketch.add_grid(np.array([3.0, 4.0, np.NaN]))
+        sketch.add_grid(np.array([5.0, 6.0, 7.0]))
+
+        expected = np.quantile([[1.0, 3.0, 5.0], [2.0, 4.0, 6.0]], [0.25, 0.5], axis=1)
+        quantiles = sketch.get_quantiles()
+        self.assertEqual((2, 3), quantiles.shape)
+        np.testing.assert_allclose(expected, quantiles[:, :2])
+        np.testing.assert_allclose([7.0, 7.0], quantiles[:, 2])
+        np.testing.assert_array_equal([3, 3, 1], sketch.get_count())
+
+    def test_get_quantiles_estimated(self):
+        random = np.random.RandomState(7)
+        members = random.normal(290.0, 1.5, (200, 4, 500)).astype(np.float32)
+
+        sketch = QuantileSketch((4, 500), [0.05, 0.5, 0.95])
+        for member in members:
+            sketch.add_grid(member)
+
+        quantiles = sketch.get_quantiles()
+        expected = np.quantile(members, [0.05, 0.5, 0.95], axis=0)
+        self.assertEqual((3, 4, 500), quantiles.shape)
+        self.assertLess(np.mean(np.abs(quantiles - expected)), 0.15)
+        self.assertTrue(np.all(quantiles[0] < quantiles[1]))
+        self.assertTrue(np.all(quantiles[1] < quantiles[2]))
+
+    def test_get_quantiles_no_values(self):
+        sketch = QuantileSketch((2, 2), [0.5])
+
+        self.assertTrue(np.all(np.isnan(sketch.get_quantiles())))
+
+    def test_to_from_arrays(self):
+        random = np.random.RandomState(8)
+        sketch = QuantileSketch((10,), [0.1, 0.9])
+        for index in range(12):
+            sketch.add_grid(random.uniform(size=10))
+
+        restored = QuantileSketch.from_arrays(sketch.to_arrays(prefix="sst."), prefix="sst.")
+        values = random.uniform(size=10)
+        sketch.add_grid(values)
+        restored.add_grid(values)
+
+        np.testing.assert_array_equal(sketch.get_quantiles(), restored.get_quantiles())
+
+    def test_invalid_probabilities(self):
+        try:
+            QuantileSketch((2, 2), [0.5, 1.0])
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_add_grid_wrong_shape(self):
+        sketch = QuantileSketch((2, 2), [0.5])
+
+        try:
+            sketch.add_grid(np.zeros(3))
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
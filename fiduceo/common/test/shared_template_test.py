@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+from unittest import mock
+
+import numpy as np
+
+from fiduceo.common.test import template_test_support
+from fiduceo.common.writer import shared_template
+from fiduceo.common.writer.shared_template import SharedTemplate
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+
+build_template = partial(template_test_support.build_template, time=True, names=True)
+
+
+def fill_rows(descriptor, start, end):
+    with SharedTemplate.attach(descriptor) as template:
+        template.arrays["bt"][start:end] = start
+        template.dataset["time"].data[start:end] = 0.5
+    return end
+
+
+class SharedTemplateTest(unittest.TestCase):
+
+    def test_from_schema(self):
+        schema = TemplateSchema.capture(build_template)
+
+        template = SharedTemplate.from_schema(schema, 40)
+        try:
+            self.assertTrue(build_template(40).identical(template.dataset))
+            self.assertEqual(["bt", "time", "srf"], [entry[0] for entry in template.descriptor.entries])
+            self.assertEqual(0, template.descriptor.entries[1][4] % 64)
+            self.assertIs(template.arrays["bt"], template.dataset["bt"].data)
+        finally:
+            template.close()
+
+    def test_from_dataset(self):
+        dataset = build_template(30)
+        dataset["bt"].data[3, 4] = 11
+
+        with SharedTemplate.from_dataset(dataset) as template:
+            self.assertTrue(dataset.identical(template.dataset))
+            self.assertEqual(dataset["bt"].encoding, template.dataset["bt"].encoding)
+
+            template.arrays["bt"][3, 4] = 12
+            self.assertEqual(12, template.dataset["bt"].data[3, 4])
+            self.assertEqual(11, dataset["bt"].data[3, 4])
+
+    def test_fill_in_worker_processes(self):
+        with SharedTemplate.from_dataset(build_template(40)) as template:
+            with ProcessPoolExecutor(max_workers=2) as executor:
+                list(executor.map(fill_rows, [template.descriptor] * 4, range(0, 40, 10), range(10, 50, 10)))
+
+            np.testing.assert_array_equal([0, 10, 20, 30], template.dataset["bt"].data[::10, 0])
+            self.assertTrue(np.all(template.dataset["time"].data == 0.5))
+
+    def test_fill_in_spawned_worker_processes(self):
+        with SharedTemplate.from_dataset(build_template(40)) as template:
+            # spawned workers share the resource tracker of this process, the block survives their exit
+            with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as executor:
+                list(executor.map(fill_rows, [template.descriptor] * 4, range(0, 40, 10), range(10, 50, 10)))
+
+            np.testing.assert_array_equal([0, 10, 20, 30], template.dataset["bt"].data[::10, 0])
+            SharedTemplate.attach(template.descriptor).close()
+
+    def test_fill_in_independent_process(self):
+        with SharedTemplate.from_dataset(build_template(40)) as template:
+            # the process has a resource tracker of its own, it must not unlink the block when the process exits
+            script = "import pickle, sys\nfrom fiduceo.common.test.shared_template_test import fill_rows\nfill_rows(pickle.loads(bytes.fromhex(sys.argv[1])), 10, 20)"
+            result = subprocess.run([sys.executable, "-c", script, pickle.dumps(template.descriptor).hex()], stderr=subprocess.PIPE, timeout=60)
+            self.assertEqual(0, result.returncode, result.stderr)
+            self.assertNotIn(b"leaked", result.stderr)
+
+            self.assertEqual(10, template.dataset["bt"].data[15, 0])
+            SharedTemplate.attach(template.descriptor).close()
+
+    def test_tracker_identity(self):
+        with SharedTemplate.from_dataset(build_template(10)) as template:
+            if shared_template.ATTACH_REGISTERS and os.name == "posix":
+                self.assertIsNotNone(template.descriptor.tracker)
+            else:
+                self.assertIsNone(template.descriptor.tracker)
+
+    def test_attach_without_registration(self):
+        shared_memory_class = shared_memory.SharedMemory
+        tracked = []
+
+        def attach(name, track=True):
+            tracked.append(track)
+            return shared_memory_class(name=name)
+
+        with SharedTemplate.from_dataset(build_template(10)) as template:
+            with mock.patch.object(shared_template, "ATTACH_REGISTERS", False), mock.patch.object(shared_memory, "SharedMemory", side_effect=attach):
+                SharedTemplate.attach(template.descriptor).close()
+
+        self.assertEqual([False], tracked)
+
+    def test_close_releases_shared_memory(self):
+        template = SharedTemplate.from_dataset(build_template(10))
+        descriptor = template.descriptor
+
+        template.close()
+        template.close()
+
+        self.assertIsNone(template.dataset)
+        with self.assertRaises(FileNotFoundError):
+            SharedTemplate.attach(descriptor)
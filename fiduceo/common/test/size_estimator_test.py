@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.test.template_test_support import build_template
+from fiduceo.common.writer.size_estimator import CompressionModel, SizeEstimator
+from fiduceo.common.writer.template_schema import TemplateSchema
+from fiduceo.common.writer.default_data import DefaultData
+
+
+class CompressionModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_ratio(self):
+        model = CompressionModel(default_ratio=0.8)
+        model.add("bt", 1000, 300)
+        model.add("bt", 3000, 100)
+
+        self.assertAlmostEqual(0.1, model.get_ratio("bt"))
+        self.assertAlmostEqual(0.8, model.get_ratio("flags"))
+
+    def test_add_report(self):
+        report = dict([("variables", dict([("bt", dict([("raw_bytes", 400), ("compressed_bytes", 100)]))]))])
+
+        model = CompressionModel()
+        model.add_report(report)
+
+        self.assertAlmostEqual(0.25, model.get_ratio("bt"))
+
+    def test_save_load(self):
+        model = CompressionModel(default_ratio=0.5)
+        model.add("flags", 2000, 50)
+
+        file = os.path.join(self.temp_dir, "model.json")
+        model.save(file)
+        loaded = CompressionModel.load(file)
+
+        self.assertAlmostEqual(0.5, loaded.default_ratio)
+        self.assertAlmostEqual(0.025, loaded.get_ratio("flags"))
+
+    def test_calibrate(self):
+        dataset = xr.Dataset()
+        dataset["bt"] = Variable(["y", "x"], np.random.rand(200, 50).astype(np.float32))
+        dataset["flags"] = Variable(["y", "x"], np.zeros([200, 50], dtype=np.uint8))
+        dataset["scaled"] = Variable(["y", "x"], np.ones([200, 50], dtype=np.float32))
+        dataset["scaled"].encoding = dict([("dtype", np.int16), ("scale_factor", 0.01)])
+        file = os.path.join(self.temp_dir, "sample.nc")
+        dataset.to_netcdf(file, format="netCDF4", engine="netcdf4")
+
+        model = CompressionModel()
+        model.calibrate(file, compression_level=5)
+
+        self.assertGreater(model.get_ratio("bt"), 0.5)
+        self.assertLess(model.get_ratio("bt"), 1.1)
+        self.assertLess(model.get_ratio("flags"), 0.01)
+        # packed as int16, referenced to the float32 data in memory
+        expected = len(zlib.compress(CompressionModel._shuffle(np.full([200, 50], 100, np.int16)), 5)) / 40000
+        self.assertAlmostEqual(expected, model.get_ratio("scaled"))
+
+    def test_calibrate_schema(self):
+        def build_scaled_template(height):
+            dataset = xr.Dataset()
+            dataset["scaled"] = Variable(["y", "x"], DefaultData.create_default_array(50, height, np.float64))
+            dataset["scaled"].encoding = dict([("dtype", np.int16), ("scale_factor", 0.01)])
+            return dataset
+
+        dataset = build_scaled_template(200)
+        dataset["scaled"].data[:] = 1.0
+        file = os.path.join(self.temp_dir, "sample.nc")
+        dataset.to_netcdf(file, format="netCDF4", engine="netcdf4")
+
+        model = CompressionModel()
+        model.calibrate(file, compression_level=5, schema=TemplateSchema.capture(build_scaled_template))
+
+        # referenced to the float64 data of the template
+        expected = len(zlib.compress(CompressionModel._shuffle(np.full([200, 50], 100, np.int16)), 5)) / 80000
+        self.assertAlmostEqual(expected, model.get_ratio("scaled"))
+
+    def test_calibrate_sampled_rows(self):
+        dataset = xr.Dataset()
+        dataset["bt"] = Variable(["y", "x"], np.random.rand(200, 50).astype(np.float32))
+        file = os.path.join(self.temp_dir, "sample.nc")
+        dataset.to_netcdf(file, format="netCDF4", engine="netcdf4")
+
+        model = CompressionModel()
+        model.calibrate(file, sample_bytes=2000)
+
+        self.assertEqual(2000, model._samples["bt"][0])
+
+
+class SizeEstimatorTest(unittest.TestCase):
+
+    def test_estimate_schema(self):
+        schema = TemplateSchema.capture(build_template)
+        model = CompressionModel()
+        model.add("bt", 100, 50)
+        model.add("y", 100, 10)
+
+        estimate = SizeEstimator.estimate_schema(schema, 1000, model)
+
+        self.assertEqual(16000 + 2000 + 12, estimate.memory_bytes)
+        self.assertEqual(int(1.5 * estimate.memory_bytes), estimate.write_memory_bytes)
+        self.assertEqual(8000 + 200 + 12, estimate.file_bytes)
+        self.assertEqual((16000, 8000), estimate.variables["bt"])
+        self.assertEqual((12, 12), estimate.variables["srf"])
+
+    def test_estimate_dataset(self):
+        dataset = build_template(1000)
+
+        estimate = SizeEstimator.estimate_dataset(dataset)
+
+        self.assertEqual(dataset.nbytes, estimate.memory_bytes)
+        self.assertEqual(dataset.nbytes, estimate.file_bytes)
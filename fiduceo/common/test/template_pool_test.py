@@ -0,0 +1,114 @@
+import unittest
+from functools import partial
+
+import numpy as np
+
+from fiduceo.common.test import template_test_support
+from fiduceo.common.writer import template_pool
+from fiduceo.common.writer.template_pool import TemplatePool
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+
+build_template = partial(template_test_support.build_template, radiance=True)
+
+
+class TemplatePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        TemplateSchema.clear_cache()
+        self.pool = TemplatePool(bucket_size=100)
+
+    def tearDown(self):
+        self.pool.close()
+        TemplateSchema.clear_cache()
+
+    def test_acquire_equals_template(self):
+        dataset = self.pool.acquire("test", build_template, 130)
+
+        self.assertTrue(build_template(130).identical(dataset))
+        self.assertEqual((130, 8), dataset["bt"].shape)
+        self.assertEqual((3, 130, 8), dataset["rad"].shape)
+
+    def test_acquire_reuses_and_resets_buffer(self):
+        dataset = self.pool.acquire("test", build_template, 180)
+        dataset["bt"].data[:] = 12
+        dataset["rad"].data[1, 170, 3] = 2.5
+        dataset["srf"].data[0] = 1.0
+        dataset["bt"].attrs["units"] = "K"
+        bt_data = dataset["bt"].data
+        self.pool.release(dataset)
+
+        dataset = self.pool.acquire("test", build_template, 150)
+
+        self.assertTrue(np.shares_memory(bt_data, dataset["bt"].data))
+        self.assertTrue(build_template(150).identical(dataset))
+        self.assertEqual(-32767, bt_data[179, 0])  # reset beyond the current height as well
+
+    def test_acquire_reset_in_blocks(self):
+        original_block_bytes = template_pool.RESET_BLOCK_BYTES
+        template_pool.RESET_BLOCK_BYTES = 100
+        try:
+            dataset = self.pool.acquire("test", build_template, 180)
+            dataset["rad"].data[:] = 1.0
+            self.pool.release(dataset)
+
+            dataset = self.pool.acquire("test", build_template, 180)
+            self.assertTrue(build_template(180).identical(dataset))
+        finally:
+            template_pool.RESET_BLOCK_BYTES = original_block_bytes
+
+    def test_acquire_in_use_buffer_not_shared(self):
+        first = self.pool.acquire("test", build_template, 150)
+        second = self.pool.acquire("test", build_template, 160)
+
+        self.assertFalse(np.shares_memory(first["bt"].data, second["bt"].data))
+
+    def test_acquire_different_bucket(self):
+        dataset = self.pool.acquire("test", build_template, 150)
+        bt_data = dataset["bt"].data
+        self.pool.release(dataset)
+
+        dataset = self.pool.acquire("test", build_template, 250)
+
+        self.assertFalse(np.shares_memory(bt_data, dataset["bt"].data))
+
+    def test_acquire_below_chunk_size_not_pooled(self):
+        dataset = self.pool.acquire("test", build_template, 50)
+
+        self.assertTrue(build_template(50).identical(dataset))
+        self.pool.release(dataset)
+        self.assertEqual(0, len(self.pool._idle))
+
+    def test_release_max_idle(self):
+        pool = TemplatePool(bucket_size=100, max_idle=1)
+        first = pool.acquire("test", build_template, 150)
+        second = pool.acquire("test", build_template, 150)
+
+        pool.release(first)
+        pool.release(second)
+        pool.release(build_template(150))
+
+        self.assertEqual(1, len(pool._idle[("test", 200)]))
+
+    def test_close(self):
+        with TemplatePool(bucket_size=100) as pool:
+            dataset = pool.acquire("test", build_template, 150)
+            pool.release(dataset)
+            dataset = pool.acquire("test", build_template, 150)
+            pool.release(dataset)
+            executor = pool._executor
+            self.assertIsNotNone(executor)
+
+        self.assertEqual(0, len(pool._idle))
+        self.assertIsNone(pool._executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+
+    def test_get_bucket(self):
+        self.assertEqual(100, self.pool.get_bucket(1))
+        self.assertEqual(100, self.pool.get_bucket(100))
+        self.assertEqual(200, self.pool.get_bucket(101))
+
+    def test_invalid_bucket_size(self):
+        with self.assertRaises(ValueError):
+            TemplatePool(bucket_size=0)
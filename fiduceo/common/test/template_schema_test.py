@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+
+from fiduceo.common.test.template_test_support import build_schema_template
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+
+class TemplateSchemaTest(unittest.TestCase):
+    def setUp(self):
+        TemplateSchema.clear_cache()
+
+    def tearDown(self):
+        TemplateSchema.clear_cache()
+
+    def test_capture(self):
+        schema = TemplateSchema.capture(build_schema_template)
+
+        self.assertEqual(["bt", "y", "channel", "time", "bt_scaled"], schema.variable_names)
+        self.assertEqual(512, schema.min_height)
+        self.assertEqual(dict([("y", 7), ("x", 4), ("channel", 3), ("t", 15)]), dict(schema.get_dim_sizes(7)))
+
+    def test_create_equals_template(self):
+        for height in [512, 1200]:
+            dataset = TemplateSchema.create("test", build_schema_template, height)
+            expected = build_schema_template(height)
+
+            self.assertTrue(expected.identical(dataset))
+            self.assertEqual(list(expected.variables), list(dataset.variables))
+            self.assertEqual(list(expected.coords), list(dataset.coords))
+            for var_name in expected.variables:
+                self.assertEqual(expected.variables[var_name].encoding, dataset.variables[var_name].encoding)
+
+    def test_create_instances_are_independent(self):
+        first = TemplateSchema.create("test", build_schema_template, 600)
+        first["bt"].data[0, 0] = 12
+        first["bt"].attrs["units"] = "K"
+        first["bt"].encoding["chunksizes"] = (1, 1)
+        first.attrs["title"] = "changed"
+
+        second = TemplateSchema.create("test", build_schema_template, 600)
+        self.assertEqual(-32767, second["bt"].data[0, 0])
+        self.assertNotIn("units", second["bt"].attrs)
+        self.assertEqual((512, 4), second["bt"].encoding["chunksizes"])
+        self.assertEqual("test template", second.attrs["title"])
+
+    def test_create_height_below_chunk_size(self):
+        dataset = TemplateSchema.create("test", build_schema_template, 100)
+
+        self.assertEqual(100, dataset.dims["y"])
+        self.assertTrue(build_schema_template(100).identical(dataset))
+
+    def test_create_not_capturable(self):
+        def build_filled_template(height):
+            dataset = build_schema_template(height)
+            dataset["bt"].data[:, 0] = 5  # writes into a default array
+            return dataset
+
+        self.assertIsNone(TemplateSchema.get("filled", build_filled_template))
+
+        dataset = TemplateSchema.create("filled", build_filled_template, 600)
+        self.assertEqual(5, dataset["bt"].data[12, 0])
+
+    def test_capture_raises_template_errors(self):
+        def build_broken_template(height):
+            raise KeyError("bt")
+
+        with self.assertRaises(KeyError):
+            TemplateSchema.capture(build_broken_template)
+
+    def test_introspection(self):
+        schema = TemplateSchema.capture(build_schema_template)
+
+        bt = schema.get_variable("bt")
+        self.assertEqual(("y", "x"), bt.dims)
+        self.assertEqual(np.int16, bt.dtype)
+        self.assertEqual(0.01, bt.attrs["scale_factor"])
+        self.assertEqual((512, 4), bt.encoding["chunksizes"])
+        self.assertFalse(bt.is_virtual)
+        self.assertIsNone(bt.expression)
+        self.assertIsNone(schema.get_variable("rad"))
+
+        self.assertEqual(dict([("bt_scaled", "bt * 0.01")]), schema.get_virtual_variables())
+        self.assertEqual(build_schema_template(1000).nbytes, schema.get_nbytes(1000))
+
+    def test_to_dict_from_dict(self):
+        schema = TemplateSchema.capture(build_schema_template)
+
+        description = schema.to_dict()
+        self.assertEqual(dict([("factor", 1), ("offset", 0)]), description["dimensions"]["y"])
+        self.assertEqual(dict([("factor", 2), ("offset", 1)]), description["dimensions"]["t"])
+        self.assertEqual("<i2", description["variables"]["bt"]["dtype"])
+        self.assertEqual("fill", description["variables"]["bt"]["data"])
+        self.assertEqual("range", description["variables"]["y"]["data"])
+        self.assertEqual("literal", description["variables"]["channel"]["data"])
+
+        dataset = TemplateSchema.from_dict(description).instantiate(700)
+        self.assertTrue(build_schema_template(700).identical(dataset))
+
+    def test_validate(self):
+        schema = TemplateSchema.capture(build_schema_template)
+
+        dataset = build_schema_template(600)
+        self.assertEqual([], schema.validate(dataset))
+
+        dataset = dataset.drop_vars("time")
+        dataset["bt"] = dataset["bt"].astype(np.float32)
+        self.assertEqual(["bt: data type float32, expected int16", "missing variable: time"], schema.validate(dataset))
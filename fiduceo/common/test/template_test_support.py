@@ -0,0 +1,92 @@
+import numpy as np
+import xarray as xr
+from xarray import Variable, IndexVariable
+
+from fiduceo.common.writer.default_data import DefaultData
+
+
+def build_template(height, chunk_width=8, radiance=False, time=False, scalar=False, names=False):
+    """
+    Template of the writer tests: a packed brightness temperature image "bt", the index coordinate "y" and the
+    spectral response vector "srf", with optional further variables.
+    :param height: the height of the product
+    :param chunk_width: the chunk width of "bt"
+    :param radiance: set true to add the 3D default array "rad"
+    :param time: set true to add the default vector "time" along "y"
+    :param scalar: set true to add the scalar "distance"
+    :param names: set true to add the object array "names"
+    :return the template dataset
+     """
+    dataset = xr.Dataset()
+    dataset.attrs["title"] = "test template"
+
+    variable = Variable(["y", "x"], DefaultData.create_default_array(8, height, np.int16))
+    variable.attrs["scale_factor"] = 0.01
+    variable.encoding = dict([("_FillValue", -32767), ("chunksizes", (64, chunk_width))])
+    dataset["bt"] = variable
+
+    dataset["y"] = IndexVariable("y", np.arange(height, dtype=np.uint16))
+
+    if radiance:
+        dataset["rad"] = Variable(["channel", "y", "x"], DefaultData.create_default_array_3d(8, height, 3, np.float32))
+
+    if time:
+        variable = Variable(["y"], DefaultData.create_default_vector(height, np.float32))
+        variable.encoding = dict([("chunksizes", (64,))])
+        dataset["time"] = variable
+
+    dataset["srf"] = Variable(["channel"], np.array([0.5, 0.6, 0.7], dtype=np.float32))
+
+    if scalar:
+        dataset["distance"] = Variable([], np.float32(1.5))
+
+    if names:
+        dataset["names"] = Variable(["n"], np.array(["a", "bc"], dtype=object))
+    return dataset
+
+
+def build_schema_template(height):
+    """
+    Template covering all kinds of variables represented by a schema: default data, index ranges, literal data, a
+    dimension derived from the height and a virtual variable.
+    :param height: the height of the product
+    :return the template dataset
+     """
+    dataset = xr.Dataset()
+    dataset.attrs["title"] = "test template"
+
+    default_array = DefaultData.create_default_array(4, height, np.int16, dims_names=["y", "x"])
+    variable = Variable(["y", "x"], default_array)
+    variable.attrs["scale_factor"] = 0.01
+    variable.encoding = dict([("_FillValue", -32767), ("chunksizes", (512, 4))])
+    dataset["bt"] = variable
+
+    dataset["y"] = IndexVariable("y", np.arange(height, dtype=np.uint16))
+    dataset["channel"] = IndexVariable("channel", np.array([3, 4, 5], dtype=np.int8))
+
+    default_vector = DefaultData.create_default_vector(2 * height + 1, np.float32)
+    dataset["time"] = Variable(["t"], default_vector)
+
+    variable = Variable([], np.float32(0.0))
+    variable.attrs["virtual"] = "true"
+    variable.attrs["expression"] = "bt * 0.01"
+    dataset["bt_scaled"] = variable
+    return dataset
+
+
+def build_packed_template(height):
+    """
+    Template with floating point data packed to integers when written, "angle", and unpacked variables.
+    :param height: the height of the product
+    :return the template dataset
+     """
+    dataset = xr.Dataset()
+    variable = Variable(["y", "x"], DefaultData.create_default_array(4, height, np.float32, fill_value=np.NaN))
+    variable.encoding = dict([("dtype", np.int16), ("scale_factor", 0.01), ("add_offset", 100.0), ("_FillValue", -32768)])
+    dataset["angle"] = variable
+
+    variable = Variable(["y", "x"], DefaultData.create_default_array(4, height, np.float32))
+    variable.encoding = dict([("dtype", np.float32)])
+    dataset["radiance"] = variable
+    dataset["scanline"] = Variable(["y"], DefaultData.create_default_vector(height, np.int16))
+    return dataset
@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.common.writer.variable_statistics import VariableStatistics
+
+
+class VariableStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = xr.Dataset()
+
+        data = np.array([[1.0, 2.0], [3.0, np.NaN]], dtype=np.float32)
+        self.dataset["brightness"] = Variable(["y", "x"], data)
+
+        data = np.array([[10, 65535], [20, 30]], dtype=np.uint16)
+        variable = Variable(["y", "x"], data)
+        variable.attrs["_FillValue"] = 65535
+        self.dataset["counts"] = variable
+
+        self.dataset["time"] = Variable(["y"], np.array(["2017-01-01", "2017-01-02"], dtype="datetime64[ns]"))
+
+    def test_calculate(self):
+        statistics = VariableStatistics.calculate(self.dataset)
+
+        self.assertEqual(["brightness", "counts"], sorted(statistics.keys()))
+        self.assertEqual(3, statistics["brightness"]["valid_count"])
+        self.assertAlmostEqual(2.0, statistics["brightness"]["mean"], 6)
+        self.assertEqual(10, statistics["counts"]["min"])
+        self.assertEqual(30, statistics["counts"]["max"])
+        self.assertEqual(3, statistics["counts"]["valid_count"])
+
+    def test_calculate_packed(self):
+        variable = Variable(["y", "x"], np.array([[10, -32768], [20, 40]], dtype=np.int16))
+        variable.attrs["_FillValue"] = -32768
+        variable.attrs["scale_factor"] = -0.5
+        variable.attrs["add_offset"] = 100.0
+        self.dataset["angle"] = variable
+
+        statistics = VariableStatistics.calculate(self.dataset)["angle"]
+
+        self.assertEqual(3, statistics["valid_count"])
+        self.assertAlmostEqual(80.0, statistics["min"], 8)
+        self.assertAlmostEqual(95.0, statistics["max"], 8)
+        self.assertAlmostEqual(88.333333, statistics["mean"], 6)
+        self.assertAlmostEqual(0.5 * np.std([10, 20, 40]), statistics["std"], 6)
+
+    def test_apply(self):
+        VariableStatistics.apply(self.dataset)
+
+        attributes = self.dataset["brightness"].attrs
+        self.assertEqual(3, attributes["valid_count"])
+        self.assertAlmostEqual(0.25, attributes["fill_fraction"], 8)
+        self.assertAlmostEqual(1.0, attributes["data_min"], 8)
+        self.assertAlmostEqual(3.0, attributes["data_max"], 8)
+        self.assertAlmostEqual(2.0, attributes["data_mean"], 6)
+        self.assertAlmostEqual(np.sqrt(2.0 / 3.0), attributes["data_std"], 6)
+
+        attributes = self.dataset["counts"].attrs
+        self.assertAlmostEqual(0.25, attributes["fill_fraction"], 8)
+        self.assertAlmostEqual(20.0, attributes["data_mean"], 8)
+
+        self.assertNotIn("valid_count", self.dataset["time"].attrs)
+
+    def test_apply_precalculated_statistics(self):
+        statistics = {"counts": dict(count=4, valid_count=0, min=np.nan, max=np.nan, mean=np.nan, std=np.nan)}
+
+        VariableStatistics.apply(self.dataset, statistics=statistics)
+
+        self.assertEqual(1.0, self.dataset["counts"].attrs["fill_fraction"])
+        self.assertTrue(np.isnan(self.dataset["counts"].attrs["data_mean"]))
+        self.assertNotIn("valid_count", self.dataset["brightness"].attrs)
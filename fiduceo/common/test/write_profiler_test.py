@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fiduceo.common.writer.write_profiler import WriteProfiler
+
+
+class WriteProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.target_path = os.path.join(self.temp_dir, "write_profiler_test.nc")
+        with open(self.target_path, "wb") as target:
+            target.write(b"0123456789")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_phase(self):
+        profiler = WriteProfiler()
+
+        with profiler.phase("flag_mapping"):
+            time.sleep(0.01)
+        with profiler.phase("flag_mapping"):
+            time.sleep(0.01)
+        with profiler.phase("encoding"):
+            pass
+
+        report = profiler.finish(self.target_path, 100)
+        self.assertEqual(["flag_mapping", "encoding"], list(report["phases"].keys()))
+        self.assertTrue(report["phases"]["flag_mapping"] >= 0.02)
+
+    def test_phase_exception_is_measured_and_raised(self):
+        profiler = WriteProfiler()
+
+        try:
+            with profiler.phase("validation"):
+                raise ValueError("invalid")
+        except ValueError:
+            pass
+
+        report = profiler.finish(self.target_path, 100)
+        self.assertIn("validation", report["phases"])
+
+    def test_finish(self):
+        reports = []
+        profiler = WriteProfiler(callback=reports.append)
+        profiler.add_variable("brightness", 0.5, 2000, 300)
+
+        report = profiler.finish(self.target_path, 4000)
+
+        self.assertEqual([report], reports)
+        self.assertEqual([report], profiler.reports)
+        self.assertEqual(self.target_path, report["file"])
+        self.assertEqual(4000, report["raw_bytes"])
+        self.assertEqual(10, report["compressed_bytes"])
+        self.assertTrue(report["seconds"] > 0.0)
+        self.assertEqual({"seconds": 0.5, "raw_bytes": 2000, "compressed_bytes": 300, "throughput": 4000.0}, dict(report["variables"]["brightness"]))
+
+    def test_finish_starts_new_report(self):
+        profiler = WriteProfiler()
+        profiler.add_variable("brightness", 0.5, 2000, 300)
+        profiler.finish(self.target_path, 4000)
+
+        report = profiler.finish(self.target_path, 4000)
+
+        self.assertEqual(0, len(report["variables"]))
+        self.assertEqual(2, len(profiler.reports))
+
+    def test_disabled(self):
+        profiler = WriteProfiler.disabled()
+
+        with profiler.phase("encoding"):
+            pass
+        profiler.add_variable("brightness", 0.5, 2000, 300)
+
+        self.assertFalse(profiler.enabled)
+        self.assertIsNone(profiler.finish(self.target_path, 100))
+        self.assertEqual(0, len(profiler.reports))
+
+    def test_format_report(self):
+        profiler = WriteProfiler()
+        profiler.add_variable("fast", 0.1, 1000000, 1000)
+        profiler.add_variable("slow", 2.0, 1000000, 5000)
+
+        text = WriteProfiler.format_report(profiler.finish(self.target_path, 2000000))
+
+        lines = text.split("\n")
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[0].startswith(self.target_path + ": "))
+        self.assertTrue(lines[1].startswith("  var   slow"))
+        self.assertTrue(lines[2].startswith("  var   fast"))
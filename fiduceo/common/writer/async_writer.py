@@ -0,0 +1,120 @@
+import atexit
+import logging
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+
+DEFAULT_MAX_PENDING = 2
+
+
+class AsyncWriter:
+    """
+    Writes datasets in a background thread so that the calling code can compute the next product while the previous one
+    is compressed and written. The number of queued datasets is bounded, submitting blocks while the queue is full.
+    Submitted datasets must not be modified until their future is done.
+
+    Callers must call flush() or shutdown() before the interpreter exits. Datasets still pending then are written by
+    an atexit handler, after the thread pools of concurrent.futures are shut down: writes using them, e.g. of dask
+    backed data or with statistics, fail. Failures of these writes are logged, nobody reads their futures anymore.
+    """
+
+    def __init__(self, write_function, max_pending=DEFAULT_MAX_PENDING):
+        """
+        :param write_function: the function writing a dataset, signature write_function(ds, file, **write_args)
+        :param max_pending: the maximal number of datasets waiting to be written, in addition to the one being written
+         """
+        self.write_function = write_function
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._shutdown = False
+        self._shutdown_lock = threading.Lock()
+        self._exiting = False
+        # a daemon thread, so that an idle writer does not block the interpreter exit before the atexit handler runs
+        self._thread = threading.Thread(target=self._run, name="AsyncWriter", daemon=True)
+        self._thread.start()
+        AsyncWriter._register_exit_hook(weakref.ref(self))
+
+    def submit(self, ds, file, **write_args):
+        """
+        Queue a dataset for writing. Blocks while the maximal number of datasets is pending.
+        :param ds: the dataset
+        :param file: the target file path
+        :param write_args: further keyword arguments passed to the write function
+        :return concurrent.futures.Future, its result is the file path
+         """
+        # queued while holding the lock, so that no dataset is queued behind the end marker of shutdown()
+        with self._shutdown_lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit writes after shutdown")
+
+            future = Future()
+            self._queue.put((future, ds, file, write_args))
+            return future
+
+    def flush(self):
+        """
+        Wait until all datasets submitted so far are written.
+         """
+        self._queue.join()
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting new datasets. All datasets already submitted are still written.
+        :param wait: set true to wait until the pending datasets are written
+         """
+        with self._shutdown_lock:
+            if not self._shutdown:
+                self._shutdown = True
+                self._queue.put(None)
+
+        if wait:
+            self._thread.join()
+
+    @staticmethod
+    def _register_exit_hook(reference):
+        def drain():
+            writer = reference()
+            if writer is not None:
+                writer._exiting = True
+                writer.shutdown()
+
+        atexit.register(drain)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                future, ds, file, write_args = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    self.write_function(ds, file, **write_args)
+                    future.set_result(file)
+                except BaseException as e:
+                    if self._exiting:
+                        logging.getLogger(__name__).error("writing %s failed at interpreter exit", file, exc_info=e)
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+class DefaultAsyncWriter:
+    """
+    Lazily created, process wide AsyncWriter instances, one per write function. Flush them before the interpreter exits, see AsyncWriter.
+    """
+    _writers = dict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(write_function):
+        with DefaultAsyncWriter._lock:
+            writer = DefaultAsyncWriter._writers.get(write_function)
+            if writer is None:
+                writer = AsyncWriter(write_function)
+                DefaultAsyncWriter._writers[write_function] = writer
+
+            return writer
@@ -0,0 +1,248 @@
+import json
+import os
+import time
+import uuid
+
+import dask
+import netCDF4
+import numpy as np
+import xarray as xr
+
+from fiduceo.common.writer.chunked_writer import ChunkedWriter
+from fiduceo.common.writer.write_profiler import WriteProfiler, WRITE, COMMIT, STATISTICS
+
+PART_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".journal"
+
+# the encoding entries of a variable recorded in the journal - a repeated write with different values starts from scratch
+JOURNAL_ENCODING = ("dtype", "zlib", "complevel", "chunksizes", "scale_factor", "add_offset")
+
+
+class AtomicWriter:
+    """
+    Writes datasets to NetCDF so that the target file either does not exist or is complete. Data is written to a temporary
+    file in the target directory which is renamed to the target in one atomic step once the write succeeded.
+    Resumable writes keep a progress journal next to the target file and continue after the last completed variable
+    when a write is repeated after an interruption.
+
+    Computations depending on the data, e.g. statistics stored as attributes, are computed together with the chunks of
+    streamed datasets, so that dask backed data is evaluated only once; the attributes are added to the file before it
+    is committed. Otherwise, they are computed before writing, for profiled and resumable writes evaluating dask backed
+    data once more.
+    """
+
+    @staticmethod
+    def write(ds, file, encoding, resume=False, profiler=None, scheduler=None, computations=None, finalise=None):
+        """
+        Write the dataset to a NetCDF4 file. An existing target file is replaced only when writing succeeded.
+        :param ds: the dataset
+        :param file: the target file path
+        :param encoding: dictionary variable name -> encoding, as used by xarray.Dataset.to_netcdf()
+        :param resume: set true to write variable by variable, journaling the progress so that an interrupted write can be continued
+        :param profiler: WriteProfiler receiving the write time and compressed size of every variable, optional
+        :param scheduler: the dask scheduler streaming dask backed datasets to the file, "threads" (default) or "processes"
+        :param computations: callable receiving the dataset and returning dask collections, or nested lists and dictionaries of them, depending on its data,
+        e.g. lazy statistics, optional. Streamed datasets are passed with the dask backed data as stored, see ChunkedWriter.write()
+        :param finalise: callable receiving the computed computations, sets attributes derived from them on the dataset and returns them as dictionary
+        variable name -> dictionary attribute name -> value. It may raise an exception to reject the data, the target file is not written then
+         """
+        if profiler is None:
+            profiler = WriteProfiler.disabled()
+
+        streamed = resume is not True and not profiler.enabled and ChunkedWriter.is_chunked(ds)
+        if computations is not None and not streamed:
+            with profiler.phase(STATISTICS):
+                results = dask.compute(computations(ds))[0]
+            if finalise is not None:
+                finalise(results)
+
+        if resume is True:
+            AtomicWriter._write_resumable(ds, file, encoding, profiler)
+            return
+
+        temp_file = AtomicWriter.get_temp_file_path(file)
+        try:
+            with profiler.phase(WRITE):
+                if profiler.enabled:
+                    # variable by variable, to measure the time and the compressed size of each of them
+                    ds.drop_vars(list(ds.data_vars)).to_netcdf(temp_file, mode='w', format='netCDF4', engine='netcdf4')
+                    for var_name in ds.data_vars:
+                        AtomicWriter._append_variable(ds, var_name, temp_file, encoding, profiler)
+                elif streamed:
+                    results = ChunkedWriter.write(ds, temp_file, encoding, scheduler=scheduler, computations=computations)
+                    if computations is not None and finalise is not None:
+                        AtomicWriter._add_attributes(temp_file, finalise(results))
+                else:
+                    ds.to_netcdf(temp_file, format='netCDF4', engine='netcdf4', encoding=encoding)
+
+            with profiler.phase(COMMIT):
+                AtomicWriter.commit(temp_file, file)
+        except BaseException:
+            AtomicWriter._remove_if_exists(temp_file)
+            raise
+
+    @staticmethod
+    def commit(temp_file, file):
+        """
+        Rename a completely written file to its target. The data is flushed to disk before the rename, and the rename
+        afterwards, so that the target file is complete after a crash at any time.
+        :param temp_file: the written file, in the directory of the target file
+        :param file: the target file path, an existing file is replaced
+         """
+        AtomicWriter._sync(temp_file)
+        os.replace(temp_file, file)
+        if os.name == "posix":
+            AtomicWriter._sync(os.path.dirname(os.path.abspath(file)))
+
+    @staticmethod
+    def get_temp_file_path(file):
+        """
+        Create a unique, hidden temporary file path in the directory of the target file. Using the same directory
+        (and file system) guarantees that the final rename is atomic.
+        :param file: the target file path
+        :return the temporary file path
+         """
+        target_dir, file_name = os.path.split(os.path.abspath(file))
+        return os.path.join(target_dir, "." + file_name + "." + uuid.uuid4().hex[:12] + ".tmp")
+
+    @staticmethod
+    def get_part_file_path(file):
+        return file + PART_SUFFIX
+
+    @staticmethod
+    def get_journal_file_path(file):
+        return file + JOURNAL_SUFFIX
+
+    @staticmethod
+    def _write_resumable(ds, file, encoding, profiler):
+        part_file = AtomicWriter.get_part_file_path(file)
+        journal_file = AtomicWriter.get_journal_file_path(file)
+
+        header = AtomicWriter._create_journal_header(ds, encoding)
+        completed = AtomicWriter._read_journal(journal_file, header)
+        if completed is None or not AtomicWriter._is_readable(part_file):
+            # no valid journal, or the part file was damaged by the interruption
+            AtomicWriter._write_skeleton(ds, part_file, journal_file, header)
+            completed = set()
+
+        with profiler.phase(WRITE), open(journal_file, "a") as journal:
+            for var_name in ds.data_vars:
+                if var_name in completed:
+                    continue
+
+                # variables interrupted while being written are overwritten in place by xarray's append mode
+                AtomicWriter._append_variable(ds, var_name, part_file, encoding, profiler)
+
+                journal.write(json.dumps({"completed": var_name}) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+        with profiler.phase(COMMIT):
+            AtomicWriter.commit(part_file, file)
+            AtomicWriter._remove_if_exists(journal_file)
+
+    @staticmethod
+    def _append_variable(ds, var_name, target_file, encoding, profiler):
+        variable = ds.variables[var_name]
+        var_dataset = xr.Dataset({var_name: variable})
+        var_encoding = {var_name: encoding[var_name]} if var_name in encoding else None
+
+        if not profiler.enabled:
+            var_dataset.to_netcdf(target_file, mode='a', format='netCDF4', engine='netcdf4', encoding=var_encoding)
+            return
+
+        size_before = os.path.getsize(target_file)
+        start = time.perf_counter()
+        var_dataset.to_netcdf(target_file, mode='a', format='netCDF4', engine='netcdf4', encoding=var_encoding)
+        seconds = time.perf_counter() - start
+        profiler.add_variable(var_name, seconds, variable.nbytes, os.path.getsize(target_file) - size_before)
+
+    @staticmethod
+    def _add_attributes(file, attributes):
+        with netCDF4.Dataset(file, "a") as dataset:
+            for var_name, var_attributes in attributes.items():
+                dataset.variables[var_name].setncatts(var_attributes)
+
+    @staticmethod
+    def _write_skeleton(ds, part_file, journal_file, header):
+        skeleton = ds.drop_vars(list(ds.data_vars))
+        skeleton.to_netcdf(part_file, mode='w', format='netCDF4', engine='netcdf4')
+
+        with open(journal_file, "w") as journal:
+            journal.write(json.dumps(header) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    @staticmethod
+    def _create_journal_header(ds, encoding):
+        dimensions = dict((str(name), int(size)) for name, size in ds.dims.items())
+        variables = dict((str(name), AtomicWriter._get_journal_encoding(ds.variables[name], encoding.get(name, dict()))) for name in ds.data_vars)
+        # normalised by a JSON round trip to compare equal to the header read from the journal
+        return json.loads(json.dumps({"dimensions": dimensions, "variables": variables}))
+
+    @staticmethod
+    def _get_journal_encoding(variable, var_encoding):
+        journal_encoding = dict()
+        for key in JOURNAL_ENCODING:
+            value = var_encoding.get(key, variable.attrs.get(key) if key in ("scale_factor", "add_offset") else None)
+            if value is None:
+                continue
+
+            if key == "dtype":
+                value = str(np.dtype(value))
+            elif isinstance(value, (tuple, list)):
+                value = [int(item) for item in value]
+            elif isinstance(value, np.generic):
+                value = value.item()
+            journal_encoding[key] = value
+        return journal_encoding
+
+    @staticmethod
+    def _is_readable(file):
+        if not os.path.isfile(file):
+            return False
+
+        try:
+            with netCDF4.Dataset(file, "r"):
+                return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _read_journal(journal_file, header):
+        if not os.path.isfile(journal_file):
+            return None
+
+        completed = set()
+        with open(journal_file, "r") as journal:
+            lines = journal.readlines()
+
+        if len(lines) == 0:
+            return None
+
+        try:
+            if json.loads(lines[0]) != header:
+                return None  # journal belongs to a different product layout - start from scratch
+        except ValueError:
+            return None
+
+        for line in lines[1:]:
+            try:
+                completed.add(json.loads(line)["completed"])
+            except (ValueError, KeyError):
+                break  # last line truncated by the interruption - all entries read so far are valid
+
+        return completed
+
+    @staticmethod
+    def _sync(path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _remove_if_exists(file):
+        if os.path.isfile(file):
+            os.remove(file)
@@ -0,0 +1,160 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import xarray as xr
+
+from fiduceo.common.writer.size_estimator import SizeEstimate, SizeEstimator
+
+
+class WriteJob:
+    """
+    A single product to be written by the BatchWriter.
+    :param source: the dataset, or a picklable callable without arguments that produces the dataset in the worker process
+    :param file: the target file path
+    :param memory_estimate: the expected peak memory in bytes needed to produce and write the dataset, or a SizeEstimate as returned by the writers' estimate_size(). If None, it is derived from the dataset size
+    :param write_args: further keyword arguments passed to the write function (compression_level, overwrite, ...)
+     """
+
+    def __init__(self, source, file, memory_estimate=None, **write_args):
+        self.source = source
+        self.file = file
+        self.memory_estimate = memory_estimate
+        self.write_args = write_args
+
+
+class BatchWriter:
+    """
+    Writes many products concurrently in a pool of worker processes. Jobs are scheduled largest first, the sum of the
+    memory estimates of all running jobs never exceeds the memory budget. A job larger than the budget is run alone.
+    If a worker process dies, the jobs running at that time fail and the pending jobs are written by a new pool.
+    """
+
+    def __init__(self, write_function, workers=None, memory_budget=None):
+        """
+        :param write_function: the function writing a dataset, signature write_function(ds, file, **write_args)
+        :param workers: the maximal number of worker processes, default is the number of CPUs
+        :param memory_budget: the maximal number of bytes used by all running jobs, default is unlimited
+         """
+        if workers is None:
+            workers = os.cpu_count()
+
+        self.write_function = write_function
+        self.workers = max(1, workers)
+        self.memory_budget = memory_budget
+
+    def write(self, jobs):
+        """
+        Write all jobs and wait until all of them finished.
+        :param jobs: iterable of WriteJob or (source, file) tuples
+        :return list of the files written, in the order of the jobs
+         """
+        jobs = [BatchWriter._to_job(job) for job in jobs]
+        estimates = [self._get_memory_estimate(job) for job in jobs]
+
+        pending = sorted(range(len(jobs)), key=lambda index: estimates[index], reverse=True)
+        running = dict()
+        running_bytes = 0
+        failures = []
+
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        submitted = 0
+        try:
+            while len(pending) > 0 or len(running) > 0:
+                broken = False
+                while len(pending) > 0:
+                    position = BatchWriter._select_next(pending, estimates, running_bytes, len(running), self.workers, self.memory_budget)
+                    if position is None:
+                        break
+
+                    index = pending[position]
+                    job = jobs[index]
+                    try:
+                        future = executor.submit(_write_job, self.write_function, job.source, job.file, job.write_args)
+                    except BrokenProcessPool as e:
+                        if submitted == 0:
+                            raise IOError("Worker processes terminated before writing " + job.file + ", " + str(len(pending)) + " of " + str(len(jobs)) + " products not written") from e
+                        broken = True
+                        break
+
+                    pending.pop(position)
+                    running[future] = index
+                    running_bytes += estimates[index]
+                    submitted += 1
+
+                if len(running) > 0:
+                    done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                    running_bytes -= self._collect(done, running, jobs, estimates, failures)
+                    broken = broken or any(isinstance(future.exception(), BrokenProcessPool) for future in done)
+
+                if broken:
+                    # a worker died - all jobs running in the pool fail, the pending jobs are written by a new pool
+                    done, _ = wait(list(running.keys()))
+                    running_bytes -= self._collect(done, running, jobs, estimates, failures)
+                    executor.shutdown(wait=True)
+                    executor = ProcessPoolExecutor(max_workers=self.workers)
+                    submitted = 0
+        finally:
+            executor.shutdown(wait=True)
+
+        if len(failures) > 0:
+            messages = [file + ": " + str(exception) for file, exception in failures]
+            raise IOError("Writing failed for " + str(len(failures)) + " of " + str(len(jobs)) + " products: " + "; ".join(messages)) from failures[0][1]
+
+        return [job.file for job in jobs]
+
+    @staticmethod
+    def _collect(done, running, jobs, estimates, failures):
+        finished_bytes = 0
+        for future in done:
+            index = running.pop(future)
+            finished_bytes += estimates[index]
+            if future.exception() is not None:
+                failures.append((jobs[index].file, future.exception()))
+        return finished_bytes
+
+    def _get_memory_estimate(self, job):
+        if isinstance(job.memory_estimate, SizeEstimate):
+            return job.memory_estimate.write_memory_bytes
+
+        if job.memory_estimate is not None:
+            return job.memory_estimate
+
+        if isinstance(job.source, xr.Dataset):
+            return SizeEstimator.estimate_dataset(job.source).write_memory_bytes
+
+        # nothing known about lazily produced datasets - assume an equal share of the budget
+        if self.memory_budget is not None:
+            return self.memory_budget // self.workers
+
+        return 0
+
+    @staticmethod
+    def _select_next(pending, estimates, running_bytes, num_running, workers, memory_budget):
+        if num_running >= workers:
+            return None
+
+        for position, index in enumerate(pending):
+            if memory_budget is None or running_bytes + estimates[index] <= memory_budget:
+                return position
+
+        if num_running == 0:
+            return 0  # larger than the complete budget - run it alone
+
+        return None
+
+    @staticmethod
+    def _to_job(job):
+        if isinstance(job, WriteJob):
+            return job
+
+        source, file = job
+        return WriteJob(source, file)
+
+
+def _write_job(write_function, source, file, write_args):
+    if callable(source):
+        source = source()
+
+    write_function(source, file, **write_args)
+    return file
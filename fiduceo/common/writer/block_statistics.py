@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import dask
+import dask.array as da
+import numpy as np
+
+# blocks of single precision data fit into the level 2 cache, the passes over a block after the first read it from there
+BLOCK_ELEMENTS = 128 * 1024
+
+
+class BlockStatistics:
+    """
+    Single pass statistics of array data. The data is processed in cache sized blocks (numpy) or per chunk (dask), all
+    quantities of a block are derived while the block is resident, partial results of the blocks are combined afterwards.
+    NaN values are counted in blocks containing any only, as detected by the minimum.
+    """
+
+    @staticmethod
+    def calculate(data, block_elements=None, fill_value=None, moments=False):
+        """
+        Calculate the statistics of an array.
+        :param data: numpy or dask array
+        :param block_elements: number of array elements processed per block, numpy arrays only
+        :param fill_value: elements with this value are excluded from the valid data, NaN values are never valid
+        :param moments: set true to calculate the mean and standard deviation as well
+        :return dictionary with the entries "min", "max", "nan_count", "count" (the number of array elements), "valid_count" and with moments "mean" and "std" of the valid data
+         """
+        fill_values = None if fill_value is None else {"data": fill_value}
+        return BlockStatistics.calculate_all({"data": data}, block_elements=block_elements, fill_values=fill_values, moments=moments)["data"]
+
+    @staticmethod
+    def calculate_all(arrays, block_elements=None, max_workers=None, fill_values=None, compute=True, moments=False):
+        """
+        Calculate the statistics for a number of arrays. Numpy arrays are processed in parallel threads, dask arrays are
+        evaluated in a single common dask computation.
+        :param arrays: dictionary name -> numpy or dask array
+        :param block_elements: number of array elements processed per block, numpy arrays only
+        :param max_workers: maximal number of threads used for numpy arrays, default is the executor default
+        :param fill_values: dictionary name -> fill value for the arrays containing fill values
+        :param compute: set false to return the statistics of dask arrays as dask.delayed objects, e.g. to compute them together with writing the arrays.
+        Their graphs refer to the unoptimised chunks of the arrays
+        :param moments: set true to calculate the mean and standard deviation as well, they take an additional pass over the valid data in double precision
+        :return dictionary name -> statistics dictionary
+         """
+        if block_elements is None:
+            block_elements = BLOCK_ELEMENTS
+
+        if fill_values is None:
+            fill_values = dict()
+
+        results = dict()
+        dask_names = []
+        dask_partials = []
+        numpy_arrays = dict()
+        for name, data in arrays.items():
+            fill_value = fill_values.get(name)
+            if isinstance(data, da.Array):
+                delayed_blocks = data.to_delayed(optimize_graph=compute is True).ravel()
+                dask_names.append(name)
+                dask_partials.append([dask.delayed(BlockStatistics._block_statistics)(block, fill_value, moments) for block in delayed_blocks])
+            else:
+                numpy_arrays[name] = data
+
+        if len(numpy_arrays) > 0:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = dict()
+                for name, data in numpy_arrays.items():
+                    futures[name] = executor.submit(BlockStatistics._array_statistics, np.asarray(data), block_elements, fill_values.get(name), moments)
+
+                for name, future in futures.items():
+                    results[name] = future.result()
+
+        if len(dask_names) > 0 and compute is not True:
+            for name, partials in zip(dask_names, dask_partials):
+                results[name] = dask.delayed(BlockStatistics._combine)(partials, moments)
+        elif len(dask_names) > 0:
+            computed = dask.compute(*dask_partials)
+            for name, partials in zip(dask_names, computed):
+                results[name] = BlockStatistics._combine(partials, moments)
+
+        return results
+
+    @staticmethod
+    def _array_statistics(data, block_elements, fill_value=None, moments=False):
+        if data.ndim == 0 or data.size == 0:
+            return BlockStatistics._combine([BlockStatistics._block_statistics(data, fill_value, moments)], moments)
+
+        row_elements = max(1, data.size // data.shape[0])
+        rows_per_block = max(1, block_elements // row_elements)
+
+        partials = []
+        for start in range(0, data.shape[0], rows_per_block):
+            partials.append(BlockStatistics._block_statistics(data[start:start + rows_per_block], fill_value, moments))
+
+        return BlockStatistics._combine(partials, moments)
+
+    @staticmethod
+    def _block_statistics(block, fill_value=None, moments=False):
+        block = np.asarray(block)
+        count = block.size
+        if count == 0:
+            return dict(min=np.nan, max=np.nan, nan_count=0, count=0, valid_count=0, mean=np.nan, m2=0.0)
+
+        values = block.ravel()
+        if fill_value is not None:
+            values = values[values != fill_value]
+        if values.size == 0:
+            return dict(min=np.nan, max=np.nan, nan_count=0, count=count, valid_count=0, mean=np.nan, m2=0.0)
+
+        # the minimum propagates NaN values, only then they are counted and ignored by fmin/fmax
+        nan_count = 0
+        block_min = np.minimum.reduce(values, axis=None)
+        if block.dtype.kind == "f" and np.isnan(block_min):
+            nan_count = int(np.count_nonzero(np.isnan(values)))
+            block_min = np.fmin.reduce(values, axis=None)
+            block_max = np.fmax.reduce(values, axis=None)
+        else:
+            block_max = np.maximum.reduce(values, axis=None)
+
+        valid_count = values.size - nan_count
+        if valid_count == 0:
+            return dict(min=np.nan, max=np.nan, nan_count=nan_count, count=count, valid_count=0, mean=np.nan, m2=0.0)
+
+        if not moments:
+            return dict(min=block_min, max=block_max, nan_count=nan_count, count=count, valid_count=valid_count)
+
+        if nan_count > 0:
+            values = values[~np.isnan(values)]
+        values = values.astype(np.float64, copy=False)
+        mean = float(np.mean(values))
+        m2 = float(np.sum(np.square(values - mean)))
+        return dict(min=block_min, max=block_max, nan_count=nan_count, count=count, valid_count=valid_count, mean=mean, m2=m2)
+
+    @staticmethod
+    def _combine(partials, moments=False):
+        result = dict(min=np.nan, max=np.nan, nan_count=0, count=0, valid_count=0, mean=np.nan, m2=0.0)
+        for partial in partials:
+            result["nan_count"] += partial["nan_count"]
+            result["count"] += partial["count"]
+            if partial["valid_count"] == 0:
+                continue
+
+            result["min"] = np.fmin(result["min"], partial["min"])
+            result["max"] = np.fmax(result["max"], partial["max"])
+            if not moments:
+                result["valid_count"] += partial["valid_count"]
+                continue
+
+            # pairwise combination of mean and sum of squared deviations (Chan et al.)
+            valid_count = result["valid_count"] + partial["valid_count"]
+            if result["valid_count"] == 0:
+                result["mean"] = partial["mean"]
+                result["m2"] = partial["m2"]
+            else:
+                delta = partial["mean"] - result["mean"]
+                result["mean"] += delta * partial["valid_count"] / valid_count
+                result["m2"] += partial["m2"] + delta * delta * result["valid_count"] * partial["valid_count"] / valid_count
+            result["valid_count"] = valid_count
+
+        if not moments:
+            del result["mean"], result["m2"]
+        elif result["valid_count"] > 0:
+            result["std"] = float(np.sqrt(result["m2"] / result["valid_count"]))
+        else:
+            result["std"] = np.nan
+
+        return result
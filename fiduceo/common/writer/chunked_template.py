@@ -0,0 +1,97 @@
+import dask.array as da
+import numpy as np
+from xarray import IndexVariable
+
+from fiduceo.common.writer.template_schema import TemplateSchema, FILL, RANGE
+
+
+class ChunkedTemplate:
+    """
+    Templates with the data of all chunked variables held in dask arrays, chunked exactly like the "chunksizes"
+    encoding of the variables. No memory is allocated for these variables: processors fill them chunk by chunk with
+    block functions, see map_blocks(), and the writers compute and write the chunks while streaming the dataset to
+    disk. Variables without chunk sizes, usually small ones, are numpy arrays as in other templates.
+    """
+
+    @staticmethod
+    def create(key, build_function, height):
+        """
+        Create a chunked template, from the cached template schema if possible.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :param height: the height in pixels of the product
+        :return the template dataset
+         """
+        schema = TemplateSchema.get(key, build_function)
+        if schema is None or height < schema.min_height:
+            return ChunkedTemplate.chunk(build_function(height))
+
+        return schema.instantiate(height, allocator=ChunkedTemplate._allocate, initialise=False)
+
+    @staticmethod
+    def chunk(dataset):
+        """
+        Convert all variables with chunk sizes to dask arrays chunked like their encoding, in place. Index coordinates are
+        not converted.
+        :param dataset: the dataset
+        :return the dataset
+         """
+        for variable in dataset.variables.values():
+            chunk_sizes = variable.encoding.get("chunksizes")
+            if chunk_sizes is None or isinstance(variable, IndexVariable) or ChunkedTemplate.is_chunked(variable):
+                continue
+
+            # no content based name, hashing the data would read all of it
+            variable.data = da.from_array(variable.data, chunks=ChunkedTemplate.get_chunks(chunk_sizes, variable.shape), name=False)
+
+        return dataset
+
+    @staticmethod
+    def map_blocks(dataset, name, block_function, *args, **kwargs):
+        """
+        Fill a chunked variable chunk by chunk. The block function is evaluated lazily, when the dataset is written.
+        :param dataset: the template dataset
+        :param name: the variable name
+        :param block_function: function computing a chunk, signature block_function(block, *args, **kwargs) -> array of the shape of the block. The block holds
+        the initial values of the chunk; with a keyword argument block_info, dask passes the location of the chunk in the variable
+        :param args: further arguments; dask arrays chunked like the variable, e.g. other template variables, are passed chunk by chunk
+        :param kwargs: further keyword arguments passed to the block function
+         """
+        variable = dataset.variables[name]
+        if not ChunkedTemplate.is_chunked(variable):
+            raise ValueError("variable is not chunked: " + name)
+
+        variable.data = da.map_blocks(block_function, variable.data, *args, dtype=variable.dtype, **kwargs)
+
+    @staticmethod
+    def is_chunked(variable):
+        """
+        Check whether the data of a variable is a dask array.
+        :param variable: the variable
+        :return true if dask backed
+         """
+        return isinstance(variable.data, da.Array)
+
+    @staticmethod
+    def get_chunks(chunk_sizes, shape):
+        """
+        Limit chunk sizes to the dimensions of a variable.
+        :param chunk_sizes: the chunk sizes of the encoding
+        :param shape: the shape of the variable
+        :return the dask chunks
+         """
+        return tuple(max(1, min(chunk_size, size)) for chunk_size, size in zip(chunk_sizes, shape))
+
+    @staticmethod
+    def _allocate(variable_schema, shape):
+        chunk_sizes = variable_schema.encoding.get("chunksizes")
+        if chunk_sizes is None or variable_schema.kind not in (FILL, RANGE):
+            data = np.empty(shape, variable_schema.dtype)
+            variable_schema.initialise(data)
+            return data
+
+        chunks = ChunkedTemplate.get_chunks(chunk_sizes, shape)
+        if variable_schema.kind == RANGE:
+            return da.arange(shape[0], chunks=chunks).astype(variable_schema.dtype)
+
+        return da.full(shape, variable_schema.value, dtype=variable_schema.dtype, chunks=chunks)
@@ -0,0 +1,297 @@
+import os
+import threading
+
+import dask
+import netCDF4
+import numpy as np
+from xarray import Variable
+from xarray.conventions import encode_cf_variable
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # not available on Windows, the processes scheduler is not supported there
+
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+
+THREADS = "threads"
+PROCESSES = "processes"
+
+LOCK_SUFFIX = ".lock"
+
+# netCDF4 storage settings of a variable encoding, as accepted by xarray's netCDF4 backend
+STORAGE_ENCODING = ("zlib", "complevel", "shuffle", "fletcher32", "contiguous", "chunksizes")
+
+
+class ProcessFileLock:
+    """
+    Lock shared by all processes writing a file, based on an exclusive lock of a lock file. Unlike multiprocessing
+    locks, it can be pickled and passed to the workers of the dask processes scheduler.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path of the lock file, created if not existing
+         """
+        self.path = path
+        self._fd = None
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, state):
+        self.path = state
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        self._fd = fd
+        return True
+
+    def release(self):
+        fd = self._fd
+        self._fd = None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class ChunkedWriter:
+    """
+    Streams datasets with dask backed variables to NetCDF: the file is set up with the numpy backed variables, then the
+    chunks are computed, encoded and written by a dask scheduler, only the chunks in progress are held in memory.
+
+    With the threads scheduler, the file is kept open while writing, the chunks are written one at a time. With the
+    processes scheduler, block functions holding the GIL run in parallel. The workers write their chunks themselves,
+    serialised by a file lock and closing the file after every chunk; xarray's own lock for the multiprocessing
+    scheduler cannot be passed to the worker processes of current dask versions.
+    """
+
+    @staticmethod
+    def is_chunked(ds):
+        """
+        Check whether a dataset has dask backed variables.
+        :param ds: the dataset
+        :return true if any variable is dask backed
+         """
+        return any(ChunkedTemplate.is_chunked(variable) for variable in ds.variables.values())
+
+    @staticmethod
+    def write(ds, file, encoding, scheduler=None, num_workers=None, computations=None):
+        """
+        Write the dataset to a NetCDF4 file.
+        :param ds: the dataset
+        :param file: the file path, an existing file is overwritten
+        :param encoding: dictionary variable name -> encoding, as used by xarray.Dataset.to_netcdf()
+        :param scheduler: the dask scheduler, "threads" (default) or "processes"
+        :param num_workers: the number of threads or processes, default as dask
+        :param computations: callable receiving the dataset with the dask backed data as stored and returning dask collections depending on it, e.g. lazy
+        statistics. They are computed together with the chunks from the stored chunks, every chunk is evaluated once
+        :return the computed computations, None if there are none
+         """
+        if scheduler is None:
+            scheduler = THREADS
+
+        lock_file = file + LOCK_SUFFIX
+        if scheduler == PROCESSES:
+            lock = ChunkedWriter.get_process_lock(lock_file)
+            handle = None
+        else:
+            lock = threading.Lock()
+            handle = FileHandle(file)
+        try:
+            names = ChunkedWriter.set_up_file(ds, file, encoding)
+            sources = [ds.variables[name].data for name in names]
+            targets = ChunkedWriter.get_store_targets(ds, file, encoding, names, handle=handle)
+            # the stored arrays return every chunk as written, the computations depend on the same keys as the writes
+            stored = [data.map_blocks(ChunkedWriter._store_block, dtype=data.dtype, target=target, lock=lock) for data, target in zip(sources, targets)]
+
+            results = None
+            if computations is not None:
+                stored_ds = ds.copy(deep=False)
+                for name, data in zip(names, stored):
+                    stored_ds.variables[name].data = data
+                results = computations(stored_ds)
+
+            # the chunks are reduced to empty blocks, the stored arrays are not assembled in memory. Optimising the arrays
+            # and the computations separately would fuse the chunks into both graphs, evaluating them twice
+            written = [data.map_blocks(ChunkedWriter._discard_block, dtype=bool, chunks=tuple((0,) * len(chunks) for chunks in data.chunks)) for data in stored]
+            return dask.compute(written, results, scheduler=scheduler, num_workers=num_workers, optimize_graph=False)[1]
+        finally:
+            if handle is not None:
+                handle.close()
+            if os.path.isfile(lock_file):
+                os.remove(lock_file)
+
+    @staticmethod
+    def set_up_file(ds, file, encoding):
+        """
+        Create a NetCDF4 file for a dataset: numpy backed variables are written, dask backed variables are defined only.
+        Their chunks are written with the store targets of get_store_targets().
+        :param ds: the dataset
+        :param file: the file path, an existing file is overwritten
+        :param encoding: dictionary variable name -> encoding, as used by xarray.Dataset.to_netcdf()
+        :return the names of the dask backed variables
+         """
+        if encoding is None:
+            encoding = dict()
+
+        chunked_names = [name for name, variable in ds.variables.items() if ChunkedTemplate.is_chunked(variable)]
+        in_memory = ds.drop_vars(chunked_names)
+        in_memory_encoding = dict((name, var_encoding) for name, var_encoding in encoding.items() if name in in_memory.variables)
+        in_memory.to_netcdf(file, format="NETCDF4", engine="netcdf4", encoding=in_memory_encoding)
+
+        with netCDF4.Dataset(file, "a") as dataset:
+            for name in chunked_names:
+                ChunkedWriter._define_variable(dataset, name, ChunkedWriter._get_encoded_variable(name, ds.variables[name], encoding), ds.dims)
+
+        return chunked_names
+
+    @staticmethod
+    def get_store_targets(ds, file, encoding, names, handle=None):
+        """
+        Create the targets writing the chunks of dask backed variables to a file set up with set_up_file(), for use with
+        dask.array.store(). Every chunk is encoded as by xarray.Dataset.to_netcdf() and written to the file handle, or
+        opening the file for it without handle; the targets can be pickled, the lock passed to dask.array.store() must
+        serialise all writers of the file.
+        :param ds: the dataset
+        :param file: the file path
+        :param encoding: dictionary variable name -> encoding, as used by xarray.Dataset.to_netcdf()
+        :param names: the names of the dask backed variables
+        :param handle: FileHandle of the file shared by all targets of the process, optional. It is not pickled
+        :return list of the targets, in the order of the names
+         """
+        if encoding is None:
+            encoding = dict()
+
+        return [VariableTarget(file, name, ds.variables[name], encoding.get(name), handle=handle) for name in names]
+
+    @staticmethod
+    def get_process_lock(lock_file):
+        """
+        Get a lock for writing a NetCDF file from several processes. The lock serialises the threads of a process as
+        well, every acquisition opens the lock file on its own.
+        :param lock_file: path of the lock file
+        :return the lock
+         """
+        if fcntl is None:
+            raise ValueError("the processes scheduler is not supported on this platform")
+
+        return ProcessFileLock(lock_file)
+
+    @staticmethod
+    def _get_encoded_variable(name, variable, encoding):
+        variable = Variable(variable.dims, variable.data, variable.attrs, variable.encoding)
+        if name in encoding:
+            variable.encoding = dict(encoding[name])
+        return encode_cf_variable(variable, name=name)
+
+    @staticmethod
+    def _define_variable(dataset, name, encoded, dims):
+        for dim in encoded.dims:
+            if dim not in dataset.dimensions:
+                dataset.createDimension(dim, dims[dim])
+
+        attributes = dict(encoded.attrs)
+        fill_value = attributes.pop("_FillValue", None)
+        storage = dict((key, value) for key, value in encoded.encoding.items() if key in STORAGE_ENCODING)
+
+        variable = dataset.createVariable(name, encoded.dtype, encoded.dims, fill_value=fill_value, **storage)
+        variable.setncatts(attributes)
+
+    @staticmethod
+    def _store_block(block, target=None, lock=None, block_info=None):
+        region = tuple(slice(start, stop) for start, stop in block_info[0]["array-location"])
+        with lock:
+            target[region] = block
+        return block
+
+    @staticmethod
+    def _discard_block(block):
+        return np.empty((0,) * block.ndim, bool)
+
+
+class FileHandle:
+    """
+    A NetCDF4 file kept open for writing the chunks of all variables, opened on first use. The handle is not thread
+    safe, all access must be serialised by the lock of the writer.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: the file path
+         """
+        self.file = file
+        self._dataset = None
+
+    def get(self):
+        if self._dataset is None:
+            self._dataset = netCDF4.Dataset(self.file, "a")
+        return self._dataset
+
+    def close(self):
+        dataset = self._dataset
+        self._dataset = None
+        if dataset is not None:
+            dataset.close()
+
+
+class VariableTarget:
+    """
+    Store target of a dask backed variable in a NetCDF4 file set up by ChunkedWriter.set_up_file(). Every chunk is
+    encoded as by xarray.Dataset.to_netcdf() and written to the file handle, or opening and closing the file if there
+    is none; the target can be pickled, without the handle.
+    """
+
+    def __init__(self, file, name, variable, encoding=None, handle=None):
+        """
+        :param file: the file path
+        :param name: the variable name
+        :param variable: the dask backed variable
+        :param encoding: the variable encoding, replacing the encoding of the variable, optional
+        :param handle: FileHandle of the file, optional
+         """
+        self.file = file
+        self.name = name
+        self.dims = variable.dims
+        self.attrs = dict(variable.attrs)
+        self.encoding = dict(variable.encoding if encoding is None else encoding)
+        self.handle = handle
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["handle"] = None  # file handles are valid in the process opening them only
+        return state
+
+    def __setitem__(self, region, block):
+        chunk = Variable(self.dims, block, self.attrs, dict(self.encoding))
+        data = encode_cf_variable(chunk, name=self.name).values
+
+        if self.handle is not None:
+            VariableTarget._write(self.handle.get(), self.name, region, data)
+            return
+
+        with netCDF4.Dataset(self.file, "a") as dataset:
+            VariableTarget._write(dataset, self.name, region, data)
+
+    @staticmethod
+    def _write(dataset, name, region, data):
+        variable = dataset.variables[name]
+        variable.set_auto_maskandscale(False)
+        variable[region] = data
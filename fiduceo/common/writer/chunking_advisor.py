@@ -0,0 +1,127 @@
+import math
+
+import numpy as np
+
+from fiduceo.common.writer.encoding_plan import EncodingPlan
+
+FULL_SCAN = "full_scan"
+SCANLINE_BLOCKS = "scanline_blocks"
+SPATIAL_TILES = "spatial_tiles"
+PER_CHANNEL = "per_channel"
+
+ACCESS_PATTERNS = [FULL_SCAN, SCANLINE_BLOCKS, SPATIAL_TILES, PER_CHANNEL]
+
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+
+
+class ChunkingAdvisor:
+
+    @staticmethod
+    def apply(dataset, access_pattern=SCANLINE_BLOCKS, target_bytes=None):
+        """
+        Calculate chunk sizes for all data variables of a template dataset and store them in the variable encodings.
+        :param dataset: the template dataset
+        :param access_pattern: the expected read access pattern, one of "full_scan", "scanline_blocks", "spatial_tiles", "per_channel"
+        :param target_bytes: the targeted size of a chunk in bytes (as stored in the file), default is 1 MB
+        :return a dictionary variable name -> chunk sizes for all variables modified
+         """
+        chunk_sizes = ChunkingAdvisor.get_chunk_sizes(dataset, access_pattern=access_pattern, target_bytes=target_bytes)
+        for var_name, chunks in chunk_sizes.items():
+            dataset.variables[var_name].encoding["chunksizes"] = chunks
+
+        EncodingPlan.mark_modified(dataset, ("chunksizes", tuple(sorted(chunk_sizes.items()))))
+        return chunk_sizes
+
+    @staticmethod
+    def get_chunk_sizes(dataset, access_pattern=SCANLINE_BLOCKS, target_bytes=None):
+        """
+        Calculate chunk sizes for all data variables of a template dataset without modifying the dataset.
+        :param dataset: the template dataset
+        :param access_pattern: the expected read access pattern, one of "full_scan", "scanline_blocks", "spatial_tiles", "per_channel"
+        :param target_bytes: the targeted size of a chunk in bytes (as stored in the file), default is 1 MB
+        :return a dictionary variable name -> chunk sizes
+         """
+        if target_bytes is None:
+            target_bytes = DEFAULT_CHUNK_BYTES
+
+        chunk_sizes = dict()
+        for var_name in dataset.data_vars:
+            variable = dataset.variables[var_name]
+            shape = variable.shape
+            if len(shape) == 0 or 0 in shape:
+                continue  # scalars and empty variables cannot be chunked
+
+            item_size = ChunkingAdvisor._get_storage_item_size(variable)
+            if item_size is None:
+                continue
+
+            chunk_sizes[var_name] = ChunkingAdvisor.compute_chunk_sizes(shape, item_size, access_pattern, target_bytes)
+
+        return chunk_sizes
+
+    @staticmethod
+    def compute_chunk_sizes(shape, item_size, access_pattern, target_bytes=None):
+        """
+        Calculate the chunk sizes for a variable. The last two dimensions are treated as image rows and columns, all
+        preceding dimensions (channels, samples, ...) as layers.
+        :param shape: the variable shape
+        :param item_size: the size in bytes of one element as stored in the file
+        :param access_pattern: the expected read access pattern
+        :param target_bytes: the targeted size of a chunk in bytes, default is 1 MB
+        :return tuple of chunk sizes, never larger than the variable shape
+         """
+        if access_pattern not in ACCESS_PATTERNS:
+            raise ValueError("Unsupported access pattern: " + str(access_pattern))
+
+        if target_bytes is None:
+            target_bytes = DEFAULT_CHUNK_BYTES
+
+        target_elements = max(1, int(target_bytes // item_size))
+
+        if len(shape) == 1:
+            return (ChunkingAdvisor._clamp(target_elements, shape[0]),)
+
+        layers = tuple(shape[:-2])
+        rows, columns = shape[-2:]
+
+        if access_pattern == FULL_SCAN:
+            # contiguous slabs in storage order, the innermost dimensions are kept complete first
+            chunks = []
+            remaining = target_elements
+            for size in reversed(shape):
+                extent = ChunkingAdvisor._clamp(remaining, size)
+                chunks.insert(0, extent)
+                remaining = max(1, remaining // extent)
+            return tuple(chunks)
+
+        if access_pattern == SCANLINE_BLOCKS:
+            line_elements = columns * int(np.prod(layers, dtype=np.int64))
+            num_lines = ChunkingAdvisor._clamp(target_elements // line_elements, rows)
+            return layers + (num_lines, columns)
+
+        single_layers = tuple(1 for _ in layers)
+        if access_pattern == SPATIAL_TILES:
+            edge = int(math.sqrt(target_elements))
+            tile_columns = ChunkingAdvisor._clamp(edge, columns)
+            tile_rows = ChunkingAdvisor._clamp(target_elements // tile_columns, rows)
+            return single_layers + (tile_rows, tile_columns)
+
+        # PER_CHANNEL
+        num_lines = ChunkingAdvisor._clamp(target_elements // columns, rows)
+        return single_layers + (num_lines, columns)
+
+    @staticmethod
+    def _get_storage_item_size(variable):
+        data_type = variable.encoding.get("dtype")
+        if data_type is None:
+            data_type = variable.dtype
+
+        data_type = np.dtype(data_type)
+        if data_type.kind not in "biufmM":
+            return None  # strings and objects are not chunked
+
+        return data_type.itemsize
+
+    @staticmethod
+    def _clamp(value, size):
+        return int(max(1, min(value, size)))
@@ -1,14 +1,19 @@
+import threading
+from contextlib import contextmanager
+
 import numpy as np
 import xarray as xr
 
 
 class DefaultData:
+    _probe_state = threading.local()
+
     @staticmethod
     def create_default_vector(size, dtype, fill_value=None):
         if fill_value is None:
             fill_value = DefaultData.get_default_fill_value(dtype)
 
-        empty_array = np.full([size], fill_value, dtype)
+        empty_array = DefaultData._create_filled([size], fill_value, dtype)
 
         default_array = xr.DataArray(empty_array, dims=['y'])
         return default_array
@@ -18,7 +23,7 @@ class DefaultData:
         if fill_value is None:
             fill_value = DefaultData.get_default_fill_value(dtype)
 
-        empty_array = np.full([height, width], fill_value, dtype)
+        empty_array = DefaultData._create_filled([height, width], fill_value, dtype)
 
         if dims_names is not None:
             default_array = xr.DataArray(empty_array, dims=dims_names)
@@ -32,7 +37,7 @@ class DefaultData:
         if fill_value is None:
             fill_value = DefaultData.get_default_fill_value(dtype)
 
-        empty_array = np.full([num_channels, height, width], fill_value, dtype)
+        empty_array = DefaultData._create_filled([num_channels, height, width], fill_value, dtype)
 
         if dims_names is not None:
             default_array = xr.DataArray(empty_array, dims=dims_names)
@@ -46,7 +51,7 @@ class DefaultData:
         if fill_value is None:
             fill_value = DefaultData.get_default_fill_value(dtype)
 
-        empty_array = np.full([z2, z1, height, width], fill_value, dtype)
+        empty_array = DefaultData._create_filled([z2, z1, height, width], fill_value, dtype)
 
         if dims_names is not None:
             default_array = xr.DataArray(empty_array, dims=dims_names)
@@ -55,6 +60,36 @@ class DefaultData:
 
         return default_array
 
+    @staticmethod
+    @contextmanager
+    def probe():
+        """
+        Context manager switching the current thread to probe mode: default arrays are read-only broadcast views of a
+        single fill value, no memory is allocated for the data. Used to capture template layouts.
+         """
+        previous = getattr(DefaultData._probe_state, "active", False)
+        DefaultData._probe_state.active = True
+        try:
+            yield
+        finally:
+            DefaultData._probe_state.active = previous
+
+    @staticmethod
+    def is_probe_array(array):
+        """
+        Check whether an array has been created in probe mode.
+        :param array: numpy array
+        :return true for read-only broadcast views of a single value
+         """
+        return isinstance(array, np.ndarray) and array.ndim > 0 and not array.flags.writeable and all(stride == 0 for stride in array.strides)
+
+    @staticmethod
+    def _create_filled(shape, fill_value, dtype):
+        if getattr(DefaultData._probe_state, "active", False):
+            return np.broadcast_to(np.full([], fill_value, dtype), shape)
+
+        return np.full(shape, fill_value, dtype)
+
     @staticmethod
     def get_default_fill_value(dtype):
         """
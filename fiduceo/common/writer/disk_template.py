@@ -0,0 +1,156 @@
+import os
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+from xarray import Variable, IndexVariable
+
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+from fiduceo.common.writer.chunked_writer import THREADS
+from fiduceo.common.writer.shared_template import ARENA_ALIGNMENT
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+SCRATCH_SUFFIX = ".scratch"
+
+
+class DiskTemplate:
+    """
+    Write-through template for products larger than the memory: the data of all variables is memory mapped from one
+    scratch file next to the product file. Assignments like ds["count_vis"][y0:y1, :] = block go to the scratch file,
+    the operating system writes the pages to disk and reclaims the memory when needed.
+
+    close() writes the product with the writer's write function: flag mapping, statistics and metadata are applied and
+    the variables are streamed to the product file chunk by chunk, so that the encoded copies of the data are never
+    held completely in memory. The scratch file is deleted afterwards. Index coordinates, scalars and variables of object
+    data type are held in memory.
+
+    The template data is initialised with the default values when creating the template, the scratch file takes the full
+    uncompressed size of the template data on disk.
+    """
+
+    def __init__(self, dataset, file, scratch_file, write_function):
+        self.dataset = dataset
+        self.file = file
+        self.scratch_file = scratch_file
+        self.write_function = write_function
+
+    @staticmethod
+    def create(key, build_function, height, file, write_function):
+        """
+        Create a template backed by a scratch file, from the cached template schema if possible.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :param height: the height in pixels of the product
+        :param file: the product file path, the scratch file is created in the same directory
+        :param write_function: the function writing the product, signature write_function(ds, file, **write_args)
+        :return the DiskTemplate
+         """
+        scratch_file = DiskTemplate.get_scratch_file_path(file)
+        schema = TemplateSchema.get(key, build_function)
+
+        try:
+            if schema is None or height < schema.min_height:
+                dataset = DiskTemplate._from_dataset(build_function(height), scratch_file)
+            else:
+                dim_sizes = schema.get_dim_sizes(height)
+                layout = [(variable.name, variable.get_shape(dim_sizes), variable.dtype) for variable in schema.variables if not variable.is_index]
+                arrays = DiskTemplate._allocate(scratch_file, layout)
+                dataset = schema.instantiate(height, allocator=lambda variable, shape: arrays.get(variable.name))
+        except BaseException:
+            DiskTemplate._remove_if_exists(scratch_file)
+            raise
+
+        return DiskTemplate(dataset, file, scratch_file, write_function)
+
+    @staticmethod
+    def get_scratch_file_path(file):
+        """
+        Create a unique, hidden scratch file path in the directory of the product file.
+        :param file: the product file path
+        :return the scratch file path
+         """
+        target_dir, file_name = os.path.split(os.path.abspath(file))
+        return os.path.join(target_dir, "." + file_name + "." + uuid.uuid4().hex[:12] + SCRATCH_SUFFIX)
+
+    def close(self, **write_args):
+        """
+        Write the product and delete the scratch file. The dataset must not be used afterwards. If writing fails, the
+        scratch file and the dataset are kept: close() can be called again, e.g. with overwrite=True, or discard().
+        :param write_args: further keyword arguments passed to the write function (compression_level, overwrite, ...). The
+        dask scheduler must be "threads", the default
+         """
+        if self.dataset is None:
+            return
+
+        # the memory mapped data is read by the writing threads, worker processes would receive copies of it
+        scheduler = write_args.get("scheduler")
+        if scheduler is not None and scheduler != THREADS:
+            raise ValueError("disk backed templates are written with the threads scheduler only: " + str(scheduler))
+        write_args["scheduler"] = THREADS
+
+        self.write_function(ChunkedTemplate.chunk(self.dataset), self.file, **write_args)
+        self.discard()
+
+    def discard(self):
+        """
+        Delete the scratch file without writing the product.
+         """
+        self.dataset = None
+        DiskTemplate._remove_if_exists(self.scratch_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    @staticmethod
+    def _from_dataset(dataset, scratch_file):
+        layout = [(name, variable.shape, variable.dtype) for name, variable in dataset.variables.items() if not isinstance(variable, IndexVariable)]
+        arrays = DiskTemplate._allocate(scratch_file, layout)
+
+        variables = OrderedDict()
+        for name, variable in dataset.variables.items():
+            data = arrays.get(name)
+            if data is None:
+                variables[name] = variable
+                continue
+
+            data[...] = variable.values
+            disk_variable = Variable(variable.dims, data, attrs=variable.attrs)
+            disk_variable.encoding = variable.encoding
+            variables[name] = disk_variable
+
+        disk_dataset = xr.Dataset(data_vars=variables, attrs=dataset.attrs)
+        return disk_dataset.set_coords([name for name in dataset.coords if name in variables])
+
+    @staticmethod
+    def _allocate(scratch_file, layout):
+        entries = []
+        offset = 0
+        for name, shape, dtype in layout:
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            if dtype.hasobject or len(shape) == 0 or nbytes == 0:
+                continue  # kept in memory
+
+            entries.append((name, tuple(int(size) for size in shape), dtype, offset))
+            offset += -(-nbytes // ARENA_ALIGNMENT) * ARENA_ALIGNMENT
+
+        # the file is extended without writing, the initial default values take the disk space
+        with open(scratch_file, "wb") as scratch:
+            scratch.truncate(max(offset, 1))
+
+        arrays = OrderedDict()
+        for name, shape, dtype, offset in entries:
+            arrays[name] = np.memmap(scratch_file, dtype=dtype, mode="r+", offset=offset, shape=shape)
+        return arrays
+
+    @staticmethod
+    def _remove_if_exists(file):
+        if os.path.isfile(file):
+            os.remove(file)
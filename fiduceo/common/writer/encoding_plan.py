@@ -0,0 +1,240 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_CACHED_PLANS = 256
+
+# attributes taking part in the validation of an encoding
+PACKING_ATTRIBUTES = ["_FillValue", "scale_factor", "add_offset", "dtype"]
+
+# dataset encoding entry recording the modifications of the variable encodings of a template dataset
+MODIFICATIONS = "encoding_modifications"
+
+
+class EncodingPlan:
+    """
+    The complete, validated NetCDF encoding of all data variables of a dataset layout: the variable encodings of the
+    template merged with the compression settings, chunk sizes limited to the dimension sizes.
+    Plans are compiled once per layout and cached. Template datasets, carrying a "template_key" attribute, are
+    looked up by template key, modifications, compression level and height class; the plan is checked against the
+    variable names and data types only. Code changing the variable encodings of a template dataset must record it
+    with mark_modified(). Other datasets are looked up by variable names, data types, variable encodings and packing
+    attributes.
+    """
+
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, encodings, max_chunk_extents, data_types=None):
+        self.encodings = encodings
+        self.max_chunk_extents = max_chunk_extents
+        self.data_types = data_types
+
+    def matches(self, ds):
+        """
+        Check whether the plan was compiled for the variables of a dataset.
+        :param ds: the dataset
+        :return true if the data variables and their data types are those of the plan
+         """
+        if self.data_types is None or len(self.data_types) != len(ds.data_vars):
+            return False
+
+        for var_name in ds.data_vars:
+            if self.data_types.get(var_name) != ds.variables[var_name].dtype:
+                return False
+        return True
+
+    def get_encoding(self, ds):
+        """
+        Create the encoding dictionary for writing the dataset with xarray.Dataset.to_netcdf().
+        :param ds: the dataset, must have the layout the plan was compiled for
+        :return dictionary variable name -> encoding
+         """
+        return dict((var_name, dict(self.encodings[var_name])) for var_name in ds.data_vars)
+
+    @staticmethod
+    def compile(ds, compression_level):
+        """
+        Compile and validate the encoding plan for a dataset. All inconsistencies found are reported in one ValueError.
+        :param ds: the dataset
+        :param compression_level: the file compression level, 0 - 9
+        :return the encoding plan
+         """
+        if compression_level not in range(0, 10):
+            raise ValueError("invalid compression level: " + str(compression_level))
+
+        # set up compression parameter for ALL variables. Unfortunately, xarray does not allow
+        # one set of compression params per file, only per variable. tb 2017-01-25
+        comp = dict(zlib=True, complevel=compression_level)
+
+        encodings = dict()
+        max_chunk_extents = dict()
+        problems = []
+        for var_name in ds.data_vars:
+            variable = ds.variables[var_name]
+            var_encoding = dict(comp)
+            var_encoding.update(variable.encoding)
+
+            problems.extend(EncodingPlan._validate(var_name, variable, var_encoding))
+
+            chunk_sizes = var_encoding.get("chunksizes")
+            if chunk_sizes is not None and len(chunk_sizes) == len(variable.dims):
+                clamped = []
+                for dim, chunk_size, dim_size in zip(variable.dims, chunk_sizes, variable.shape):
+                    max_chunk_extents[dim] = max(max_chunk_extents.get(dim, 0), chunk_size)
+                    clamped.append(max(1, min(chunk_size, dim_size)))
+                var_encoding["chunksizes"] = tuple(clamped)
+
+            encodings[var_name] = var_encoding
+
+        if len(problems) > 0:
+            raise ValueError("invalid encoding: " + "; ".join(problems))
+
+        data_types = dict((var_name, ds.variables[var_name].dtype) for var_name in ds.data_vars)
+        return EncodingPlan(encodings, max_chunk_extents, data_types)
+
+    @staticmethod
+    def get(ds, compression_level):
+        """
+        Get the cached encoding plan for the layout of the dataset, compiling it on first use. Datasets with changed
+        variable encodings, e.g. re-chunked or re-scaled, have a layout of their own; for template datasets, the
+        change must be recorded with mark_modified().
+        :param ds: the dataset
+        :param compression_level: the file compression level, 0 - 9
+        :return the encoding plan
+         """
+        template_key = EncodingPlan._get_template_key(ds, compression_level)
+        # the layouts of a template key differ by their variables, e.g. packed and unpacked or of another product mode
+        layouts = EncodingPlan._get_cached(template_key) if template_key is not None else None
+        layout_key, plan = EncodingPlan._find_layout(layouts, ds)
+
+        if plan is None:
+            layout_key = EncodingPlan._get_layout_key(ds, compression_level)
+            plan = EncodingPlan._get_cached(layout_key)
+            if plan is None:
+                plan = EncodingPlan._put_cached(layout_key, EncodingPlan.compile(ds, compression_level))
+            if template_key is not None:
+                EncodingPlan._put_cached(template_key, (layouts or ()) + ((layout_key, plan),))
+
+        height_class = EncodingPlan.get_height_class(ds, plan)
+        if len(height_class) == 0:
+            return plan
+
+        # products smaller than the chunks need a plan with chunk sizes limited to their dimensions
+        class_key = (layout_key, height_class)
+        class_plan = EncodingPlan._get_cached(class_key)
+        if class_plan is None:
+            class_plan = EncodingPlan._put_cached(class_key, EncodingPlan.compile(ds, compression_level))
+
+        return class_plan
+
+    @staticmethod
+    def mark_modified(ds, modification=None):
+        """
+        Record a change of the variable encodings of a template dataset, made after the template has been created.
+        :param ds: the template dataset
+        :param modification: hashable description of the change, the same for all datasets changed alike, e.g. the
+        parameters of the change. If None, the plan is looked up by the variable encodings of the dataset
+         """
+        modifications = ds.encoding.get(MODIFICATIONS, ())
+        if modifications is None or modification is None:
+            ds.encoding[MODIFICATIONS] = None
+        else:
+            ds.encoding[MODIFICATIONS] = modifications + (modification,)
+
+    @staticmethod
+    def get_height_class(ds, plan):
+        """
+        Determine the dimensions of the dataset that are smaller than the largest chunk extent planned for them.
+        :param ds: the dataset
+        :param plan: the plan compiled for the layout
+        :return tuple of (dimension name, size) pairs, empty for all products at least as large as the chunks
+         """
+        return tuple((dim, size) for dim, size in ds.dims.items() if size < plan.max_chunk_extents.get(dim, 0))
+
+    @staticmethod
+    def clear_cache():
+        with EncodingPlan._cache_lock:
+            EncodingPlan._cache.clear()
+
+    @staticmethod
+    def _get_cached(key):
+        with EncodingPlan._cache_lock:
+            plan = EncodingPlan._cache.get(key)
+            if plan is not None:
+                EncodingPlan._cache.move_to_end(key)
+            return plan
+
+    @staticmethod
+    def _put_cached(key, plan):
+        with EncodingPlan._cache_lock:
+            EncodingPlan._cache[key] = plan
+            while len(EncodingPlan._cache) > MAX_CACHED_PLANS:
+                EncodingPlan._cache.popitem(last=False)
+        return plan
+
+    @staticmethod
+    def _get_template_key(ds, compression_level):
+        template_key = ds.attrs.get("template_key")
+        modifications = ds.encoding.get(MODIFICATIONS, ())
+        if template_key is None or modifications is None:
+            return None
+
+        return "template", template_key, modifications, compression_level
+
+    @staticmethod
+    def _find_layout(layouts, ds):
+        if layouts is not None:
+            for layout_key, plan in layouts:
+                if plan.matches(ds):
+                    return layout_key, plan
+        return None, None
+
+    @staticmethod
+    def _get_layout_key(ds, compression_level):
+        # the data types distinguish packed from unpacked datasets of the same template, their encodings differ
+        data_types = tuple(ds.variables[name].dtype.str for name in ds.data_vars)
+        encodings = tuple(EncodingPlan._get_encoding_key(ds.variables[name]) for name in ds.data_vars)
+        return "layout", ds.attrs.get("template_key"), tuple(ds.data_vars), data_types, encodings, compression_level
+
+    @staticmethod
+    def _get_encoding_key(variable):
+        # the values are compared by their representation, encodings may contain unhashable lists or arrays
+        encoding = tuple(sorted((name, repr(value)) for name, value in variable.encoding.items()))
+        attributes = tuple((name, repr(variable.attrs[name])) for name in PACKING_ATTRIBUTES if name in variable.attrs)
+        return encoding, attributes
+
+    @staticmethod
+    def _validate(var_name, variable, var_encoding):
+        problems = []
+
+        data_type = var_encoding.get("dtype")
+        if data_type is not None:
+            try:
+                data_type = np.dtype(data_type)
+            except TypeError:
+                problems.append(var_name + ": invalid data type " + str(data_type))
+                data_type = None
+
+        fill_value = var_encoding.get("_FillValue")
+        if data_type is not None and fill_value is not None and np.issubdtype(data_type, np.integer):
+            type_info = np.iinfo(data_type)
+            if np.isnan(fill_value) or fill_value < type_info.min or fill_value > type_info.max:
+                problems.append(var_name + ": fill value " + str(fill_value) + " not representable as " + str(data_type))
+
+        scale_factor = var_encoding.get("scale_factor")
+        if scale_factor is not None and (not np.isfinite(scale_factor) or scale_factor == 0):
+            problems.append(var_name + ": invalid scale factor " + str(scale_factor))
+
+        if "_FillValue" in var_encoding and "_FillValue" in variable.attrs:
+            problems.append(var_name + ": fill value defined in attributes and encoding")
+
+        chunk_sizes = var_encoding.get("chunksizes")
+        if chunk_sizes is not None:
+            if len(chunk_sizes) != len(variable.dims):
+                problems.append(var_name + ": chunk sizes " + str(chunk_sizes) + " do not match dimensions " + str(variable.dims))
+            elif any(int(chunk_size) < 1 for chunk_size in chunk_sizes):
+                problems.append(var_name + ": chunk sizes must be positive " + str(chunk_sizes))
+
+        return problems
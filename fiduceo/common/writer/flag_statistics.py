@@ -0,0 +1,166 @@
+from collections import OrderedDict
+
+import dask
+import dask.array as da
+import numpy as np
+from dask.delayed import Delayed
+
+FLAG_COUNTS_ATTRIBUTE = "flag_counts"
+
+
+class FlagStatistics:
+    """
+    Counts the pixels carrying each flag of bitmask variables. Flag data of up to 16 bit is reduced to a histogram of the
+    flag values with one bincount pass, the counts per flag are derived from the histogram.
+    """
+
+    @staticmethod
+    def calculate(dataset, compute=True):
+        """
+        Count the pixels per flag of all variables having a "flag_masks" attribute. Pixels equal to the fill value are not
+        counted. Dask backed variables are evaluated in one common computation.
+        :param dataset: the dataset
+        :param compute: set false to return the counts of dask backed variables as dask.delayed objects, e.g. to compute them together with writing the dataset.
+        Their graphs refer to the unoptimised chunks of the variables
+        :return dictionary variable name -> int64 array with one count per mask
+         """
+        counts = OrderedDict()
+        for var_name in dataset.data_vars:
+            variable = dataset.variables[var_name]
+            if "flag_masks" not in variable.attrs or variable.dtype.kind not in "iu":
+                continue
+
+            masks = FlagStatistics.parse_masks(variable.attrs["flag_masks"])
+            fill_value = FlagStatistics._get_fill_value(variable)
+            data = variable.data
+            if not isinstance(data, da.Array):
+                counts[var_name] = FlagStatistics.count(np.asarray(data), masks, fill_value)
+            elif data.dtype.itemsize <= 2:
+                counts[var_name] = dask.delayed(FlagStatistics._count_from_histogram)(FlagStatistics.histogram(data, fill_value), masks)
+            else:
+                block_counts = [dask.delayed(FlagStatistics.count)(block, masks, fill_value) for block in data.to_delayed(optimize_graph=compute is True).ravel()]
+                counts[var_name] = dask.delayed(np.sum)(block_counts, axis=0)
+
+        if compute is True:
+            lazy_names = [var_name for var_name, var_counts in counts.items() if isinstance(var_counts, Delayed)]
+            computed = dask.compute(*[counts[var_name] for var_name in lazy_names])
+            for var_name, var_counts in zip(lazy_names, computed):
+                counts[var_name] = np.asarray(var_counts, dtype=np.int64)
+
+        return counts
+
+    @staticmethod
+    def apply(dataset, counts=None):
+        """
+        Count the pixels per flag of all variables having a "flag_masks" attribute and store the counts, aligned with the
+        masks, as variable attribute "flag_counts". Pixels equal to the fill value are not counted.
+        :param dataset: the dataset
+        :param counts: counts as returned by calculate(), calculated if None
+        :return dictionary variable name -> ordered dictionary flag meaning -> number of pixels
+         """
+        if counts is None:
+            counts = FlagStatistics.calculate(dataset)
+
+        results = dict()
+        for var_name, var_counts in counts.items():
+            variable = dataset.variables[var_name]
+            masks = FlagStatistics.parse_masks(variable.attrs["flag_masks"])
+            variable.attrs[FLAG_COUNTS_ATTRIBUTE] = var_counts
+            results[var_name] = OrderedDict(zip(FlagStatistics._get_flag_names(variable, masks), (int(count) for count in var_counts)))
+
+        return results
+
+    @staticmethod
+    def get_attributes(counts):
+        """
+        Convert counts to the attributes stored by apply().
+        :param counts: counts as returned by calculate()
+        :return dictionary variable name -> dictionary attribute name -> value
+         """
+        return dict((var_name, {FLAG_COUNTS_ATTRIBUTE: var_counts}) for var_name, var_counts in counts.items())
+
+    @staticmethod
+    def count(data, masks, fill_value=None):
+        """
+        Count the pixels per flag.
+        :param data: integer flag data
+        :param masks: list of flag masks
+        :param fill_value: pixels with this value are not counted, None to count all pixels
+        :return int64 array with one count per mask
+         """
+        if data.dtype.itemsize <= 2:
+            return FlagStatistics._count_from_histogram(FlagStatistics.histogram(data, fill_value), masks)
+
+        valid = None
+        if fill_value is not None:
+            valid = data != fill_value
+
+        counts = np.zeros(len(masks), dtype=np.int64)
+        for index, mask in enumerate(masks):
+            flag_set = np.bitwise_and(data, mask) != 0
+            if valid is not None:
+                flag_set &= valid
+            counts[index] = np.count_nonzero(flag_set)
+        return counts
+
+    @staticmethod
+    def histogram(data, fill_value=None):
+        """
+        Count the pixels per flag value of 8 or 16 bit flag data.
+        :param data: integer flag data, numpy or dask array
+        :param fill_value: pixels with this value are not counted, None to count all pixels
+        :return int64 array with 256 or 65536 entries, indexed by the bit pattern of the flag value
+         """
+        num_values = 1 << (8 * data.dtype.itemsize)
+        flag_values = data.view(np.dtype("u" + str(data.dtype.itemsize))).ravel()
+        if isinstance(data, da.Array):
+            histogram = da.bincount(flag_values, minlength=num_values)
+        else:
+            histogram = np.bincount(flag_values, minlength=num_values).astype(np.int64)
+
+        if fill_value is not None:
+            fill_index = int(np.array(fill_value).astype(data.dtype).view(flag_values.dtype))
+            if isinstance(histogram, da.Array):
+                histogram = da.where(da.arange(num_values) == fill_index, 0, histogram)
+            else:
+                histogram[fill_index] = 0
+
+        return histogram
+
+    @staticmethod
+    def parse_masks(flag_masks):
+        """
+        Convert the flag_masks attribute, comma separated string or list of numbers, to a list of integers.
+        :param flag_masks: the attribute value
+        :return list of int
+         """
+        if isinstance(flag_masks, str):
+            return [int(mask) for mask in flag_masks.replace(",", " ").split()]
+
+        return [int(mask) for mask in np.atleast_1d(flag_masks)]
+
+    @staticmethod
+    def _count_from_histogram(histogram, masks):
+        flag_values = np.arange(histogram.shape[0], dtype=np.int64)
+        counts = np.zeros(len(masks), dtype=np.int64)
+        for index, mask in enumerate(masks):
+            bit_pattern = mask & (histogram.shape[0] - 1)
+            counts[index] = histogram[np.bitwise_and(flag_values, bit_pattern) != 0].sum()
+        return counts
+
+    @staticmethod
+    def _get_fill_value(variable):
+        fill_value = variable.encoding.get("_FillValue", variable.attrs.get("_FillValue"))
+        if fill_value is None or np.isnan(fill_value):
+            return None
+        return fill_value
+
+    @staticmethod
+    def _get_flag_names(variable, masks):
+        meanings = variable.attrs.get("flag_meanings")
+        if meanings is not None:
+            meanings = meanings.split()
+            if len(meanings) == len(masks):
+                return meanings
+
+        return [str(mask) for mask in masks]
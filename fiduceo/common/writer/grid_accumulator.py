@@ -0,0 +1,209 @@
+import os
+import uuid
+
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+
+class GridAccumulator:
+    """
+    Online count, mean and sum of squared deviations from the mean (m2) of the values of every cell of a grid. Values
+    are added in vectorized batches: the statistics of a batch are derived per cell with numpy.bincount() and combined
+    with the accumulated ones pairwise (Chan et al.), which for batches of one value per cell is Welford's update.
+    Accumulators of the same grid, e.g. of different days or worker processes, are merged the same way, the result
+    does not depend on how the values were distributed.
+
+    Checkpoints store the count, mean and m2 arrays in an uncompressed numpy .npz file.
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: the grid shape
+         """
+        self.shape = tuple(np.atleast_1d(shape).tolist())
+        size = int(np.prod(self.shape, dtype=np.int64))
+
+        self.count = np.zeros(size, np.int64)
+        self.mean = np.zeros(size, np.float64)
+        self.m2 = np.zeros(size, np.float64)
+
+    def add(self, indices, values):
+        """
+        Add values at flat cell indices. A cell may occur more than once, NaN values are skipped.
+        :param indices: the flat cell indices, e.g. row * width + column
+        :param values: the values, same shape as the indices
+         """
+        indices = np.asarray(indices).ravel()
+        values = np.asarray(values, np.float64).ravel()
+        valid = np.isfinite(values)
+        if not np.all(valid):
+            indices = indices[valid]
+            values = values[valid]
+
+        size = len(self.count)
+        batch_count = np.bincount(indices, minlength=size)
+        cells = batch_count > 0
+
+        batch_mean = np.zeros(size, np.float64)
+        batch_mean[cells] = np.bincount(indices, weights=values, minlength=size)[cells] / batch_count[cells]
+
+        # deviations from the batch means, the batch is not sensitive to the magnitude of the values
+        deviations = values - batch_mean[indices]
+        batch_m2 = np.bincount(indices, weights=deviations * deviations, minlength=size)
+
+        self._combine(cells, batch_count[cells], batch_mean[cells], batch_m2[cells])
+
+    def add_grid(self, values):
+        """
+        Add one value per cell, e.g. the daily means of a grid. NaN values are skipped.
+        :param values: array of the grid shape
+         """
+        values = np.asarray(values, np.float64).ravel()
+        if values.shape != self.count.shape:
+            raise ValueError("values do not match the grid shape")
+
+        cells = np.isfinite(values)
+        if np.all(cells):
+            self._combine(slice(None), 1, values, 0.0)
+            return
+
+        self._combine(cells, 1, values[cells], 0.0)
+
+    def merge(self, other):
+        """
+        Add all values accumulated by another accumulator of the same grid.
+        :param other: the GridAccumulator
+        :return this accumulator
+         """
+        if other.shape != self.shape:
+            raise ValueError("accumulators of different grid shapes cannot be merged")
+
+        cells = other.count > 0
+        self._combine(cells, other.count[cells], other.mean[cells], other.m2[cells])
+        return self
+
+    def get_count(self):
+        """
+        :return the number of values per cell, array of the grid shape
+         """
+        return self.count.reshape(self.shape)
+
+    def get_mean(self):
+        """
+        :return the mean per cell, NaN for cells without values, array of the grid shape
+         """
+        mean = np.where(self.count > 0, self.mean, np.NaN)
+        return mean.reshape(self.shape)
+
+    def get_variance(self, ddof=1):
+        """
+        :param ddof: delta degrees of freedom, 1 for the sample variance (default), 0 for the population variance
+        :return the variance per cell, NaN for cells with ddof values or less, array of the grid shape
+         """
+        variance = np.full(self.count.shape, np.NaN, np.float64)
+        cells = self.count > ddof
+        variance[cells] = self.m2[cells] / (self.count[cells] - ddof)
+        return variance.reshape(self.shape)
+
+    def get_standard_deviation(self, ddof=1):
+        """
+        :param ddof: delta degrees of freedom, 1 for the sample standard deviation (default), 0 for the population standard deviation
+        :return the standard deviation per cell, NaN for cells with ddof values or less, array of the grid shape
+         """
+        return np.sqrt(self.get_variance(ddof=ddof))
+
+    def to_arrays(self, prefix=""):
+        """
+        Get the state of the accumulator as arrays, e.g. to store it together with other data in one checkpoint.
+        :param prefix: prefix of the array names
+        :return dictionary name -> array
+         """
+        return {prefix + "shape": np.array(self.shape, np.int64), prefix + "count": self.count, prefix + "mean": self.mean, prefix + "m2": self.m2}
+
+    @staticmethod
+    def from_arrays(arrays, prefix=""):
+        """
+        Restore an accumulator from arrays written by to_arrays().
+        :param arrays: dictionary like object name -> array, e.g. an opened .npz file
+        :param prefix: prefix of the array names
+        :return the GridAccumulator
+         """
+        accumulator = GridAccumulator(arrays[prefix + "shape"])
+        accumulator.count[:] = arrays[prefix + "count"]
+        accumulator.mean[:] = arrays[prefix + "mean"]
+        accumulator.m2[:] = arrays[prefix + "m2"]
+        return accumulator
+
+    def save(self, file):
+        """
+        Write a checkpoint. The file is replaced atomically, readers never see a partially written checkpoint.
+        :param file: the checkpoint file path, conventionally ending with ".npz"
+         """
+        GridAccumulator.save_arrays(file, self.to_arrays())
+
+    @staticmethod
+    def load(file):
+        """
+        Read a checkpoint written by save().
+        :param file: the checkpoint file path
+        :return the GridAccumulator
+         """
+        with np.load(file) as arrays:
+            GridAccumulator.check_version(arrays, file)
+            return GridAccumulator.from_arrays(arrays)
+
+    @staticmethod
+    def merge_files(files):
+        """
+        Merge checkpoints, e.g. written by parallel workers. Only two accumulators are held in memory at a time.
+        :param files: the checkpoint file paths
+        :return the merged GridAccumulator
+         """
+        merged = None
+        for file in files:
+            accumulator = GridAccumulator.load(file)
+            if merged is None:
+                merged = accumulator
+            else:
+                merged.merge(accumulator)
+
+        if merged is None:
+            raise ValueError("no checkpoint files to merge")
+        return merged
+
+    @staticmethod
+    def save_arrays(file, arrays):
+        """
+        Write arrays to an uncompressed .npz checkpoint file with the checkpoint format version, replacing the file atomically.
+        :param file: the checkpoint file path
+        :param arrays: dictionary name -> array
+         """
+        temp_file = file + "." + uuid.uuid4().hex[:12] + ".tmp"
+        try:
+            with open(temp_file, "wb") as checkpoint:
+                np.savez(checkpoint, checkpoint_version=np.array(CHECKPOINT_VERSION), **arrays)
+            os.replace(temp_file, file)
+        finally:
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+
+    @staticmethod
+    def check_version(arrays, file):
+        """
+        Check the format version of an opened checkpoint file.
+        :param arrays: the opened .npz file
+        :param file: the file path, for the error message
+         """
+        if "checkpoint_version" not in arrays or int(arrays["checkpoint_version"]) != CHECKPOINT_VERSION:
+            raise IOError("unsupported checkpoint format: " + str(file))
+
+    def _combine(self, cells, count, mean, m2):
+        previous_count = self.count[cells]
+        total_count = previous_count + count
+
+        # pairwise combination of mean and sum of squared deviations (Chan et al.)
+        delta = mean - self.mean[cells]
+        self.mean[cells] += delta * count / total_count
+        self.m2[cells] += m2 + delta * delta * previous_count * count / total_count
+        self.count[cells] = total_count
@@ -0,0 +1,145 @@
+import numpy as np
+from xarray import Variable
+from xarray.conventions import encode_cf_variable, decode_cf_variable
+
+from fiduceo.common.writer.default_data import DefaultData
+
+PACKING_ATTRIBUTES = ("scale_factor", "add_offset", "_FillValue")
+
+
+class PackedData:
+    """
+    Packed storage of scaled variables. Variables written as integers with scale factor and offset are usually held in
+    memory as floating point data and converted when writing. In packed storage, they are held in their packed integer
+    data type with the packing attributes "scale_factor", "add_offset" and "_FillValue", exactly as written to the file:
+    the memory needed is halved or quartered and the writer passes the data to the compression without conversion.
+
+    Packing and unpacking follow the CF conventions as implemented by xarray, packed templates produce files identical
+    to those of unpacked templates. Use PackedVariable to read and write the physical values of packed variables.
+    """
+
+    @staticmethod
+    def pack(dataset):
+        """
+        Convert all scaled floating point variables of a dataset to packed storage, in place.
+        :param dataset: the dataset
+        :return the dataset
+         """
+        for name in list(dataset.variables):
+            variable = dataset.variables[name]
+            if PackedData.is_packable(variable):
+                dataset[name] = PackedData._pack_variable(variable)
+
+        return dataset
+
+    @staticmethod
+    def wrap_builder(key, build_function):
+        """
+        Derive the template key and build function of the packed variant of a template.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :return tuple (key, build function) of the packed template
+         """
+        return ("PACKED", key), lambda height: PackedData.pack(build_function(height))
+
+    @staticmethod
+    def unpack(dataset):
+        """
+        Convert all packed variables of a dataset to floating point data, in place.
+        :param dataset: the dataset
+        :return the dataset
+         """
+        for name in list(dataset.variables):
+            variable = dataset.variables[name]
+            if PackedData.is_packed(variable):
+                dataset[name] = decode_cf_variable(name, variable).load()
+
+        return dataset
+
+    @staticmethod
+    def is_packable(variable):
+        """
+        Check whether a variable is held as floating point data and written as scaled integer.
+        :param variable: the variable
+        :return true if the variable can be packed
+         """
+        data_type = variable.encoding.get("dtype")
+        if data_type is None or variable.dtype.kind != "f" or variable.ndim == 0:
+            return False
+
+        if np.dtype(data_type).kind not in "iu":
+            return False
+
+        return "scale_factor" in variable.encoding or "add_offset" in variable.encoding
+
+    @staticmethod
+    def is_packed(variable):
+        """
+        Check whether a variable is in packed storage.
+        :param variable: the variable
+        :return true for integer variables with scale factor or offset attribute
+         """
+        return variable.dtype.kind in "iu" and ("scale_factor" in variable.attrs or "add_offset" in variable.attrs)
+
+    @staticmethod
+    def _pack_variable(variable):
+        data = variable.data
+        if not DefaultData.is_probe_array(data):
+            packed = encode_cf_variable(variable)
+        else:
+            # template probe - pack the single fill value only
+            single_value = Variable([], data.flat[0], attrs=variable.attrs, encoding=variable.encoding)
+            packed = encode_cf_variable(single_value)
+            packed = Variable(variable.dims, np.broadcast_to(packed.data, variable.shape), attrs=packed.attrs, encoding=packed.encoding)
+
+        packed.encoding["dtype"] = packed.dtype
+        return packed
+
+
+class PackedVariable:
+    """
+    Access to the physical values of a variable: values are packed on assignment and unpacked when read. Assigning values
+    not representable in the packed data type raises a ValueError. Variables not in packed storage are accessed directly,
+    so that the same code handles packed and unpacked templates.
+    """
+
+    def __init__(self, variable):
+        """
+        :param variable: the variable, e.g. dataset.variables["latitude"] or dataset["latitude"]
+         """
+        self.variable = getattr(variable, "variable", variable)
+
+    @property
+    def packed(self):
+        return PackedData.is_packed(self.variable)
+
+    def __getitem__(self, key):
+        values = self.variable.data[key]
+        if not self.packed:
+            return values
+
+        values = np.asarray(values)
+        selection = Variable(["dim_" + str(index) for index in range(values.ndim)], values, attrs=self._get_packing_attributes())
+        return decode_cf_variable("packed", selection).values
+
+    def __setitem__(self, key, values):
+        if not self.packed:
+            self.variable.data[key] = values
+            return
+
+        values = np.asarray(values)
+        if values.dtype.kind != "f":
+            values = values.astype(np.float64)
+
+        # scaled without the integer conversion, values out of the range of the data type would wrap around
+        selection = Variable(["dim_" + str(index) for index in range(values.ndim)], values, encoding=self._get_packing_attributes())
+        packed = np.around(encode_cf_variable(selection).values)
+
+        data_type = self.variable.dtype
+        if not np.all((packed >= np.iinfo(data_type).min) & (packed <= np.iinfo(data_type).max)):
+            raise ValueError("values out of the range of the packed data type " + str(data_type))
+
+        self.variable.data[key] = packed.astype(data_type)
+
+    def _get_packing_attributes(self):
+        return dict((name, self.variable.attrs[name]) for name in PACKING_ATTRIBUTES if name in self.variable.attrs)
@@ -0,0 +1,105 @@
+import os
+
+from fiduceo.common.writer.atomic_writer import AtomicWriter
+from fiduceo.common.writer.block_statistics import BlockStatistics
+from fiduceo.common.writer.chunking_advisor import ChunkingAdvisor
+from fiduceo.common.writer.encoding_plan import EncodingPlan
+from fiduceo.common.writer.flag_statistics import FlagStatistics
+from fiduceo.common.writer.variable_statistics import VariableStatistics
+from fiduceo.common.writer.write_profiler import WriteProfiler, FLAG_MAPPING, VALIDATION, ENCODING
+
+FLAG_COUNTS = "flag_counts"
+DATA_STATISTICS = "data_statistics"
+
+
+class ProductWriter:
+    """
+    The write procedure shared by the FCDR and CDR writers: flag mapping, statistics, range check, encoding and the
+    atomic write of the product, timed by the profiler. Flag counts, variable statistics and the range check are
+    computed by the AtomicWriter together with the chunks of dask backed datasets, in-memory data is passed once more
+    before writing.
+    """
+
+    @staticmethod
+    def write(ds, file, map_flags=None, range_checker=None, compression_level=None, overwrite=False, resume=False, cache_encoding=True, flag_statistics=False,
+              variable_statistics=False, profiler=None, scheduler=None, access_pattern=None):
+        """
+        Save a dataset to NetCDF file.
+        :param ds: The dataset
+        :param file: File path
+        :param map_flags: function mapping the sensor specific flags to the global flag variable, signature map_flags(ds), optional
+        :param range_checker: checks the data of the scaled variables against the ranges of their packed data types, optional. Provides get_scaled_arrays(ds),
+        get_fill_values(ds) and check_dataset_scaling_ranges(ds, statistics=statistics), e.g. DataUtility
+        :param compression_level: the file compression level, 0 - 9, default is 5
+        :param overwrite: set true to overwrite existing files. The existing file is replaced only after the new one has been written completely
+        :param resume: set true to write variable by variable with a progress journal; repeating an interrupted write continues after the last completed variable
+        :param cache_encoding: set false to compile the encoding for this dataset only instead of using the plan cached per layout and variable encodings
+        :param flag_statistics: set true to count the pixels per flag of all flag variables, stored as attribute "flag_counts" aligned with "flag_masks"
+        :param variable_statistics: set true to store valid count, fill fraction, minimum, maximum, mean and standard deviation of all numerical variables as attributes
+        :param profiler: WriteProfiler collecting the time of all processing phases, optional
+        :param scheduler: the dask scheduler computing and writing dask backed variables chunk by chunk, "threads" (default) or "processes"
+        :param access_pattern: the expected read access pattern of the product, "full_scan", "scanline_blocks", "spatial_tiles" or "per_channel". If set, the chunk sizes
+        of all data variables are calculated by the ChunkingAdvisor for it instead of using the chunk sizes of the template
+        :return if flag_statistics is set, dictionary variable name -> dictionary flag meaning -> number of pixels, else None
+         """
+        if os.path.isfile(file):
+            if overwrite is not True:
+                raise IOError("The file already exists: " + file)
+
+        if profiler is None:
+            profiler = WriteProfiler.disabled()
+        profiler.start()
+
+        if map_flags is not None:
+            # for dask backed datasets, the mapping is lazy and evaluated chunk by chunk while writing
+            with profiler.phase(FLAG_MAPPING):
+                map_flags(ds)
+
+        def computations(data):
+            # data is the dataset with the dask backed variables as written, the statistics are derived from the stored chunks
+            lazy = dict()
+            if flag_statistics is True:
+                lazy[FLAG_COUNTS] = FlagStatistics.calculate(data, compute=False)
+
+            if variable_statistics is True:
+                lazy[DATA_STATISTICS] = VariableStatistics.calculate(data, compute=False)
+            elif range_checker is not None:
+                lazy[DATA_STATISTICS] = BlockStatistics.calculate_all(range_checker.get_scaled_arrays(data), fill_values=range_checker.get_fill_values(data), compute=False)
+            return lazy
+
+        statistics = dict()
+
+        def finalise(results):
+            attributes = dict()
+            if flag_statistics is True:
+                statistics.update(FlagStatistics.apply(ds, counts=results[FLAG_COUNTS]))
+                attributes.update(FlagStatistics.get_attributes(results[FLAG_COUNTS]))
+
+            if variable_statistics is True:
+                VariableStatistics.apply(ds, statistics=results[DATA_STATISTICS])
+                for var_name, var_attributes in VariableStatistics.get_attributes(results[DATA_STATISTICS]).items():
+                    attributes.setdefault(var_name, dict()).update(var_attributes)
+
+            if range_checker is not None:
+                with profiler.phase(VALIDATION):
+                    range_checker.check_dataset_scaling_ranges(ds, statistics=results[DATA_STATISTICS])
+            return attributes
+
+        if compression_level is None:
+            compression_level = 5
+
+        with profiler.phase(ENCODING):
+            if access_pattern is not None:
+                ChunkingAdvisor.apply(ds, access_pattern=access_pattern)
+
+            if cache_encoding is True:
+                encoding_plan = EncodingPlan.get(ds, compression_level)
+            else:
+                encoding_plan = EncodingPlan.compile(ds, compression_level)
+            encoding = encoding_plan.get_encoding(ds)
+
+        computed = flag_statistics is True or variable_statistics is True or range_checker is not None
+        AtomicWriter.write(ds, file, encoding, resume=resume, profiler=profiler, scheduler=scheduler, computations=computations if computed else None, finalise=finalise)
+        profiler.finish(file, ds.nbytes)
+
+        return statistics if flag_statistics is True else None
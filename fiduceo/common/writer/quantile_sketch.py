@@ -0,0 +1,162 @@
+import numpy as np
+
+NUM_MARKERS = 5
+
+
+class QuantileSketch:
+    """
+    Streaming estimates of quantiles of the values of every cell of a grid with the P-square algorithm (Jain and
+    Chlamtac, 1985): per cell and quantile, five markers hold the minimum, the maximum, the quantile and two
+    intermediate quantiles; every value added adjusts their heights with a piecewise parabolic prediction. Memory is
+    constant, 40 bytes per cell and quantile, whatever the number of values. All cells are updated vectorized, one
+    value per cell at a time, e.g. one ensemble member.
+
+    Up to five values per cell, the quantiles are exact. Sketches cannot be merged.
+    """
+
+    def __init__(self, shape, probabilities):
+        """
+        :param shape: the grid shape
+        :param probabilities: the probabilities of the quantiles, each within (0, 1)
+         """
+        probabilities = np.atleast_1d(np.asarray(probabilities, np.float64))
+        if np.any(probabilities <= 0.0) or np.any(probabilities >= 1.0):
+            raise ValueError("quantile probabilities must be within (0, 1)")
+
+        self.shape = tuple(np.atleast_1d(shape).tolist())
+        self.probabilities = probabilities
+        size = int(np.prod(self.shape, dtype=np.int64))
+
+        self.count = np.zeros(size, np.int32)
+        # per quantile the marker heights and positions, the desired positions follow from the count
+        self.heights = np.full((len(probabilities), NUM_MARKERS, size), np.NaN, np.float32)
+        self.positions = np.zeros((len(probabilities), NUM_MARKERS, size), np.int32)
+
+    def add_grid(self, values):
+        """
+        Add one value per cell. NaN values are skipped.
+        :param values: array of the grid shape
+         """
+        values = np.asarray(values, np.float32).ravel()
+        if values.shape != self.count.shape:
+            raise ValueError("values do not match the grid shape")
+
+        valid = np.isfinite(values)
+        starting = valid & (self.count < NUM_MARKERS)
+        if np.any(starting):
+            self._add_initial(np.flatnonzero(starting), values[starting])
+
+        updating = valid & ~starting
+        if np.all(updating):
+            self.count += 1
+            for index in range(len(self.probabilities)):
+                self._update(index, None, values)
+        elif np.any(updating):
+            cells = np.flatnonzero(updating)
+            self.count[cells] += 1
+            for index in range(len(self.probabilities)):
+                self._update(index, cells, values[cells])
+
+    def get_quantiles(self):
+        """
+        :return the quantile estimates, array of shape (number of probabilities,) + grid shape, NaN for cells without values
+         """
+        quantiles = np.full((len(self.probabilities), len(self.count)), np.NaN, np.float32)
+
+        estimated = self.count > NUM_MARKERS
+        quantiles[:, estimated] = self.heights[:, 2, estimated]
+
+        # the initial values are exact, interpolated like numpy.quantile()
+        starting = np.flatnonzero((self.count > 0) & ~estimated)
+        if len(starting) > 0:
+            quantiles[:, starting] = np.nanquantile(self.heights[0][:, starting], self.probabilities, axis=0)
+
+        return quantiles.reshape((len(self.probabilities),) + self.shape)
+
+    def get_count(self):
+        """
+        :return the number of values per cell, array of the grid shape
+         """
+        return self.count.reshape(self.shape)
+
+    def to_arrays(self, prefix=""):
+        """
+        Get the state of the sketch as arrays, e.g. to store it in a checkpoint, see GridAccumulator.save_arrays().
+        :param prefix: prefix of the array names
+        :return dictionary name -> array
+         """
+        return {prefix + "shape": np.array(self.shape, np.int64), prefix + "probabilities": self.probabilities, prefix + "count": self.count, prefix + "heights": self.heights,
+                prefix + "positions": self.positions}
+
+    @staticmethod
+    def from_arrays(arrays, prefix=""):
+        """
+        Restore a sketch from arrays written by to_arrays().
+        :param arrays: dictionary like object name -> array, e.g. an opened .npz file
+        :param prefix: prefix of the array names
+        :return the QuantileSketch
+         """
+        sketch = QuantileSketch(arrays[prefix + "shape"], arrays[prefix + "probabilities"])
+        sketch.count[:] = arrays[prefix + "count"]
+        sketch.heights[:] = arrays[prefix + "heights"]
+        sketch.positions[:] = arrays[prefix + "positions"]
+        return sketch
+
+    def _add_initial(self, cells, values):
+        slots = self.count[cells]
+        self.heights[:, slots, cells] = values
+        self.count[cells] += 1
+
+        # the markers are initialised with the sorted first five values
+        complete = cells[self.count[cells] == NUM_MARKERS]
+        if len(complete) > 0:
+            self.heights[:, :, complete] = np.sort(self.heights[:, :, complete], axis=1)
+            self.positions[:, :, complete] = np.arange(1, NUM_MARKERS + 1, dtype=np.int32)[np.newaxis, :, np.newaxis]
+
+    def _update(self, index, cells, values):
+        probability = self.probabilities[index]
+        if cells is None:
+            # all cells are updated, the markers are modified in place
+            heights = self.heights[index]
+            positions = self.positions[index]
+            counts = self.count
+        else:
+            heights = self.heights[index][:, cells]
+            positions = self.positions[index][:, cells]
+            counts = self.count[cells]
+
+        # the cell of the markers containing the value, extreme values move the outer markers
+        cell = (values >= heights[1]).astype(np.int8)
+        cell += values >= heights[2]
+        cell += values >= heights[3]
+        np.minimum(heights[0], values, out=heights[0])
+        np.maximum(heights[4], values, out=heights[4])
+        for marker in range(1, NUM_MARKERS):
+            positions[marker] += cell < marker
+
+        increments = np.array([0.0, probability / 2.0, probability, (1.0 + probability) / 2.0, 1.0])
+        for marker in range(1, 4):
+            offset = 1.0 + (counts - 1) * increments[marker] - positions[marker]
+            adjust = np.flatnonzero(((offset >= 1.0) & (positions[marker + 1] - positions[marker] > 1)) | ((offset <= -1.0) & (positions[marker - 1] - positions[marker] < -1)))
+            if len(adjust) == 0:
+                continue
+
+            step = np.where(offset[adjust] >= 0.0, 1, -1)
+            height = heights[marker].take(adjust).astype(np.float64)
+            below = heights[marker - 1].take(adjust).astype(np.float64)
+            above = heights[marker + 1].take(adjust).astype(np.float64)
+            position = positions[marker].take(adjust).astype(np.float64)
+            position_below = positions[marker - 1].take(adjust).astype(np.float64)
+            position_above = positions[marker + 1].take(adjust).astype(np.float64)
+
+            parabolic = height + step / (position_above - position_below) * ((position - position_below + step) * (above - height) / (position_above - position) + (position_above - position - step) * (height - below) / (position - position_below))
+            neighbour = np.where(step > 0, above, below)
+            neighbour_position = np.where(step > 0, position_above, position_below)
+            linear = height + step * (neighbour - height) / (neighbour_position - position)
+
+            heights[marker][adjust] = np.where((below < parabolic) & (parabolic < above), parabolic, linear)
+            positions[marker][adjust] += step
+
+        if cells is not None:
+            self.heights[index][:, cells] = heights
+            self.positions[index][:, cells] = positions
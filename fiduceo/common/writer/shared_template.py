@@ -0,0 +1,219 @@
+import os
+import sys
+from collections import OrderedDict
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # Python < 3.8, shared memory templates are not supported
+
+try:
+    from multiprocessing import resource_tracker
+except ImportError:
+    resource_tracker = None
+
+import numpy as np
+import xarray as xr
+from xarray import Variable, IndexVariable
+
+from fiduceo.common.writer.template_schema import TemplateSchema
+
+# variable buffers start at multiples of this number of bytes
+ARENA_ALIGNMENT = 64
+
+# attaching to a block registers it with the resource tracker of the attaching process up to Python 3.12 (bpo-38119),
+# the registration is removed with resource_tracker internals tested with these versions. From Python 3.13, blocks are
+# attached with track=False
+ATTACH_REGISTERS = sys.version_info < (3, 13)
+
+
+class ArenaDescriptor:
+    """
+    Small, picklable description of a shared memory arena: the name of the shared memory block and the location of the
+    variable buffers in it. Passed to worker processes to attach to a SharedTemplate.
+    :param name: name of the shared memory block
+    :param size: size of the block in bytes
+    :param entries: list of (variable name, dims, shape, dtype string, offset)
+    :param tracker: identity of the resource tracker of the creating process, None if attached blocks are not registered
+     """
+
+    def __init__(self, name, size, entries, tracker=None):
+        self.name = name
+        self.size = size
+        self.entries = entries
+        self.tracker = tracker
+
+
+class SharedTemplate:
+    """
+    Template dataset with the data of all variables in one multiprocessing shared memory block. Worker processes attach
+    with the descriptor and fill disjoint parts of the variables, e.g. scanline ranges or tiles, without copying; the
+    creating process writes the dataset afterwards.
+
+    Index coordinates and variables of object data type are not shared, xarray keeps them in private memory. The creating
+    process owns the shared memory, close() releases it. Datasets and arrays of a SharedTemplate must not be used after
+    closing it.
+    """
+
+    def __init__(self, shm, descriptor, dataset, arrays, owner):
+        self._shm = shm
+        self.descriptor = descriptor
+        self.dataset = dataset
+        self.arrays = arrays
+        self.owner = owner
+
+    @staticmethod
+    def create(key, build_function, height):
+        """
+        Create a template in shared memory, from the cached template schema if possible.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :param height: the height in pixels of the product
+        :return the SharedTemplate
+         """
+        schema = TemplateSchema.get(key, build_function)
+        if schema is None or height < schema.min_height:
+            return SharedTemplate.from_dataset(build_function(height))
+
+        return SharedTemplate.from_schema(schema, height)
+
+    @staticmethod
+    def from_schema(schema, height):
+        """
+        Create a template in shared memory from a template schema, the template data is allocated in shared memory only.
+        :param schema: the TemplateSchema
+        :param height: the height in pixels of the product
+        :return the SharedTemplate
+         """
+        dim_sizes = schema.get_dim_sizes(height)
+        layout = [(variable.name, variable.dims, variable.get_shape(dim_sizes), variable.dtype) for variable in schema.variables if not variable.is_index]
+        shm, descriptor, arrays = SharedTemplate._allocate(layout)
+
+        try:
+            dataset = schema.instantiate(height, allocator=lambda variable, shape: arrays.get(variable.name))
+        except Exception:
+            SharedTemplate._release(shm, owner=True)
+            raise
+
+        return SharedTemplate(shm, descriptor, dataset, arrays, owner=True)
+
+    @staticmethod
+    def from_dataset(dataset):
+        """
+        Create a template in shared memory holding a copy of a dataset.
+        :param dataset: the template dataset
+        :return the SharedTemplate
+         """
+        layout = [(name, variable.dims, variable.shape, variable.dtype) for name, variable in dataset.variables.items() if not isinstance(variable, IndexVariable)]
+        shm, descriptor, arrays = SharedTemplate._allocate(layout)
+
+        variables = OrderedDict()
+        for name, variable in dataset.variables.items():
+            data = arrays.get(name)
+            if data is None:
+                variables[name] = variable.copy(deep=False)
+                continue
+
+            data[...] = variable.values
+            shared_variable = Variable(variable.dims, data, attrs=variable.attrs.copy())
+            shared_variable.encoding = variable.encoding.copy()
+            variables[name] = shared_variable
+
+        shared_dataset = xr.Dataset(data_vars=variables, attrs=dataset.attrs.copy())
+        shared_dataset = shared_dataset.set_coords([name for name in dataset.coords if name in variables])
+        return SharedTemplate(shm, descriptor, shared_dataset, arrays, owner=True)
+
+    @staticmethod
+    def attach(descriptor):
+        """
+        Attach to a template created in another process.
+        :param descriptor: the ArenaDescriptor of the template
+        :return the SharedTemplate, its dataset contains the shared variables without attributes and encoding
+         """
+        SharedTemplate._check_supported()
+        if ATTACH_REGISTERS:
+            shm = shared_memory.SharedMemory(name=descriptor.name)
+            # the resource tracker of this process unlinks the block when this process exits. Processes started by
+            # multiprocessing share the tracker of the creating process, it keeps the block until the owner releases it.
+            # Other processes, e.g. started with subprocess, unregister the block.
+            tracking = SharedTemplate._get_tracking(shm)
+            if tracking is not None and tracking[0] != descriptor.tracker:
+                resource_tracker.unregister(tracking[1], "shared_memory")
+        else:
+            shm = shared_memory.SharedMemory(name=descriptor.name, track=False)
+
+        arrays = SharedTemplate._create_arrays(shm, descriptor.entries)
+
+        variables = OrderedDict((name, Variable(dims, arrays[name])) for name, dims, _, _, _ in descriptor.entries)
+        return SharedTemplate(shm, descriptor, xr.Dataset(data_vars=variables), arrays, owner=False)
+
+    def close(self):
+        """
+        Detach from the shared memory, the owner also releases it.
+         """
+        if self._shm is None:
+            return
+
+        self.dataset = None
+        self.arrays = None
+        SharedTemplate._release(self._shm, self.owner)
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _allocate(layout):
+        entries = []
+        offset = 0
+        for name, dims, shape, dtype in layout:
+            dtype = np.dtype(dtype)
+            if dtype.hasobject:
+                continue
+
+            entries.append((name, tuple(dims), tuple(int(size) for size in shape), dtype.str, offset))
+            nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            offset += -(-nbytes // ARENA_ALIGNMENT) * ARENA_ALIGNMENT
+
+        SharedTemplate._check_supported()
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        tracking = SharedTemplate._get_tracking(shm)
+        descriptor = ArenaDescriptor(shm.name, shm.size, entries, None if tracking is None else tracking[0])
+        return shm, descriptor, SharedTemplate._create_arrays(shm, entries)
+
+    @staticmethod
+    def _check_supported():
+        if shared_memory is None:
+            raise ValueError("shared memory templates require Python 3.8 or later")
+
+    @staticmethod
+    def _get_tracking(shm):
+        # the identity of the resource tracker of this process and the name the block is registered with, None if
+        # attached blocks are not registered. The pipe to the tracker identifies it, child processes inherit the pipe of
+        # their parent. Relies on the multiprocessing internals of the versions selected by ATTACH_REGISTERS
+        if os.name != "posix" or not ATTACH_REGISTERS:
+            return None
+
+        resource_tracker.ensure_running()
+        stat = os.fstat(resource_tracker.getfd())
+        return (stat.st_dev, stat.st_ino), shm._name
+
+    @staticmethod
+    def _create_arrays(shm, entries):
+        arrays = OrderedDict()
+        for name, _, shape, dtype, offset in entries:
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        return arrays
+
+    @staticmethod
+    def _release(shm, owner):
+        try:
+            shm.close()
+        except BufferError:
+            pass  # arrays still referenced elsewhere, the mapping is released with the last of them
+
+        if owner:
+            shm.unlink()
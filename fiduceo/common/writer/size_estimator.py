@@ -0,0 +1,186 @@
+import json
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+# writing creates encoded copies of the variables, the peak memory is larger than the dataset itself
+WRITE_MEMORY_FACTOR = 1.5
+
+# number of bytes per variable read from a sample file for calibration
+CALIBRATION_SAMPLE_BYTES = 4 * 1024 * 1024
+
+
+class CompressionModel:
+    """
+    Per variable compression ratios, file bytes per byte of in-memory data. The ratios are calibrated on sample
+    products: either by compressing the data of sample files the way the writers do (shuffle and zlib), or from the
+    reports of a WriteProfiler. Variables without calibration use the default ratio, 1.0 predicts uncompressed files.
+    """
+
+    def __init__(self, default_ratio=1.0):
+        """
+        :param default_ratio: ratio of variables not calibrated
+         """
+        self.default_ratio = default_ratio
+        self._samples = dict()
+
+    def get_ratio(self, name):
+        """
+        Get the compression ratio of a variable.
+        :param name: the variable name
+        :return compressed bytes / in-memory bytes
+         """
+        sample = self._samples.get(name)
+        if sample is None or sample[0] == 0:
+            return self.default_ratio
+
+        return sample[1] / sample[0]
+
+    def add(self, name, raw_bytes, compressed_bytes):
+        """
+        Add a calibration sample, repeated samples of a variable are accumulated.
+        :param name: the variable name
+        :param raw_bytes: size of the data in memory
+        :param compressed_bytes: size of the data in the file
+         """
+        raw_sum, compressed_sum = self._samples.get(name, (0, 0))
+        self._samples[name] = (raw_sum + int(raw_bytes), compressed_sum + int(compressed_bytes))
+
+    def add_report(self, report):
+        """
+        Add the variable sizes of a WriteProfiler report as calibration samples.
+        :param report: the report, as returned by WriteProfiler.finish()
+         """
+        for name, variable in report["variables"].items():
+            self.add(name, variable["raw_bytes"], variable["compressed_bytes"])
+
+    def calibrate(self, file, compression_level=5, sample_bytes=CALIBRATION_SAMPLE_BYTES, schema=None):
+        """
+        Add calibration samples from a product file. Evenly spaced rows of every numerical variable are compressed
+        with shuffle and zlib, as done by the NetCDF library when writing.
+        :param file: path to the product file
+        :param compression_level: the compression level used for the products, 0 - 9
+        :param sample_bytes: maximal number of bytes read per variable
+        :param schema: the TemplateSchema of the products, its data types are the in-memory data types the ratios refer to. Optional, without schema scaled
+        variables are taken as held in float32, like in the templates, and other variables in the data type of the file
+         """
+        with xr.open_dataset(file, decode_cf=False) as raw_dataset:
+            for name, raw_variable in raw_dataset.variables.items():
+                if raw_variable.dtype.kind not in "biuf" or raw_variable.size == 0:
+                    continue
+
+                raw_data = CompressionModel._read_sample(raw_variable, sample_bytes)
+                compressed_bytes = len(zlib.compress(CompressionModel._shuffle(raw_data), compression_level))
+                self.add(name, raw_data.size * CompressionModel._get_memory_dtype(name, raw_variable, schema).itemsize, compressed_bytes)
+
+    def save(self, file):
+        """
+        Store the model as JSON file.
+        :param file: the file path
+         """
+        samples = OrderedDict((name, list(self._samples[name])) for name in sorted(self._samples))
+        with open(file, "w") as json_file:
+            json.dump(OrderedDict([("default_ratio", self.default_ratio), ("samples", samples)]), json_file, indent=2)
+
+    @staticmethod
+    def load(file):
+        """
+        Read a model stored with save().
+        :param file: the file path
+        :return the model
+         """
+        with open(file, "r") as json_file:
+            content = json.load(json_file)
+
+        model = CompressionModel(default_ratio=content["default_ratio"])
+        for name, (raw_bytes, compressed_bytes) in content["samples"].items():
+            model.add(name, raw_bytes, compressed_bytes)
+        return model
+
+    @staticmethod
+    def _get_memory_dtype(name, raw_variable, schema):
+        if schema is not None:
+            variable_schema = schema.get_variable(name)
+            if variable_schema is not None:
+                return np.dtype(variable_schema.dtype)
+
+        if "scale_factor" in raw_variable.attrs or "add_offset" in raw_variable.attrs:
+            return np.dtype(np.float32)
+        return raw_variable.dtype
+
+    @staticmethod
+    def _read_sample(variable, sample_bytes):
+        if variable.ndim == 0 or variable.nbytes <= sample_bytes:
+            return np.asarray(variable.values)
+
+        num_rows = variable.shape[0]
+        row_bytes = variable.nbytes // num_rows
+        num_sample_rows = max(1, min(num_rows, sample_bytes // max(1, row_bytes)))
+        rows = np.unique(np.linspace(0, num_rows - 1, num_sample_rows).astype(np.int64))
+        return np.asarray(variable[rows].values)
+
+    @staticmethod
+    def _shuffle(data):
+        data = np.ascontiguousarray(data)
+        return data.view(np.uint8).reshape(-1, data.dtype.itemsize).T.tobytes()
+
+
+class SizeEstimate:
+    """
+    Predicted resource usage of a product.
+    :param memory_bytes: size of the product data in memory
+    :param write_memory_bytes: expected peak memory while writing the product
+    :param file_bytes: predicted size of the product file
+    :param variables: ordered dictionary variable name -> (memory bytes, predicted file bytes)
+     """
+
+    def __init__(self, memory_bytes, write_memory_bytes, file_bytes, variables):
+        self.memory_bytes = memory_bytes
+        self.write_memory_bytes = write_memory_bytes
+        self.file_bytes = file_bytes
+        self.variables = variables
+
+
+class SizeEstimator:
+    """
+    Predicts memory consumption and file size of products, from a template schema without allocating the template.
+    """
+
+    @staticmethod
+    def estimate_schema(schema, height, compression_model=None):
+        """
+        Estimate the sizes of a product.
+        :param schema: the TemplateSchema of the product
+        :param height: the height in pixels of the product
+        :param compression_model: CompressionModel predicting the file size, optional. If None, the file size is the uncompressed size
+        :return the SizeEstimate
+         """
+        dim_sizes = schema.get_dim_sizes(height)
+        variable_bytes = OrderedDict((variable.name, variable.get_nbytes(dim_sizes)) for variable in schema.variables)
+        return SizeEstimator._estimate(variable_bytes, compression_model)
+
+    @staticmethod
+    def estimate_dataset(dataset, compression_model=None):
+        """
+        Estimate the sizes of a product from a dataset.
+        :param dataset: the dataset
+        :param compression_model: CompressionModel predicting the file size, optional. If None, the file size is the uncompressed size
+        :return the SizeEstimate
+         """
+        variable_bytes = OrderedDict((name, variable.nbytes) for name, variable in dataset.variables.items())
+        return SizeEstimator._estimate(variable_bytes, compression_model)
+
+    @staticmethod
+    def _estimate(variable_bytes, compression_model):
+        if compression_model is None:
+            compression_model = CompressionModel()
+
+        variables = OrderedDict()
+        for name, memory_bytes in variable_bytes.items():
+            variables[name] = (memory_bytes, int(round(memory_bytes * compression_model.get_ratio(name))))
+
+        memory_bytes = sum(memory for memory, _ in variables.values())
+        file_bytes = sum(file_bytes for _, file_bytes in variables.values())
+        return SizeEstimate(memory_bytes, int(memory_bytes * WRITE_MEMORY_FACTOR), file_bytes, variables)
@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fiduceo.common.writer.template_schema import TemplateSchema, FILL
+
+# fill value variables are reset in parts of about this size, so that large variables are reset by several threads
+RESET_BLOCK_BYTES = 8 * 1024 * 1024
+
+
+class _PooledTemplate:
+    def __init__(self, schema, capacity):
+        self.schema = schema
+        self.capacity = capacity
+        self.used_height = 0
+
+        dataset = schema.instantiate(capacity)
+        self.arrays = OrderedDict((variable.name, (variable, dataset.variables[variable.name].data)) for variable in schema.variables if not variable.is_index)
+
+    def get_views(self, height):
+        dim_sizes = self.schema.get_dim_sizes(height)
+        views = OrderedDict()
+        for name, (variable_schema, array) in self.arrays.items():
+            views[name] = (variable_schema, array[tuple(slice(0, dim_sizes[dim]) for dim in variable_schema.dims)])
+        return views
+
+
+class TemplatePool:
+    """
+    Pool of template buffers, re-used instead of allocating a new template for every product. Buffers are pooled per
+    template and height bucket: a template is allocated for the bucket height, rounded up to a multiple of the bucket
+    size, and handed out as a dataset of views trimmed to the requested height. Before a buffer is handed out again,
+    the part written by the previous user is reset to the initial values, in place and by several threads.
+
+    Templates must be returned with release() once the dataset has been written, the dataset must not be used afterwards.
+    Templates that cannot be represented by a schema, or are smaller than the chunk sizes, are not pooled.
+
+    The pool must be closed with close() to stop the reset threads, or used as context manager.
+    """
+
+    def __init__(self, bucket_size=4096, max_idle=2, max_workers=None):
+        """
+        :param bucket_size: granularity of the pooled template heights in pixels
+        :param max_idle: maximal number of unused buffers kept per template and height bucket
+        :param max_workers: maximal number of threads resetting a buffer, default as ThreadPoolExecutor
+         """
+        if bucket_size < 1:
+            raise ValueError("invalid bucket size: " + str(bucket_size))
+
+        self.bucket_size = bucket_size
+        self.max_idle = max_idle
+        self.max_workers = max_workers
+
+        self._idle = dict()
+        self._in_use = dict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def acquire(self, key, build_function, height):
+        """
+        Get a template dataset, from a pooled buffer if possible.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :param height: the height in pixels of the product
+        :return the template dataset
+         """
+        schema = TemplateSchema.get(key, build_function)
+        if schema is None or height < schema.min_height:
+            return TemplateSchema.create(key, build_function, height)
+
+        pool_key = (key, self.get_bucket(height))
+        with self._lock:
+            idle = self._idle.get(pool_key)
+            entry = idle.pop() if idle else None
+
+        if entry is None:
+            entry = _PooledTemplate(schema, pool_key[1])
+        else:
+            self._reset(entry)
+
+        entry.used_height = height
+        dataset = TemplatePool._create_dataset(entry, height)
+        with self._lock:
+            self._in_use[id(dataset)] = (pool_key, entry)
+        return dataset
+
+    def release(self, dataset):
+        """
+        Return a template dataset to the pool. Datasets not created by the pool are ignored.
+        :param dataset: the template dataset
+         """
+        with self._lock:
+            item = self._in_use.pop(id(dataset), None)
+            if item is None:
+                return
+
+            pool_key, entry = item
+            idle = self._idle.setdefault(pool_key, [])
+            if len(idle) < self.max_idle:
+                idle.append(entry)
+
+    def get_bucket(self, height):
+        """
+        Calculate the height of the pooled template used for a product.
+        :param height: the height in pixels of the product
+        :return the bucket height
+         """
+        return -(-height // self.bucket_size) * self.bucket_size
+
+    def clear(self):
+        """
+        Drop all unused buffers.
+         """
+        with self._lock:
+            self._idle.clear()
+
+    def close(self):
+        """
+        Drop all unused buffers and stop the threads resetting buffers. A pool used again afterwards starts new threads.
+         """
+        with self._lock:
+            self._idle.clear()
+            executor = self._executor
+            self._executor = None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reset(self, entry):
+        tasks = []
+        for variable_schema, view in entry.get_views(entry.used_height).values():
+            if variable_schema.kind != FILL or view.ndim == 0 or view.nbytes <= RESET_BLOCK_BYTES:
+                tasks.append((variable_schema, view))
+                continue
+
+            block_rows = max(1, RESET_BLOCK_BYTES * view.shape[0] // view.nbytes)
+            for start in range(0, view.shape[0], block_rows):
+                tasks.append((variable_schema, view[start:start + block_rows]))
+
+        executor = self._get_executor()
+        for future in [executor.submit(variable_schema.initialise, view) for variable_schema, view in tasks]:
+            future.result()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    @staticmethod
+    def _create_dataset(entry, height):
+        views = entry.get_views(height)
+        return entry.schema.instantiate(height, allocator=lambda variable_schema, shape: views[variable_schema.name][1], initialise=False)
@@ -0,0 +1,356 @@
+import copy
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+from xarray import Variable, IndexVariable
+
+from fiduceo.common.writer.default_data import DefaultData
+
+# template heights used to capture a schema, large enough that no chunk size is limited by the product height
+PROBE_HEIGHTS = (20000, 30000)
+
+FILL = "fill"
+RANGE = "range"
+LITERAL = "literal"
+
+
+class VariableSchema:
+    """
+    Layout of a single template variable: dimensions, data type, attributes, encoding and how the data is initialised.
+    """
+
+    def __init__(self, name, dims, dtype, attrs, encoding, kind, value, is_coordinate, is_index):
+        self.name = name
+        self.dims = dims
+        self.dtype = dtype
+        self.attrs = attrs
+        self.encoding = encoding
+        self.kind = kind
+        self.value = value
+        self.is_coordinate = is_coordinate
+        self.is_index = is_index
+
+    @property
+    def is_virtual(self):
+        return self.attrs.get("virtual") == "true"
+
+    @property
+    def expression(self):
+        """
+        The expression of a virtual variable, None for variables stored in the product.
+         """
+        if not self.is_virtual:
+            return None
+        return self.attrs.get("expression")
+
+    def get_shape(self, dim_sizes):
+        return tuple(dim_sizes[dim] for dim in self.dims)
+
+    def get_nbytes(self, dim_sizes):
+        return int(np.prod(self.get_shape(dim_sizes), dtype=np.int64)) * self.dtype.itemsize
+
+    def to_dict(self):
+        """
+        Create the declarative description of the variable.
+        :return dictionary with the entries "dims", "dtype", "attrs", "encoding", "data", "value", "coordinate" and "index"
+         """
+        return OrderedDict([("dims", self.dims), ("dtype", self.dtype.str), ("attrs", copy.deepcopy(self.attrs)), ("encoding", copy.deepcopy(self.encoding)), ("data", self.kind),
+                            ("value", copy.deepcopy(self.value)), ("coordinate", self.is_coordinate), ("index", self.is_index)])
+
+    @staticmethod
+    def from_dict(name, description):
+        """
+        Create a variable schema from its declarative description.
+        :param name: the variable name
+        :param description: dictionary as created by to_dict()
+        :return the variable schema
+         """
+        value = description.get("value")
+        if description["data"] == FILL:
+            value = np.array(value, dtype=description["dtype"])[()]
+        elif description["data"] == LITERAL:
+            value = np.array(value, dtype=description["dtype"])
+
+        return VariableSchema(name, tuple(description["dims"]), np.dtype(description["dtype"]), copy.deepcopy(description.get("attrs", dict())),
+                              copy.deepcopy(description.get("encoding", dict())), description["data"], value, description.get("coordinate", False), description.get("index", False))
+
+    def initialise(self, data):
+        """
+        Set the data to the initial values of the variable, in place.
+        :param data: the array, for fill values also a part of the variable data
+         """
+        if self.kind == RANGE:
+            data[...] = np.arange(data.shape[0]).astype(self.dtype)
+        else:
+            data[...] = self.value
+
+    def create_variable(self, dim_sizes, data=None, initialise=True):
+        """
+        Create the variable with initialised data.
+        :param dim_sizes: dictionary dimension name -> size
+        :param data: array the data is written to, optional. If None, a new array is allocated
+        :param initialise: set false to use the supplied data array as is
+        :return the variable
+         """
+        if data is None:
+            data = np.empty(self.get_shape(dim_sizes), self.dtype)
+            initialise = True
+
+        if initialise:
+            self.initialise(data)
+
+        if self.is_index:
+            variable = IndexVariable(self.dims, data, attrs=copy.copy(self.attrs))
+        else:
+            variable = Variable(self.dims, data, attrs=copy.copy(self.attrs))
+        variable.encoding = copy.copy(self.encoding)
+        return variable
+
+
+class TemplateSchema:
+    """
+    Layout of a template dataset, captured once from the imperative template code and instantiated for any product
+    height without running the template code again. The schema is captured by building the template twice in
+    DefaultData probe mode, at two different heights and without allocating the data; dimensions differing between
+    both probes are the height dependent ones.
+
+    The schema can be queried without allocating data (variables, dimensions, virtual variables, product size) and
+    converted to and from a declarative description, see to_dict() and from_dict().
+    """
+
+    _cache = dict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, variables, dim_rules, attrs, min_height):
+        self.variables = variables
+        self.dim_rules = dim_rules
+        self.attrs = attrs
+        self.min_height = min_height
+
+    @staticmethod
+    def create(key, build_function, height):
+        """
+        Create a template dataset from the cached schema. The template is built by the template code when the schema
+        cannot be captured or the height is smaller than the chunk sizes of the template.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :param height: the height of the product
+        :return the template dataset
+         """
+        schema = TemplateSchema.get(key, build_function)
+        if schema is None or height < schema.min_height:
+            return build_function(height)
+
+        return schema.instantiate(height)
+
+    @staticmethod
+    def get(key, build_function):
+        """
+        Get the cached schema of a template, capturing it on first use.
+        :param key: hashable key identifying the template and all its parameters except the height
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :return the schema, None if the template cannot be represented by a schema
+         """
+        with TemplateSchema._cache_lock:
+            if key in TemplateSchema._cache:
+                return TemplateSchema._cache[key]
+
+        schema = TemplateSchema.capture(build_function)
+
+        with TemplateSchema._cache_lock:
+            TemplateSchema._cache[key] = schema
+        return schema
+
+    @staticmethod
+    def capture(build_function):
+        """
+        Capture the schema of a template.
+        :param build_function: function creating the template, signature build_function(height) -> dataset
+        :return the schema, None if the template writes into its default arrays and cannot be represented by a schema
+         """
+        try:
+            with DefaultData.probe():
+                probes = [build_function(height) for height in PROBE_HEIGHTS]
+        except ValueError as e:
+            # default arrays are read-only in probe mode - any other error is a failure of the template code
+            if "read-only" not in str(e):
+                raise
+            logging.getLogger(__name__).debug("template writes into default arrays, it is built without schema: %s", e)
+            return None
+
+        return TemplateSchema._create_from_probes(probes[0], probes[1])
+
+    @staticmethod
+    def clear_cache():
+        with TemplateSchema._cache_lock:
+            TemplateSchema._cache.clear()
+
+    def instantiate(self, height, allocator=None, initialise=True):
+        """
+        Create a template dataset with newly allocated data.
+        :param height: the height of the product
+        :param allocator: function allocating the data of the variables, signature allocator(variable_schema, shape) -> array, optional.
+        Index coordinates are always allocated by xarray
+        :param initialise: set false if the arrays supplied by the allocator are initialised already
+        :return the template dataset
+         """
+        dim_sizes = self.get_dim_sizes(height)
+
+        variables = OrderedDict()
+        coord_names = []
+        for variable_schema in self.variables:
+            data = None
+            if allocator is not None and not variable_schema.is_index:
+                data = allocator(variable_schema, variable_schema.get_shape(dim_sizes))
+
+            variables[variable_schema.name] = variable_schema.create_variable(dim_sizes, data, initialise)
+            if variable_schema.is_coordinate:
+                coord_names.append(variable_schema.name)
+
+        # coordinates are set afterwards to keep the variable order of the template code
+        dataset = xr.Dataset(data_vars=variables, attrs=copy.deepcopy(self.attrs))
+        return dataset.set_coords(coord_names)
+
+    def get_dim_sizes(self, height):
+        """
+        Calculate the dimension sizes of a product.
+        :param height: the height of the product
+        :return dictionary dimension name -> size
+         """
+        return OrderedDict((dim, factor * height + offset) for dim, (factor, offset) in self.dim_rules.items())
+
+    @property
+    def variable_names(self):
+        return [variable.name for variable in self.variables]
+
+    def get_variable(self, name):
+        """
+        Get the schema of a variable.
+        :param name: the variable name
+        :return the variable schema, None if the template has no such variable
+         """
+        for variable in self.variables:
+            if variable.name == name:
+                return variable
+        return None
+
+    def get_virtual_variables(self):
+        """
+        Get the virtual variables, these are computed from other variables when reading.
+        :return ordered dictionary variable name -> expression
+         """
+        return OrderedDict((variable.name, variable.expression) for variable in self.variables if variable.is_virtual)
+
+    def get_nbytes(self, height):
+        """
+        Calculate the size of the data of a template in memory.
+        :param height: the height of the product
+        :return size in bytes
+         """
+        dim_sizes = self.get_dim_sizes(height)
+        return sum(variable.get_nbytes(dim_sizes) for variable in self.variables)
+
+    def validate(self, dataset):
+        """
+        Check a dataset against the schema: all variables present, with the dimensions and data types of the schema.
+        The product height is taken from the dataset.
+        :param dataset: the dataset
+        :return list of problems found, empty if the dataset conforms to the schema
+         """
+        problems = []
+        for variable_schema in self.variables:
+            if variable_schema.name not in dataset.variables:
+                problems.append("missing variable: " + variable_schema.name)
+                continue
+
+            variable = dataset.variables[variable_schema.name]
+            if variable.dims != variable_schema.dims:
+                problems.append(variable_schema.name + ": dimensions " + str(variable.dims) + ", expected " + str(variable_schema.dims))
+            elif variable.dtype != variable_schema.dtype:
+                problems.append(variable_schema.name + ": data type " + str(variable.dtype) + ", expected " + str(variable_schema.dtype))
+
+        for dim, (factor, offset) in self.dim_rules.items():
+            if factor != 0 or dim not in dataset.dims:
+                continue
+            if dataset.dims[dim] != offset:
+                problems.append("dimension " + dim + ": size " + str(dataset.dims[dim]) + ", expected " + str(offset))
+
+        return problems
+
+    def to_dict(self):
+        """
+        Create the declarative description of the schema. The size of every dimension is factor * height + offset.
+        :return dictionary with the entries "dimensions" (dimension name -> dictionary with "factor" and "offset"),
+        "variables" (variable name -> variable description), "attrs" and "min_height"
+         """
+        dimensions = OrderedDict((dim, OrderedDict([("factor", factor), ("offset", offset)])) for dim, (factor, offset) in self.dim_rules.items())
+        variables = OrderedDict((variable.name, variable.to_dict()) for variable in self.variables)
+        return OrderedDict([("dimensions", dimensions), ("variables", variables), ("attrs", copy.deepcopy(self.attrs)), ("min_height", self.min_height)])
+
+    @staticmethod
+    def from_dict(description):
+        """
+        Create a schema from its declarative description.
+        :param description: dictionary as created by to_dict()
+        :return the schema
+         """
+        dim_rules = OrderedDict((dim, (rule["factor"], rule["offset"])) for dim, rule in description["dimensions"].items())
+        variables = [VariableSchema.from_dict(name, variable) for name, variable in description["variables"].items()]
+        return TemplateSchema(variables, dim_rules, copy.deepcopy(description.get("attrs", dict())), description.get("min_height", 0))
+
+    @staticmethod
+    def _create_from_probes(probe_a, probe_b):
+        if list(probe_a.variables) != list(probe_b.variables) or set(probe_a.dims) != set(probe_b.dims):
+            return None
+
+        dim_rules = OrderedDict()
+        height_delta = PROBE_HEIGHTS[1] - PROBE_HEIGHTS[0]
+        for dim, size_a in probe_a.dims.items():
+            size_delta = probe_b.dims[dim] - size_a
+            if size_delta % height_delta != 0:
+                return None
+
+            factor = size_delta // height_delta
+            dim_rules[dim] = (factor, size_a - factor * PROBE_HEIGHTS[0])
+
+        height_dims = set(dim for dim, (factor, _) in dim_rules.items() if factor != 0)
+
+        variables = []
+        min_height = 0
+        for name, variable_a in probe_a.variables.items():
+            variable_b = probe_b.variables[name]
+            if variable_a.dims != variable_b.dims or variable_a.dtype != variable_b.dtype or variable_a.encoding != variable_b.encoding:
+                return None
+
+            kind, value = TemplateSchema._get_data_kind(variable_a, height_dims)
+            if kind is None:
+                return None
+
+            chunk_sizes = variable_a.encoding.get("chunksizes")
+            if chunk_sizes is not None:
+                for dim, chunk_size in zip(variable_a.dims, chunk_sizes):
+                    if dim in height_dims:
+                        min_height = max(min_height, chunk_size)
+
+            is_coordinate = name in probe_a.coords
+            variables.append(VariableSchema(name, variable_a.dims, variable_a.dtype, copy.deepcopy(variable_a.attrs), copy.deepcopy(variable_a.encoding), kind, value,
+                                            is_coordinate, isinstance(variable_a, IndexVariable)))
+
+        return TemplateSchema(variables, dim_rules, copy.deepcopy(probe_a.attrs), min_height)
+
+    @staticmethod
+    def _get_data_kind(variable, height_dims):
+        data = variable.values
+        if DefaultData.is_probe_array(data):
+            return FILL, data.flat[0]
+
+        if len(height_dims.intersection(variable.dims)) == 0:
+            return LITERAL, np.copy(data)
+
+        if data.ndim == 1 and np.array_equal(data, np.arange(data.shape[0]).astype(data.dtype)):
+            return RANGE, None
+
+        return None, None  # height dependent data that is not a default array
@@ -0,0 +1,117 @@
+import dask
+import numpy as np
+from dask.delayed import Delayed
+
+from fiduceo.common.writer.block_statistics import BlockStatistics
+from fiduceo.common.writer.packed_data import PackedData
+
+VALID_COUNT_ATTRIBUTE = "valid_count"
+FILL_FRACTION_ATTRIBUTE = "fill_fraction"
+MIN_ATTRIBUTE = "data_min"
+MAX_ATTRIBUTE = "data_max"
+MEAN_ATTRIBUTE = "data_mean"
+STD_ATTRIBUTE = "data_std"
+
+
+class VariableStatistics:
+    """
+    Summary statistics of the data variables of a dataset, stored as variable attributes so that catalogue and monitoring
+    tools can read them from the file header without reading the data.
+    """
+
+    @staticmethod
+    def calculate(dataset, max_workers=None, compute=True):
+        """
+        Calculate the statistics of all numerical data variables in one blockwise pass over the data. NaN values and
+        the fill value of integer variables are excluded. Statistics of variables in packed storage are physical values.
+        :param dataset: the dataset
+        :param max_workers: maximal number of parallel threads for in-memory variables
+        :param compute: set false to return the statistics of dask backed variables as dask.delayed objects, e.g. to compute them together with writing the dataset
+        :return dictionary variable name -> statistics dictionary as returned by BlockStatistics
+         """
+        arrays = dict()
+        fill_values = dict()
+        for var_name in dataset.data_vars:
+            variable = dataset.variables[var_name]
+            if variable.dtype.kind not in "iuf":
+                continue
+
+            arrays[var_name] = variable.data
+            fill_value = VariableStatistics._get_fill_value(variable)
+            if fill_value is not None:
+                fill_values[var_name] = fill_value
+
+        statistics = BlockStatistics.calculate_all(arrays, max_workers=max_workers, fill_values=fill_values, compute=compute, moments=True)
+
+        for var_name, var_statistics in statistics.items():
+            variable = dataset.variables[var_name]
+            if not PackedData.is_packed(variable):
+                continue
+
+            scale_factor = variable.attrs.get("scale_factor", 1.0)
+            add_offset = variable.attrs.get("add_offset", 0.0)
+            if isinstance(var_statistics, Delayed):
+                statistics[var_name] = dask.delayed(VariableStatistics._unpack)(var_statistics, scale_factor, add_offset)
+            else:
+                VariableStatistics._unpack(var_statistics, scale_factor, add_offset)
+
+        return statistics
+
+    @staticmethod
+    def apply(dataset, statistics=None, max_workers=None):
+        """
+        Store the statistics as attributes "valid_count", "fill_fraction", "data_min", "data_max", "data_mean" and "data_std".
+        :param dataset: the dataset
+        :param statistics: statistics as returned by calculate(), calculated if None
+        :param max_workers: maximal number of parallel threads for in-memory variables
+        :return dictionary variable name -> statistics dictionary
+         """
+        if statistics is None:
+            statistics = VariableStatistics.calculate(dataset, max_workers=max_workers)
+
+        for var_name, attributes in VariableStatistics.get_attributes(statistics).items():
+            dataset.variables[var_name].attrs.update(attributes)
+
+        return statistics
+
+    @staticmethod
+    def get_attributes(statistics):
+        """
+        Convert statistics to the attributes stored by apply().
+        :param statistics: statistics as returned by calculate()
+        :return dictionary variable name -> dictionary attribute name -> value
+         """
+        attributes = dict()
+        for var_name, var_statistics in statistics.items():
+            count = var_statistics["count"]
+            valid_count = var_statistics["valid_count"]
+
+            attributes[var_name] = {VALID_COUNT_ATTRIBUTE: np.int64(valid_count),
+                                    FILL_FRACTION_ATTRIBUTE: np.float64(0.0) if count == 0 else np.float64((count - valid_count) / count),
+                                    MIN_ATTRIBUTE: np.float64(var_statistics["min"]), MAX_ATTRIBUTE: np.float64(var_statistics["max"]),
+                                    MEAN_ATTRIBUTE: np.float64(var_statistics["mean"]), STD_ATTRIBUTE: np.float64(var_statistics["std"])}
+        return attributes
+
+    @staticmethod
+    def _get_fill_value(variable):
+        if variable.dtype.kind == "f":
+            return None  # floating point fill values are NaN in memory
+
+        fill_value = variable.encoding.get("_FillValue", variable.attrs.get("_FillValue"))
+        if fill_value is None or np.isnan(fill_value):
+            return None
+        return fill_value
+
+    @staticmethod
+    def _unpack(statistics, scale_factor, add_offset):
+        if statistics["valid_count"] == 0:
+            return statistics
+
+        low = statistics["min"] * scale_factor + add_offset
+        high = statistics["max"] * scale_factor + add_offset
+        statistics["min"] = min(low, high)
+        statistics["max"] = max(low, high)
+        statistics["mean"] = statistics["mean"] * scale_factor + add_offset
+        statistics["std"] = statistics["std"] * abs(scale_factor)
+        statistics["m2"] = statistics["m2"] * scale_factor * scale_factor
+        return statistics
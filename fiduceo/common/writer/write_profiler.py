@@ -0,0 +1,133 @@
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+FLAG_MAPPING = "flag_mapping"
+VALIDATION = "validation"
+STATISTICS = "statistics"
+ENCODING = "encoding"
+WRITE = "write"
+COMMIT = "commit"
+
+
+class WriteProfiler:
+    """
+    Collects timings and byte counts while writing products. Phases are timed as a whole; when a profiler is passed to
+    the writers, variables are written one by one so that the time and the compressed size of every variable are known.
+    The per variable time covers encoding, compression and writing, these happen inside the NetCDF library and cannot
+    be separated. After each file, the report is passed to the callback and appended to the list of reports.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: function called with the report of every file written, optional
+         """
+        self.callback = callback
+        self.enabled = True
+        self.reports = []
+        self.start()
+
+    @staticmethod
+    def disabled():
+        """
+        Get a profiler that measures nothing, used when no profiling is requested.
+        :return the profiler
+         """
+        return _DISABLED_PROFILER
+
+    def start(self):
+        """
+        Start the report of a new file.
+         """
+        if not self.enabled:
+            return
+
+        self._start = time.perf_counter()
+        self._phases = OrderedDict()
+        self._variables = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager timing a processing phase, repeated phases of the same name are summed.
+        :param name: the phase name
+         """
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = self._phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_variable(self, name, seconds, raw_bytes, compressed_bytes):
+        """
+        Record the write of a variable.
+        :param name: the variable name
+        :param seconds: time needed to encode, compress and write the variable
+        :param raw_bytes: size of the variable data in memory
+        :param compressed_bytes: growth of the file caused by the variable
+         """
+        if not self.enabled:
+            return
+
+        self._variables[name] = OrderedDict([("seconds", seconds), ("raw_bytes", raw_bytes), ("compressed_bytes", compressed_bytes),
+                                             ("throughput", WriteProfiler._get_throughput(raw_bytes, seconds))])
+
+    def finish(self, file, raw_bytes):
+        """
+        Complete the report of a file, pass it to the callback and start a new one.
+        :param file: the file written
+        :param raw_bytes: size of the dataset in memory
+        :return the report, dictionary with the entries "file", "seconds", "raw_bytes", "compressed_bytes", "throughput", "phases" and "variables"
+         """
+        if not self.enabled:
+            return None
+
+        seconds = time.perf_counter() - self._start
+        report = OrderedDict()
+        report["file"] = file
+        report["seconds"] = seconds
+        report["raw_bytes"] = raw_bytes
+        report["compressed_bytes"] = os.path.getsize(file)
+        report["throughput"] = WriteProfiler._get_throughput(raw_bytes, seconds)
+        report["phases"] = self._phases
+        report["variables"] = self._variables
+
+        self.reports.append(report)
+        self.start()
+
+        if self.callback is not None:
+            self.callback(report)
+
+        return report
+
+    @staticmethod
+    def format_report(report):
+        """
+        Create a human readable table of a report, variables sorted by descending write time.
+        :param report: the report
+        :return the formatted text
+         """
+        lines = [report["file"] + ": " + "%.3f s, %d bytes -> %d bytes, %.1f MB/s" % (report["seconds"], report["raw_bytes"], report["compressed_bytes"], report["throughput"] / 1e6)]
+        for name, seconds in report["phases"].items():
+            lines.append("  phase %-30s %8.3f s" % (name, seconds))
+
+        variables = sorted(report["variables"].items(), key=lambda item: item[1]["seconds"], reverse=True)
+        for name, variable in variables:
+            lines.append("  var   %-30s %8.3f s %12d -> %12d bytes %8.1f MB/s" % (name, variable["seconds"], variable["raw_bytes"], variable["compressed_bytes"], variable["throughput"] / 1e6))
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def _get_throughput(raw_bytes, seconds):
+        if seconds <= 0.0:
+            return 0.0
+        return raw_bytes / seconds
+
+
+_DISABLED_PROFILER = WriteProfiler()
+_DISABLED_PROFILER.enabled = False
@@ -10,7 +10,7 @@ from gridtools.resampling import resample_2d
 class FCDRReader:
 
     @classmethod
-    def read(cls, file_str, drop_variables_str=None, decode_cf=True, decode_times=True, engine_str=None):
+    def read(cls, file_str, drop_variables_str=None, decode_cf=True, decode_times=True, engine_str=None, static_geolocation=None):
         """Read a dataset from a netCDF 3/4 or HDF file.
 
         Parameters
@@ -25,12 +25,17 @@ class FCDRReader:
             Whether to decode time information (convert time coordinates to ``datetime`` objects).
         engine_str: str, optional
             Optional netCDF engine name.
+        static_geolocation: StaticGeolocationCache, optional
+            Cache of the static MVIRI geolocation. If given, the geolocation of the sub satellite point of the product
+            is attached as memory mapped arrays shared with other processes.
 
         Return
         ------
         xarray.Dataset
         """
         ds = xr.open_dataset(file_str, drop_variables=drop_variables_str, decode_cf=decode_cf, decode_times=decode_times, engine=engine_str, chunks=1000000)
+        if static_geolocation is not None:
+            static_geolocation.attach(ds)
         return ds
 
     @classmethod
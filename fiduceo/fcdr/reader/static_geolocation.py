@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+# the geolocation variables of MVIRI_STATIC products, identical for all images of a sub satellite point
+STATIC_VARIABLES = ("latitude_vis", "longitude_vis", "latitude_ir_wv", "longitude_ir_wv")
+
+DESCRIPTION_FILE = "variables.json"
+
+# variables are copied to the cache in parts of about this size
+COPY_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+class StaticGeolocationCache:
+    """
+    Cache of the static MVIRI geolocation, stored once per sub satellite point (SSP) in a directory of uncompressed
+    numpy files. The cached grids are opened memory mapped and read-only: they are not decompressed and not copied,
+    all processes using the same cache directory share the pages of the operating system file cache.
+
+    The datasets returned contain the decoded geolocation, i.e. float32 degrees with NaN for missing values, and can
+    be attached to products read with the FCDRReader, where they are available to the evaluation of virtual variables.
+    """
+
+    def __init__(self, cache_dir, precision=1):
+        """
+        :param cache_dir: the cache directory, created if not existing
+        :param precision: number of decimals of the SSP coordinates in degrees distinguishing cache entries
+         """
+        self.cache_dir = cache_dir
+        self.precision = precision
+
+        self._datasets = dict()
+        self._lock = threading.Lock()
+
+    def get_key(self, ssp_longitude, ssp_latitude=0.0):
+        """
+        Get the name of the cache entry of a sub satellite point.
+        :param ssp_longitude: longitude of the SSP in degrees east
+        :param ssp_latitude: latitude of the SSP in degrees north
+        :return the entry name
+         """
+        return "ssp_lon{:+.{precision}f}_lat{:+.{precision}f}".format(round(ssp_longitude, self.precision) + 0.0, round(ssp_latitude, self.precision) + 0.0, precision=self.precision)
+
+    def contains(self, ssp_longitude, ssp_latitude=0.0):
+        """
+        Check whether the geolocation of a sub satellite point is cached.
+        :param ssp_longitude: longitude of the SSP in degrees east
+        :param ssp_latitude: latitude of the SSP in degrees north
+        :return true if cached
+         """
+        return os.path.isfile(os.path.join(self._get_entry_dir(ssp_longitude, ssp_latitude), DESCRIPTION_FILE))
+
+    def add(self, static_data, ssp_longitude, ssp_latitude=0.0):
+        """
+        Store the static geolocation of a sub satellite point. An entry existing already is kept, so that concurrent
+        processes adding the same SSP do not interfere.
+        :param static_data: path to a MVIRI_STATIC product file or the MVIRI_STATIC dataset
+        :param ssp_longitude: longitude of the SSP in degrees east
+        :param ssp_latitude: latitude of the SSP in degrees north
+         """
+        if self.contains(ssp_longitude, ssp_latitude):
+            return
+
+        entry_dir = self._get_entry_dir(ssp_longitude, ssp_latitude)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_dir = os.path.join(self.cache_dir, "." + os.path.basename(entry_dir) + "." + uuid.uuid4().hex)
+        os.makedirs(temp_dir)
+
+        try:
+            if isinstance(static_data, xr.Dataset):
+                StaticGeolocationCache._write_entry(static_data, temp_dir)
+            else:
+                with xr.open_dataset(static_data) as dataset:
+                    StaticGeolocationCache._write_entry(dataset, temp_dir)
+
+            try:
+                os.rename(temp_dir, entry_dir)
+            except OSError:
+                if not self.contains(ssp_longitude, ssp_latitude):
+                    raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def get(self, ssp_longitude, ssp_latitude=0.0):
+        """
+        Get the static geolocation of a sub satellite point as dataset of read-only, memory mapped arrays.
+        :param ssp_longitude: longitude of the SSP in degrees east
+        :param ssp_latitude: latitude of the SSP in degrees north
+        :return the dataset, None if the SSP is not cached
+         """
+        key = self.get_key(ssp_longitude, ssp_latitude)
+        with self._lock:
+            dataset = self._datasets.get(key)
+            if dataset is not None:
+                return dataset
+
+            if not self.contains(ssp_longitude, ssp_latitude):
+                return None
+
+            dataset = StaticGeolocationCache._open_entry(self._get_entry_dir(ssp_longitude, ssp_latitude))
+            self._datasets[key] = dataset
+            return dataset
+
+    def attach(self, dataset):
+        """
+        Add the static geolocation to a MVIRI product, selected by the sub satellite point at image start. Variables
+        contained in the product are kept.
+        :param dataset: the product dataset
+        :return the dataset
+         """
+        ssp_longitude = float(dataset["sub_satellite_longitude_start"].values)
+        ssp_latitude = float(dataset["sub_satellite_latitude_start"].values)
+        static_dataset = self.get(ssp_longitude, ssp_latitude)
+        if static_dataset is None:
+            raise IOError("no static geolocation cached for sub satellite point " + self.get_key(ssp_longitude, ssp_latitude))
+
+        for name, variable in static_dataset.variables.items():
+            if name not in dataset.variables:
+                dataset[name] = variable
+
+        return dataset
+
+    def clear(self):
+        """
+        Release the memory mapped datasets of this cache instance. The mappings are closed once no other references to
+        the datasets or their variables remain, e.g. in products they are attached to. The cache directory is not modified.
+         """
+        with self._lock:
+            self._datasets.clear()
+
+    def _get_entry_dir(self, ssp_longitude, ssp_latitude):
+        return os.path.join(self.cache_dir, self.get_key(ssp_longitude, ssp_latitude))
+
+    @staticmethod
+    def _write_entry(dataset, entry_dir):
+        description = dict()
+        for name in STATIC_VARIABLES:
+            variable = dataset.variables[name]
+            target = np.lib.format.open_memmap(os.path.join(entry_dir, name + ".npy"), mode="w+", dtype=variable.dtype, shape=variable.shape)
+
+            block_rows = max(1, COPY_BLOCK_BYTES * variable.shape[0] // max(1, variable.nbytes))
+            for start in range(0, variable.shape[0], block_rows):
+                target[start:start + block_rows] = variable[start:start + block_rows].values
+
+            target.flush()
+            del target
+            description[name] = dict([("dims", list(variable.dims)), ("attrs", StaticGeolocationCache._to_json_attributes(variable.attrs))])
+
+        with open(os.path.join(entry_dir, DESCRIPTION_FILE), "w") as json_file:
+            json.dump(description, json_file, indent=2)
+
+    @staticmethod
+    def _open_entry(entry_dir):
+        with open(os.path.join(entry_dir, DESCRIPTION_FILE), "r") as json_file:
+            description = json.load(json_file)
+
+        dataset = xr.Dataset()
+        for name in STATIC_VARIABLES:
+            data = np.load(os.path.join(entry_dir, name + ".npy"), mmap_mode="r")
+            dataset[name] = Variable(description[name]["dims"], data, attrs=description[name]["attrs"])
+        return dataset
+
+    @staticmethod
+    def _to_json_attributes(attrs):
+        json_attributes = dict()
+        for name, value in attrs.items():
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+            elif isinstance(value, np.generic):
+                value = value.item()
+            json_attributes[name] = value
+        return json_attributes
@@ -2,11 +2,14 @@ import os
 import tempfile
 import unittest
 
+import netCDF4
 import numpy as np
 import xarray as xr
 from xarray import Variable
 
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
 from fiduceo.common.writer.default_data import DefaultData
+from fiduceo.common.writer.write_profiler import WriteProfiler
 from fiduceo.fcdr.writer.fcdr_writer import FCDRWriter
 
 
@@ -59,3 +62,159 @@ class FCDRReadWriteTests(unittest.TestCase):
             self.fail("IOError expected")
         except IOError:
             pass
+
+    def test_write_many(self):
+        test_files = [os.path.join(self.testDir, 'delete_me_' + str(i) + '.nc') for i in range(0, 3)]
+        jobs = [(self.dataset, test_file) for test_file in test_files]
+
+        written = FCDRWriter.write_many(jobs, workers=2, memory_budget=1000000)
+
+        self.assertEqual(test_files, written)
+        for test_file in test_files:
+            self.assertTrue(os.path.isfile(test_file))
+
+    def test_submit(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+
+        future = FCDRWriter.submit(self.dataset, test_file)
+        FCDRWriter.flush()
+
+        self.assertTrue(future.done())
+        self.assertEqual(test_file, future.result())
+        self.assertTrue(os.path.isfile(test_file))
+
+    def test_write_flag_statistics(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        self.dataset["quality_channel_bitmask"].attrs["flag_masks"] = "1, 2, 4"
+        self.dataset["quality_channel_bitmask"].attrs["flag_meanings"] = "do_not_use uncertainty_suspicious self_emission_fails"
+        self.dataset["quality_channel_bitmask"].data[0, :] = 3
+        self.dataset["quality_channel_bitmask"].data[1, 2] = 4
+
+        statistics = FCDRWriter.write(self.dataset, test_file, flag_statistics=True)
+
+        self.assertEqual({"do_not_use": 19, "uncertainty_suspicious": 19, "self_emission_fails": 1}, statistics["quality_channel_bitmask"])
+
+        target_data = xr.open_dataset(test_file)
+        try:
+            np.testing.assert_array_equal([19, 19, 1], target_data["quality_channel_bitmask"].attrs["flag_counts"])
+        finally:
+            target_data.close()
+
+    def test_write_variable_statistics(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        self.dataset["quality_scanline_bitmask"].data[:] = [1, 2, 3, 4, 5]
+
+        FCDRWriter.write(self.dataset, test_file, variable_statistics=True)
+
+        target_data = xr.open_dataset(test_file)
+        try:
+            attributes = target_data["quality_scanline_bitmask"].attrs
+            self.assertEqual(5, attributes["valid_count"])
+            self.assertAlmostEqual(0.0, attributes["fill_fraction"], 8)
+            self.assertAlmostEqual(1.0, attributes["data_min"], 8)
+            self.assertAlmostEqual(5.0, attributes["data_max"], 8)
+            self.assertAlmostEqual(3.0, attributes["data_mean"], 8)
+            self.assertAlmostEqual(np.sqrt(2.0), attributes["data_std"], 8)
+        finally:
+            target_data.close()
+
+    def test_write_chunked(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        dataset = FCDRWriter.createTemplateEasy("AVHRR", 1500, chunked=True)
+        for name, value in dataset.attrs.items():
+            if value is None:
+                dataset.attrs[name] = "test"
+        ChunkedTemplate.map_blocks(dataset, "Ch1", fill_with_block_row)
+
+        FCDRWriter.write(dataset, test_file, scheduler="processes")
+
+        target_data = xr.open_dataset(test_file)
+        try:
+            variable = target_data["Ch1"]
+            self.assertEqual(variable.encoding["chunksizes"], dataset["Ch1"].encoding["chunksizes"])
+            self.assertAlmostEqual(0.0, variable.values[0, 0], 5)
+            self.assertAlmostEqual(1.0, variable.values[1499, 408], 5)
+        finally:
+            target_data.close()
+
+    def test_write_access_pattern(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        dataset = FCDRWriter.createTemplateEasy("AVHRR", 1500)
+        for name, value in dataset.attrs.items():
+            if value is None:
+                dataset.attrs[name] = "test"
+        self.assertEqual((1280, 409), dataset["Ch1"].encoding["chunksizes"])
+        self.assertNotIn("chunksizes", dataset["SRF_weights"].encoding)
+
+        FCDRWriter.write(dataset, test_file, access_pattern="spatial_tiles")
+
+        with netCDF4.Dataset(test_file) as target_data:
+            self.assertEqual([1281, 409], target_data.variables["Ch1"].chunking())
+            self.assertEqual([6, 724], target_data.variables["SRF_weights"].chunking())
+
+    def test_write_chunked_statistics(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        dataset = FCDRWriter.createTemplateEasy("AVHRR", 1500, chunked=True)
+        for name, value in dataset.attrs.items():
+            if value is None:
+                dataset.attrs[name] = "test"
+        ChunkedTemplate.map_blocks(dataset, "Ch1", fill_with_block_row)
+
+        statistics = FCDRWriter.write(dataset, test_file, check_ranges=True, flag_statistics=True, variable_statistics=True)
+
+        self.assertEqual(0, statistics["quality_pixel_bitmask"]["invalid"])
+        self.assertAlmostEqual(1.0, dataset["Ch1"].attrs["data_max"], 8)
+        target_data = xr.open_dataset(test_file)
+        try:
+            attributes = target_data["Ch1"].attrs
+            self.assertEqual(1500 * 409, attributes["valid_count"])
+            self.assertAlmostEqual(0.0, attributes["data_min"], 8)
+            self.assertAlmostEqual(1.0, attributes["data_max"], 8)
+            self.assertAlmostEqual(1.0, target_data["Ch1"].values[1499, 408], 5)
+            np.testing.assert_array_equal(np.zeros(8), target_data["quality_pixel_bitmask"].attrs["flag_counts"])
+        finally:
+            target_data.close()
+
+    def test_write_disk_template(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        template = FCDRWriter.createTemplateFull("MVIRI", 5000, disk_file=test_file)
+        dataset = template.dataset
+        for name, value in dataset.attrs.items():
+            if value is None:
+                dataset.attrs[name] = "test"
+        for y in range(0, 5000, 1000):
+            dataset["count_vis"][y:y + 1000, :] = y // 1000
+
+        template.close(variable_statistics=True)
+
+        self.assertEqual(['delete_me.nc'], os.listdir(self.testDir))
+        target_data = xr.open_dataset(test_file)
+        try:
+            variable = target_data["count_vis"]
+            self.assertEqual(3, variable.values[3500, 17])
+            self.assertAlmostEqual(2.0, variable.attrs["data_mean"], 8)
+        finally:
+            target_data.close()
+
+    def test_write_profiled(self):
+        test_file = os.path.join(self.testDir, 'delete_me.nc')
+        reports = []
+        profiler = WriteProfiler(callback=reports.append)
+
+        FCDRWriter.write(self.dataset, test_file, profiler=profiler)
+
+        self.assertEqual(1, len(reports))
+        report = reports[0]
+        self.assertEqual(test_file, report["file"])
+        self.assertEqual(os.path.getsize(test_file), report["compressed_bytes"])
+        self.assertEqual(["flag_mapping", "encoding", "write", "commit"], list(report["phases"].keys()))
+        self.assertEqual(["data_quality_bitmask", "quality_pixel_bitmask", "quality_scanline_bitmask", "quality_channel_bitmask"], list(report["variables"].keys()))
+
+        os.remove(test_file)
+        FCDRWriter.write(self.dataset, test_file, variable_statistics=True, profiler=profiler)
+
+        self.assertEqual(["flag_mapping", "encoding", "statistics", "write", "commit"], list(reports[1]["phases"].keys()))
+
+
+def fill_with_block_row(block, block_info=None):
+    return np.full(block.shape, block_info[0]["chunk-location"][0], block.dtype)
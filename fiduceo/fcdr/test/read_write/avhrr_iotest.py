@@ -6,6 +6,7 @@ import unittest
 import numpy as np
 import xarray as xr
 
+from fiduceo.common.writer.write_profiler import WriteProfiler
 from fiduceo.fcdr.writer.fcdr_writer import FCDRWriter
 
 N_PRT = 3
@@ -37,13 +38,9 @@ class AvhrrIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_easy("AVHRR", "NOAA18", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.datetime.now()
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        FCDRWriter.write(avhrr_easy, self.target_path)
-
-        end_time = datetime.datetime.now()
-        elapsed_time = end_time - start_time
-        print("AVHRR EASY write time: " + str(elapsed_time.seconds) + "." + str(round(elapsed_time.microseconds / 1000)))
+        FCDRWriter.write(avhrr_easy, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
 
@@ -130,13 +127,9 @@ class AvhrrIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_full("AVHRR", "NOAA19", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.datetime.now()
-
-        FCDRWriter.write(avhrr_full, self.target_path)
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        end_time = datetime.datetime.now()
-        elapsed_time = end_time - start_time
-        print("AVHRR FULL write time: " + str(elapsed_time.seconds) + "." + str(round(elapsed_time.microseconds / 1000)))
+        FCDRWriter.write(avhrr_full, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
 
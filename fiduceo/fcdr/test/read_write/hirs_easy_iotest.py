@@ -6,6 +6,7 @@ from datetime import datetime
 import numpy as np
 import xarray as xr
 
+from fiduceo.common.writer.write_profiler import WriteProfiler
 from fiduceo.fcdr.writer.fcdr_writer import FCDRWriter
 
 EXPECTED_CHUNKING_2D = (512, 56)
@@ -35,13 +36,9 @@ class HirsEASYIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_easy("HIRS2", "NOAA12", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.now()
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        FCDRWriter.write(hirs_easy, self.target_path)
-
-        end_time = datetime.now()
-        elapsed_time = end_time - start_time
-        print("HIRS/2 EASY write time: " + "%d.%03d" % (elapsed_time.seconds, int(round(elapsed_time.microseconds / 1000))))
+        FCDRWriter.write(hirs_easy, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
         target_data = xr.open_dataset(self.target_path)
@@ -122,13 +119,9 @@ class HirsEASYIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_easy("HIRS3", "NOAA15", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.now()
-
-        FCDRWriter.write(hirs_easy, self.target_path)
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        end_time = datetime.now()
-        elapsed_time = end_time - start_time
-        print("HIRS/3 EASY write time: " + "%d.%03d" % (elapsed_time.seconds, int(round(elapsed_time.microseconds / 1000))))
+        FCDRWriter.write(hirs_easy, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
         target_data = xr.open_dataset(self.target_path)
@@ -209,13 +202,9 @@ class HirsEASYIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_easy("HIRS4", "NOAA18", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.now()
-
-        FCDRWriter.write(hirs_easy, self.target_path)
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        end_time = datetime.now()
-        elapsed_time = end_time - start_time
-        print("HIRS/4 EASY write time: " + "%d.%03d" % (elapsed_time.seconds, int(round(elapsed_time.microseconds / 1000))))
+        FCDRWriter.write(hirs_easy, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
         target_data = xr.open_dataset(self.target_path)
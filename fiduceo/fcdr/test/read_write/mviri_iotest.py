@@ -6,6 +6,7 @@ from datetime import datetime
 import numpy as np
 import xarray as xr
 
+from fiduceo.common.writer.write_profiler import WriteProfiler
 from fiduceo.fcdr.writer.fcdr_writer import FCDRWriter
 
 EXPECTED_CHUNKING = (500, 500)
@@ -34,13 +35,9 @@ class MviriIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_easy("MVIRI", "Meteosat8", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.now()
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        FCDRWriter.write(mviri_easy, self.target_path)
-
-        end_time = datetime.now()
-        elapsed_time = end_time - start_time
-        print("MVIRI EASY write time: " + str(elapsed_time.seconds) + "." + str(round(elapsed_time.microseconds / 1000)))
+        FCDRWriter.write(mviri_easy, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
 
@@ -83,13 +80,9 @@ class MviriIoTest(unittest.TestCase):
         file_name = FCDRWriter.create_file_name_FCDR_full("MVIRI", "Meteosat7", start, end, "1.0")
         self.target_path = os.path.join(self.temp_dir, file_name)
 
-        start_time = datetime.now()
-
-        FCDRWriter.write(mviri_full, self.target_path)
+        profiler = WriteProfiler(callback=lambda report: print(WriteProfiler.format_report(report)))
 
-        end_time = datetime.now()
-        elapsed_time = end_time - start_time
-        print("MVIRI FULL write time: " + str(elapsed_time.seconds) + "." + str(round(elapsed_time.microseconds / 1000)))
+        FCDRWriter.write(mviri_full, self.target_path, profiler=profiler)
 
         self.assertTrue(os.path.isfile(self.target_path))
 
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+from xarray import Variable
+
+from fiduceo.fcdr.reader.static_geolocation import StaticGeolocationCache, STATIC_VARIABLES
+
+
+class StaticGeolocationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = StaticGeolocationCache(os.path.join(self.temp_dir, "cache"))
+
+    def tearDown(self):
+        self.cache.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_key(self):
+        self.assertEqual("ssp_lon+57.0_lat+0.0", self.cache.get_key(57.0))
+        self.assertEqual("ssp_lon+57.0_lat+0.0", self.cache.get_key(57.03, -0.01))
+        self.assertEqual("ssp_lon-3.5_lat+0.2", self.cache.get_key(-3.5, 0.2))
+
+    def test_add_get(self):
+        static_data = self._create_static_dataset()
+
+        self.assertFalse(self.cache.contains(57.0))
+        self.cache.add(static_data, 57.0)
+        self.assertTrue(self.cache.contains(57.0))
+        self.assertEqual(["ssp_lon+57.0_lat+0.0"], os.listdir(self.cache.cache_dir))
+
+        dataset = self.cache.get(57.0)
+        self.assertEqual(list(STATIC_VARIABLES), list(dataset.variables))
+        for name in STATIC_VARIABLES:
+            variable = dataset.variables[name]
+            np.testing.assert_array_equal(static_data.variables[name].values, variable.values)
+            self.assertEqual(static_data.variables[name].dims, variable.dims)
+            # a view of the memory mapped file, not a copy
+            self.assertFalse(variable.data.flags.owndata)
+            self.assertFalse(variable.data.flags.writeable)
+
+        self.assertEqual("degrees_north", dataset["latitude_vis"].attrs["units"])
+        self.assertIs(dataset, self.cache.get(57.0))
+        self.assertIsNone(self.cache.get(0.0))
+
+    def test_add_from_file(self):
+        static_file = os.path.join(self.temp_dir, "static.nc")
+        self._create_static_dataset().to_netcdf(static_file)
+
+        self.cache.add(static_file, 0.0)
+
+        other_cache = StaticGeolocationCache(self.cache.cache_dir)
+        dataset = other_cache.get(0.0)
+        self.assertAlmostEqual(1.0, float(dataset["longitude_ir_wv"][1, 0]), 6)
+        other_cache.clear()
+
+    def test_add_keeps_existing_entry(self):
+        self.cache.add(self._create_static_dataset(), 57.0)
+
+        other_data = self._create_static_dataset()
+        other_data["latitude_vis"].values[:] = 11.0
+        self.cache.add(other_data, 57.0)
+
+        self.assertAlmostEqual(0.0, float(self.cache.get(57.0)["latitude_vis"][0, 0]), 6)
+        self.assertEqual(1, len(os.listdir(self.cache.cache_dir)))
+
+    def test_attach(self):
+        self.cache.add(self._create_static_dataset(), 57.0)
+        product = xr.Dataset()
+        product["sub_satellite_longitude_start"] = Variable([], 57.02)
+        product["sub_satellite_latitude_start"] = Variable([], 0.01)
+        product["latitude_ir_wv"] = Variable(["y_ir_wv", "x_ir_wv"], np.zeros([2, 2], dtype=np.float32))
+
+        self.cache.attach(product)
+
+        self.assertIs(self.cache.get(57.0)["latitude_vis"].variable.data, product["latitude_vis"].variable.data)
+        self.assertEqual(0.0, float(product["latitude_ir_wv"][1, 1]))
+
+    def test_attach_not_cached(self):
+        product = xr.Dataset()
+        product["sub_satellite_longitude_start"] = Variable([], 63.0)
+        product["sub_satellite_latitude_start"] = Variable([], 0.0)
+
+        try:
+            self.cache.attach(product)
+            self.fail("IOError expected")
+        except IOError as e:
+            self.assertEqual("no static geolocation cached for sub satellite point ssp_lon+63.0_lat+0.0", str(e))
+
+    @staticmethod
+    def _create_static_dataset():
+        dataset = xr.Dataset()
+        data = np.arange(16, dtype=np.float32).reshape(4, 4) * 0.25
+        data[3, 3] = np.NaN
+        dataset["latitude_vis"] = Variable(["y", "x"], data, attrs=dict([("standard_name", "latitude"), ("units", "degrees_north")]))
+        dataset["longitude_vis"] = Variable(["y", "x"], data * 2.0, attrs=dict([("standard_name", "longitude"), ("units", "degrees_east")]))
+
+        data = np.arange(4, dtype=np.float32).reshape(2, 2) * 0.25
+        dataset["latitude_ir_wv"] = Variable(["y_ir_wv", "x_ir_wv"], data, attrs=dict([("standard_name", "latitude"), ("units", "degrees_north")]))
+        dataset["longitude_ir_wv"] = Variable(["y_ir_wv", "x_ir_wv"], data * 2.0, attrs=dict([("standard_name", "longitude"), ("units", "degrees_east")]))
+        return dataset
@@ -1,6 +1,8 @@
 import unittest
 
+import dask.array as da
 import numpy as np
+import xarray as xr
 from xarray import Variable
 
 from fiduceo.fcdr.writer.data_utility import DataUtility
@@ -234,6 +236,99 @@ class DataUtilityTest(unittest.TestCase):
 
         DataUtility.check_scaling_ranges(variable)
 
+    def test_check_dataset_scaling_ranges_ok(self):
+        dataset = self._create_scaled_dataset()
+
+        statistics = DataUtility.check_dataset_scaling_ranges(dataset)
+        self.assertEqual(2, len(statistics))
+        self.assertAlmostEqual(60.0, statistics["int16_var"]["max"], 5)
+        self.assertEqual(1, statistics["int16_var"]["nan_count"])
+        self.assertAlmostEqual(11.0, statistics["uint8_var"]["min"], 5)
+
+    def test_check_dataset_scaling_ranges_reports_all_violations(self):
+        dataset = self._create_scaled_dataset()
+        dataset["int16_var"].data[0, 1] = 9  # underflow
+        dataset["uint8_var"].data[1] = 16.2  # overflow
+
+        try:
+            DataUtility.check_dataset_scaling_ranges(dataset)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            message = str(e)
+            self.assertTrue("int16_var: data scaling underflow" in message)
+            self.assertTrue("uint8_var: data scaling overflow" in message)
+
+    def test_check_dataset_scaling_ranges_dask(self):
+        dataset = self._create_scaled_dataset()
+        dataset["int16_var"].data[1, 1] = 61  # overflow
+        dataset = dataset.chunk({"y": 1})
+        self.assertTrue(isinstance(dataset["int16_var"].data, da.Array))
+
+        try:
+            DataUtility.check_dataset_scaling_ranges(dataset)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertTrue("int16_var: data scaling overflow" in str(e))
+
+    def test_check_dataset_scaling_ranges_only_NaN(self):
+        dataset = xr.Dataset()
+        variable = Variable(["y"], DefaultData.create_default_vector(4, np.float32, fill_value=np.NaN))
+        variable.encoding = dict([('dtype', np.uint32), ('_FillValue', 4294967295), ('scale_factor', 0.00002), ('add_offset', 14)])
+        dataset["nan_var"] = variable
+
+        DataUtility.check_dataset_scaling_ranges(dataset)
+
+    def test_check_dataset_scaling_ranges_string_valid_range(self):
+        dataset = xr.Dataset()
+        variable = Variable(["channel", "channel"], np.diag(np.ones(3, dtype=np.float32)))
+        variable.attrs["valid_min"] = "-10000"
+        variable.attrs["valid_max"] = "10000"
+        variable.encoding = dict([('dtype', np.int16), ('_FillValue', -32768), ('scale_factor', 0.0001), ('add_offset', 0.0)])
+        dataset["correlation"] = variable
+
+        DataUtility.check_dataset_scaling_ranges(dataset)
+
+        dataset["correlation"].data[0, 1] = 1.1
+        try:
+            DataUtility.check_dataset_scaling_ranges(dataset)
+            self.fail("ValueError expected")
+        except ValueError:
+            pass
+
+    def test_check_dataset_scaling_ranges_raw_counts(self):
+        dataset = xr.Dataset()
+        variable = Variable(["y"], np.array([12, 1023, 65535, 7], dtype=np.uint16))
+        variable.attrs["valid_max"] = 1023
+        variable.encoding = dict([('dtype', np.uint16), ('_FillValue', 65535)])
+        dataset["counts"] = variable
+        variable = Variable(["y"], np.array([12, 60000, 65535, 7], dtype=np.uint16))
+        variable.encoding = dict([('dtype', np.uint16), ('_FillValue', 65535)])
+        dataset["unlimited_counts"] = variable
+
+        # the fill value is excluded from the check
+        statistics = DataUtility.check_dataset_scaling_ranges(dataset)
+        self.assertEqual(["counts"], list(statistics.keys()))
+        self.assertEqual(3, statistics["counts"]["valid_count"])
+
+        dataset["counts"].data[1] = 1024
+        try:
+            DataUtility.check_dataset_scaling_ranges(dataset)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertTrue("counts: data scaling overflow" in str(e))
+
+    def test_check_dataset_scaling_ranges_scaled_packed_type(self):
+        dataset = xr.Dataset()
+        variable = Variable(["y"], np.array([100, 400], dtype=np.int16))
+        variable.encoding = dict([('dtype', np.int16), ('_FillValue', -32768), ('scale_factor', 0.01)])
+        dataset["scaled_counts"] = variable
+
+        try:
+            DataUtility.check_dataset_scaling_ranges(dataset)
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertTrue("scaled_counts: data scaling overflow" in str(e))
+
     def test__get_scale_factor(self):
         default_array = DefaultData.create_default_vector(2, np.float32)
         variable = Variable(["y"], default_array)
@@ -284,4 +379,31 @@ class DataUtilityTest(unittest.TestCase):
             DataUtility._get_min_max(variable)
             self.fail("ValueError expected")
         except ValueError:
-            pass
\ No newline at end of file
+            pass
+
+    @staticmethod
+    def _create_scaled_dataset():
+        dataset = xr.Dataset()
+
+        default_array = DefaultData.create_default_array(2, 2, np.float32)
+        default_array[0][0] = 60  # 25000
+        default_array[0][1] = 10  # 0
+        default_array[1][0] = np.NaN
+        default_array[1][1] = 14.06
+        variable = Variable(["y", "x"], default_array)
+        variable.attrs["valid_max"] = 25000
+        variable.attrs["valid_min"] = 0
+        variable.encoding = dict([('dtype', np.int16), ('_FillValue', -32767), ('scale_factor', 0.002), ('add_offset', 10)])
+        dataset["int16_var"] = variable
+
+        default_array = DefaultData.create_default_vector(2, np.float32)
+        default_array[0] = 11.0  # 0
+        default_array[1] = 16.1  # 255
+        variable = Variable(["y"], default_array)
+        variable.encoding = dict([('dtype', np.uint8), ('_FillValue', 255), ('scale_factor', 0.02), ('add_offset', 11)])
+        dataset["uint8_var"] = variable
+
+        variable = Variable(["y"], DefaultData.create_default_vector(2, np.float32, fill_value=1000.0))
+        dataset["unscaled_var"] = variable
+
+        return dataset
@@ -1,7 +1,11 @@
 import datetime
 import unittest
 
+import numpy as np
+
 from fiduceo.common.test.assertions import Assertions
+from fiduceo.common.writer.packed_data import PackedData
+from fiduceo.common.writer.template_pool import TemplatePool
 from fiduceo.fcdr.writer.fcdr_writer import FCDRWriter
 
 
@@ -603,6 +607,73 @@ class FCDRWriterTest(unittest.TestCase):
         self.assertIsNotNone(ds.variables["latitude_ir_wv"])
         self.assertIsNotNone(ds.variables["longitude_ir_wv"])
 
+    def testCreateTemplateEasy_shared_memory(self):
+        template = FCDRWriter.createTemplateEasy('AMSUB', 2561, shared_memory=True)
+        try:
+            ds = template.dataset
+            self.assertTrue(FCDRWriter.createTemplateEasy('AMSUB', 2561).identical(ds))
+            self.assertIs(template.arrays["btemps"], ds["btemps"].data)
+        finally:
+            ds = None
+            template.close()
+
+    def testCreateTemplateEasy_pool(self):
+        pool = TemplatePool()
+        ds = FCDRWriter.createTemplateEasy('AVHRR', 13000, pool=pool)
+        ds["Ch1"].data[:] = 0.5
+        pool.release(ds)
+
+        ds = FCDRWriter.createTemplateEasy('AVHRR', 12800, pool=pool)
+        self.assertTrue(FCDRWriter.createTemplateEasy('AVHRR', 12800).identical(ds))
+
+    def testCreateTemplateEasy_packed(self):
+        ds = FCDRWriter.createTemplateEasy('AVHRR', 1200, packed=True)
+        unpacked = FCDRWriter.createTemplateEasy('AVHRR', 1200)
+
+        latitude = ds.variables["latitude"]
+        self.assertEqual(np.int16, latitude.dtype)
+        self.assertEqual(unpacked["latitude"].encoding["scale_factor"], latitude.attrs["scale_factor"])
+        self.assertEqual(list(unpacked.variables), list(ds.variables))
+        self.assertLess(ds.nbytes, unpacked.nbytes)
+
+        PackedData.unpack(ds)
+        self.assertTrue(unpacked["latitude"].identical(ds["latitude"]))
+
+    def testCreateTemplateFull_chunked(self):
+        ds = FCDRWriter.createTemplateFull('MVIRI', 5000, chunked=True)
+
+        count_vis = ds.variables["count_vis"]
+        self.assertEqual(count_vis.encoding["chunksizes"], count_vis.data.chunksize)
+        self.assertTrue(FCDRWriter.createTemplateFull('MVIRI', 5000)["count_vis"].identical(ds["count_vis"].compute()))
+
+    def testCreateTemplateEasy_chunked_pooled(self):
+        try:
+            FCDRWriter.createTemplateEasy('AVHRR', 1200, chunked=True, pool=TemplatePool())
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertEqual("chunked templates cannot be shared or pooled", str(e))
+
+    def testCreateTemplateFull_disk_file_chunked(self):
+        try:
+            FCDRWriter.createTemplateFull('MVIRI', 5000, chunked=True, disk_file="product.nc")
+            self.fail("ValueError expected")
+        except ValueError as e:
+            self.assertEqual("disk backed templates cannot be chunked, shared or pooled", str(e))
+
+    def test_estimate_size_packed(self):
+        estimate = FCDRWriter.estimate_size('AVHRR', 1200, packed=True)
+
+        self.assertEqual(FCDRWriter.createTemplateEasy('AVHRR', 1200, packed=True).nbytes, estimate.memory_bytes)
+
+    def test_estimate_size(self):
+        estimate = FCDRWriter.estimate_size('MVIRI', 5000, mode='FULL')
+
+        ds = FCDRWriter.createTemplateFull('MVIRI', 5000)
+        self.assertEqual(ds.nbytes, estimate.memory_bytes)
+        self.assertEqual(ds.nbytes, estimate.file_bytes)
+        self.assertGreater(estimate.write_memory_bytes, estimate.memory_bytes)
+        self.assertEqual(ds["count_vis"].nbytes, estimate.variables["count_vis"][0])
+
     def test_create_file_name_FCDR_easy(self):
         start = datetime.datetime(2015, 8, 23, 14, 24, 52)
         end = datetime.datetime(2015, 8, 23, 15, 25, 53)
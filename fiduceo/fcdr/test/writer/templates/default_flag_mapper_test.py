@@ -0,0 +1,135 @@
+import unittest
+
+import dask.array as da
+import numpy as np
+
+from fiduceo.fcdr.writer.global_flags import GlobalFlags as gf
+from fiduceo.fcdr.writer.templates import default_flag_mapper
+from fiduceo.fcdr.writer.templates.default_flag_mapper import DefaultFlagMapper
+
+
+class DefaultFlagMapperTest(unittest.TestCase):
+    SOURCE_MASKS = [np.uint8(1), np.uint8(2), np.uint8(4)]
+    TARGET_MASKS = [gf.USE_WITH_CAUTION, gf.INVALID, np.bitwise_or(gf.USE_WITH_CAUTION, gf.INVALID_TIME)]
+
+    def setUp(self):
+        self.mapper = DefaultFlagMapper()
+
+    def test_create_lookup_table_uint8(self):
+        lookup_table = DefaultFlagMapper.create_lookup_table(self.SOURCE_MASKS, self.TARGET_MASKS, np.uint8)
+
+        self.assertEqual(256, lookup_table.shape[0])
+        self.assertEqual(np.uint8, lookup_table.dtype)
+        self.assertEqual(0, lookup_table[0])
+        self.assertEqual(2, lookup_table[1])
+        self.assertEqual(3, lookup_table[3])
+        self.assertEqual(19, lookup_table[7])
+        self.assertEqual(0, lookup_table[8])
+        self.assertFalse(lookup_table.flags.writeable)
+
+    def test_create_lookup_table_int16(self):
+        lookup_table = DefaultFlagMapper.create_lookup_table([np.int16(256)], [gf.SENSOR_ERROR], np.int16)
+
+        self.assertEqual(65536, lookup_table.shape[0])
+        self.assertEqual(0, lookup_table[255])
+        self.assertEqual(32, lookup_table[256])
+        self.assertEqual(32, lookup_table[65535])  # bit pattern of -1
+
+    def test_get_lookup_table_is_cached(self):
+        lookup_table = DefaultFlagMapper.get_lookup_table(self.SOURCE_MASKS, self.TARGET_MASKS, np.uint8)
+
+        self.assertIs(lookup_table, DefaultFlagMapper.get_lookup_table(list(self.SOURCE_MASKS), list(self.TARGET_MASKS), np.dtype(np.uint8)))
+        self.assertIsNot(lookup_table, DefaultFlagMapper.get_lookup_table(self.SOURCE_MASKS, self.TARGET_MASKS, np.int8))
+
+    def test_evaluate_masks_uint8(self):
+        flag_data = np.array([[0, 1, 2], [4, 7, 8]], dtype=np.uint8)
+        global_flag_data = np.array([[64, 0, 0], [0, 0, 128]], dtype=np.uint8)
+
+        result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data, self.SOURCE_MASKS, self.TARGET_MASKS)
+
+        np.testing.assert_array_equal([[64, 2, 1], [18, 19, 128]], result)
+
+    def test_evaluate_masks_uint8_blockwise(self):
+        original_block_size = default_flag_mapper.LOOKUP_BLOCK_ELEMENTS
+        default_flag_mapper.LOOKUP_BLOCK_ELEMENTS = 4
+        try:
+            flag_data = np.array([[0, 1, 2], [4, 7, 8], [1, 1, 1]], dtype=np.uint8)
+            global_flag_data = np.zeros([3, 3], dtype=np.uint8)
+
+            result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data, self.SOURCE_MASKS, self.TARGET_MASKS)
+
+            np.testing.assert_array_equal([[0, 2, 1], [18, 19, 0], [2, 2, 2]], result)
+        finally:
+            default_flag_mapper.LOOKUP_BLOCK_ELEMENTS = original_block_size
+
+    def test_evaluate_masks_uint8_not_contiguous(self):
+        flag_data = np.array([[0, 1, 2, 4], [4, 7, 8, 1]], dtype=np.uint16)
+        global_flag_data = np.zeros([2, 4], dtype=np.uint8)
+
+        result = self.mapper.evaluate_masks_uint8(flag_data[:, ::2], global_flag_data[:, ::2], self.SOURCE_MASKS, self.TARGET_MASKS)
+
+        np.testing.assert_array_equal([[0, 1], [18, 0]], result)
+
+    def test_evaluate_masks_uint8_equals_mask_loop(self):
+        flag_data = np.random.randint(-32768, 32767, size=(40, 30)).astype(np.int16)
+        global_flag_data = np.random.randint(0, 255, size=(40, 30)).astype(np.uint8)
+        source_masks = [np.int16(1), np.int32(512), np.int32(-32768)]
+        target_masks = [gf.USE_WITH_CAUTION, gf.INVALID, gf.PADDED_DATA]
+
+        expected = global_flag_data
+        for source_mask, target_mask in zip(source_masks, target_masks):
+            intermediate = (np.bitwise_and(flag_data, source_mask) > 0).astype(np.uint8) * target_mask
+            expected = np.bitwise_or(expected, intermediate)
+
+        result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data.copy(), source_masks, target_masks)
+
+        np.testing.assert_array_equal(expected, result)
+
+    def test_evaluate_masks_uint8_32_bit_flags(self):
+        flag_data = np.array([0, 1, 65536], dtype=np.int32)
+        global_flag_data = np.zeros([3], dtype=np.uint8)
+
+        result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data, [np.int32(65536)], [gf.INVALID])
+
+        np.testing.assert_array_equal([0, 0, 1], result)
+
+    def test_evaluate_masks_uint8_dask(self):
+        flag_data = da.from_array(np.array([[0, 1, 2], [4, 7, 8]], dtype=np.uint8), chunks=(1, 2))
+        global_flag_data = da.from_array(np.array([[64, 0, 0], [0, 0, 128]], dtype=np.uint8), chunks=(1, 2))
+
+        result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data, self.SOURCE_MASKS, self.TARGET_MASKS)
+
+        self.assertIsInstance(result, da.Array)
+        self.assertEqual(((1, 1), (2, 1)), result.chunks)
+        np.testing.assert_array_equal([[64, 2, 1], [18, 19, 128]], result.compute())
+
+    def test_evaluate_masks_uint8_dask_flags_numpy_global_flags(self):
+        flag_data = da.from_array(np.array([[0, 1, 2], [4, 7, 8]], dtype=np.int16), chunks=(1, 3))
+        global_flag_data = np.array([[64, 0, 0], [0, 0, 128]], dtype=np.uint8)
+
+        result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data, self.SOURCE_MASKS, self.TARGET_MASKS)
+
+        self.assertIsInstance(result, da.Array)
+        np.testing.assert_array_equal([[64, 2, 1], [18, 19, 128]], result.compute())
+        np.testing.assert_array_equal([[64, 0, 0], [0, 0, 128]], global_flag_data)
+
+    def test_to_dask_not_tokenized(self):
+        global_flag_data = np.zeros([2, 3], dtype=np.uint8)
+        other = da.from_array(np.zeros([2, 3], dtype=np.int16), chunks=(1, 3))
+
+        first = DefaultFlagMapper._to_dask(global_flag_data, other)
+        second = DefaultFlagMapper._to_dask(global_flag_data, other)
+
+        # tokenizing would hash the data and derive the same name for the same content
+        self.assertNotEqual(first.name, second.name)
+        self.assertEqual(other.chunks, first.chunks)
+        np.testing.assert_array_equal(global_flag_data, first.compute())
+
+    def test_evaluate_masks_uint8_dask_32_bit_flags(self):
+        flag_data = da.from_array(np.array([0, 1, 65536], dtype=np.int32), chunks=2)
+        global_flag_data = np.zeros([3], dtype=np.uint8)
+
+        result = self.mapper.evaluate_masks_uint8(flag_data, global_flag_data, [np.int32(65536)], [gf.INVALID])
+
+        self.assertIsInstance(result, da.Array)
+        np.testing.assert_array_equal([0, 0, 1], result.compute())
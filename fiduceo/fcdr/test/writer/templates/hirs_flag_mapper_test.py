@@ -1,5 +1,6 @@
 import unittest
 
+import dask.array as da
 import numpy as np
 import xarray as xr
 from xarray import Variable
@@ -150,3 +151,28 @@ class HIRS_FlagMapperTest(unittest.TestCase):
         self.assertEqual(10, self.dataset["quality_pixel_bitmask"].data[2, 0])  # use_with_caution & invalid_geoloc
         self.assertEqual(0, self.dataset["quality_pixel_bitmask"].data[2, 1])
         self.assertEqual(0, self.dataset["quality_pixel_bitmask"].data[2, 2])
+
+    def test_map_global_flags_per_line_combinations(self):
+        self.dataset["quality_channel_bitmask"].data[0, :] = 8  # calibration_impossible in all channels
+        self.dataset["quality_channel_bitmask"].data[1, 5] = 4  # self_emission_fails in channel 6
+        self.dataset["quality_channel_bitmask"].data[1, 6] = 16  # calibration_suspect in channel 7
+
+        self.dataset["quality_scanline_bitmask"].data[0] = 2  # reduced_context
+        self.dataset["quality_scanline_bitmask"].data[2] = 6  # reduced_context & bad_temp_no_rself
+
+        self.mapper.map_global_flags(self.dataset)
+
+        np.testing.assert_array_equal([3, 3, 3], self.dataset["quality_pixel_bitmask"].data[0, :])  # invalid & use_with_caution
+        np.testing.assert_array_equal([2, 2, 2], self.dataset["quality_pixel_bitmask"].data[1, :])  # use_with_caution
+        np.testing.assert_array_equal([3, 3, 3], self.dataset["quality_pixel_bitmask"].data[2, :])  # invalid & use_with_caution
+
+    def test_map_global_flags_dask(self):
+        self.dataset["data_quality_bitmask"].data[2, 0] = 1  # suspect_mirror
+        self.dataset["quality_channel_bitmask"].data[0, :] = 1  # do_not_use in all channels
+        self.dataset["quality_scanline_bitmask"].data[1] = 2  # reduced_context
+        dataset = self.dataset.chunk({"y": 2})
+
+        self.mapper.map_global_flags(dataset)
+
+        self.assertIsInstance(dataset["quality_pixel_bitmask"].data, da.Array)
+        np.testing.assert_array_equal([[1, 1, 1], [2, 2, 2], [2, 0, 0]], dataset["quality_pixel_bitmask"].values)
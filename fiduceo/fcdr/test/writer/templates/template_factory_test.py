@@ -72,3 +72,26 @@ class TemplateFactoryTest(unittest.TestCase):
         mviri = self.factory.get_flag_mapper("MVIRI")
         self.assertIsNotNone(mviri)
         self.assertIsInstance(mviri, MVIRI_FlagMapper)
+
+    def test_get_schema(self):
+        schema = self.factory.get_schema("MVIRI", "FULL")
+        self.assertIn("count_vis", schema.variable_names)
+        self.assertIn("u_a0_vis", schema.variable_names)
+        self.assertEqual(("y", "x"), schema.get_variable("count_vis").dims)
+
+        virtual_variables = schema.get_virtual_variables()
+        self.assertEqual(6, len(virtual_variables))
+        self.assertIn("count_vis", virtual_variables["sensitivity_a0_vis"])
+
+        self.assertIs(schema, self.factory.get_schema("MVIRI", "FULL"))
+        self.assertIsNot(schema, self.factory.get_schema("MVIRI", "EASY"))
+
+    def test_get_schema_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            self.factory.get_schema("AVHRR", "MEDIUM")
+
+    def test_create_template(self):
+        dataset = self.factory.create_template("AMSUB", "EASY", 2560)
+
+        self.assertEqual(2560, dataset.dims["y"])
+        self.assertEqual([], self.factory.get_schema("AMSUB", "EASY").validate(dataset))
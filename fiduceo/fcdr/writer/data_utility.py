@@ -1,5 +1,7 @@
 import numpy as np
 
+from fiduceo.common.writer.block_statistics import BlockStatistics
+
 
 class DataUtility:
     @staticmethod
@@ -26,6 +28,98 @@ class DataUtility:
         if scaled_max > valid_max:
             raise ValueError('data scaling overflow: ', data_max)
 
+    @staticmethod
+    def check_dataset_scaling_ranges(dataset, max_workers=None, statistics=None):
+        """
+        Check the data ranges of all variables of a dataset packed to integers against the ranges of their packed data types
+        and their valid_min and valid_max attributes. Minimum, maximum and NaN count of all variables are calculated in one pass over the data, variables are processed in parallel,
+        dask backed variables are evaluated chunk-wise. All violations found are reported at once.
+        :param dataset: the dataset
+        :param max_workers: maximal number of parallel threads for in-memory variables
+        :param statistics: statistics of the variables already calculated with BlockStatistics, calculated if None
+        :return dictionary variable name -> statistics of the checked variables
+         """
+        arrays = DataUtility.get_scaled_arrays(dataset)
+        if statistics is None:
+            statistics = BlockStatistics.calculate_all(arrays, max_workers=max_workers, fill_values=DataUtility.get_fill_values(dataset))
+
+        violations = []
+        for var_name in arrays:
+            variable = dataset.variables[var_name]
+            var_statistics = statistics[var_name]
+            if var_statistics["valid_count"] == 0:
+                continue  # no valid data - will be written as fill value
+
+            valid_range = DataUtility._get_min_max(variable)
+            valid_min = DataUtility._apply_min_attribute(variable, valid_range)
+            valid_max = DataUtility._apply_max_attribute(variable, valid_range)
+
+            scale_factor = DataUtility._get_scale_factor(variable)
+            add_offset = DataUtility._get_add_offset(variable)
+
+            data_min = var_statistics["min"]
+            data_max = var_statistics["max"]
+            scaled_min = round((float(data_min) - add_offset) / scale_factor)
+            scaled_max = round((float(data_max) - add_offset) / scale_factor)
+
+            if scaled_min < valid_min:
+                violations.append(var_name + ": data scaling underflow: " + str(data_min))
+
+            if scaled_max > valid_max:
+                violations.append(var_name + ": data scaling overflow: " + str(data_max))
+
+        if len(violations) > 0:
+            raise ValueError("data scaling range violations: " + "; ".join(violations))
+
+        return statistics
+
+    @staticmethod
+    def get_scaled_arrays(dataset):
+        """
+        :param dataset: the dataset
+        :return dictionary variable name -> data of the variables checked by check_dataset_scaling_ranges()
+         """
+        arrays = dict()
+        for var_name in dataset.data_vars:
+            variable = dataset.variables[var_name]
+            if DataUtility._is_range_checked(variable):
+                arrays[var_name] = variable.data
+        return arrays
+
+    @staticmethod
+    def get_fill_values(dataset):
+        """
+        :param dataset: the dataset
+        :return dictionary variable name -> fill value of the variables checked by check_dataset_scaling_ranges() holding integer data, e.g. raw counts.
+        Elements with the fill value are excluded from the check
+         """
+        fill_values = dict()
+        for var_name in dataset.data_vars:
+            variable = dataset.variables[var_name]
+            if variable.dtype.kind not in "iu" or not DataUtility._is_range_checked(variable):
+                continue
+
+            fill_value = variable.encoding.get("_FillValue", variable.attrs.get("_FillValue"))
+            if fill_value is not None:
+                fill_values[var_name] = fill_value
+        return fill_values
+
+    @staticmethod
+    def _is_range_checked(variable):
+        data_type = variable.encoding.get("dtype")
+        if data_type is None:
+            return False
+
+        if not np.issubdtype(np.dtype(data_type), np.integer) or variable.dtype.kind not in "iuf":
+            return False
+
+        if "valid_min" in variable.attrs or "valid_max" in variable.attrs:
+            return True
+
+        scaled = "scale_factor" in variable.encoding or "add_offset" in variable.encoding
+        # data held unscaled in the packed data type cannot exceed its range
+        return scaled or variable.dtype != np.dtype(data_type)
+
     @staticmethod
     def _get_scale_factor(variable):
         scale_factor = variable.encoding.get('scale_factor')
@@ -54,6 +148,7 @@ class DataUtility:
     def _apply_min_attribute(variable, valid_range):
         valid_min = variable.attrs.get("valid_min")
         if valid_min is not None:
+            valid_min = float(valid_min)  # some templates store the valid range as string
             if valid_min > valid_range.min:
                 return valid_min
 
@@ -63,6 +158,7 @@ class DataUtility:
     def _apply_max_attribute(variable, valid_range):
         valid_max = variable.attrs.get("valid_max")
         if valid_max is not None:
+            valid_max = float(valid_max)  # some templates store the valid range as string
             if valid_max < valid_range.max:
                 return valid_max
 
@@ -1,10 +1,10 @@
-import os
-
-import xarray as xr
-
 from fiduceo.common.version import __version__
-from fiduceo.common.writer.writer_utils import WriterUtils
-from fiduceo.fcdr.writer.templates.template_factory import TemplateFactory
+from fiduceo.common.writer.async_writer import DefaultAsyncWriter
+from fiduceo.common.writer.batch_writer import BatchWriter
+from fiduceo.common.writer.product_writer import ProductWriter
+from fiduceo.common.writer.size_estimator import SizeEstimator
+from fiduceo.fcdr.writer.data_utility import DataUtility
+from fiduceo.fcdr.writer.templates.template_factory import TemplateFactory, EASY, FULL
 
 DATE_PATTERN = "%Y%m%d%H%M%S"
 
@@ -12,41 +12,69 @@ DATE_PATTERN = "%Y%m%d%H%M%S"
 class FCDRWriter:
 
     @staticmethod
-    def write(ds, file, compression_level=None, overwrite=False):
+    def write(ds, file, compression_level=None, overwrite=False, check_ranges=False, resume=False, cache_encoding=True, flag_statistics=False, variable_statistics=False, profiler=None, scheduler=None, access_pattern=None):
         """
         Save a dataset to NetCDF file.
         :param ds: The dataset
         :param file: File path
         :param compression_level: the file compression level, 0 - 9, default is 5
-        :param overwrite: set true to overwrite existing files
+        :param overwrite: set true to overwrite existing files. The existing file is replaced only after the new one has been written completely
+        :param check_ranges: set true to verify that the data of all scaled variables fits into the packed data types, raises ValueError listing all violations
+        :param resume: set true to write variable by variable with a progress journal; repeating an interrupted write continues after the last completed variable
+        :param cache_encoding: set false to compile the encoding for this dataset only instead of using the plan cached per layout and variable encodings
+        :param flag_statistics: set true to count the pixels per flag of all flag variables, stored as attribute "flag_counts" aligned with "flag_masks"
+        :param variable_statistics: set true to store valid count, fill fraction, minimum, maximum, mean and standard deviation of all numerical variables as attributes
+        :param profiler: WriteProfiler collecting the time of all processing phases, the time and compressed size of every variable, optional. Profiled writes are slower, variables are written one by one
+        :param scheduler: the dask scheduler computing and writing dask backed variables chunk by chunk, e.g. of chunked templates: "threads" (default) or "processes" for block functions
+        holding the GIL. Statistics and range checks are computed together with the chunks, the block functions are evaluated once
+        :param access_pattern: the expected read access pattern of the product, "full_scan", "scanline_blocks", "spatial_tiles" or "per_channel". If set, the chunk sizes
+        of all data variables are calculated by the ChunkingAdvisor for it instead of using the chunk sizes of the template
+        :return if flag_statistics is set, dictionary variable name -> dictionary flag meaning -> number of pixels, else None
          """
-        if os.path.isfile(file):
-            if overwrite is True:
-                os.remove(file)
-            else:
-                raise IOError("The file already exists: " + file)
-
         # trigger mapping of sensor specific flags to the global flag variable
-        template_factory = TemplateFactory()
-        flag_mapper = template_factory.get_flag_mapper(ds.attrs["template_key"])
-        flag_mapper.map_global_flags(ds)
+        def map_flags(dataset):
+            template_factory = TemplateFactory()
+            flag_mapper = template_factory.get_flag_mapper(dataset.attrs["template_key"])
+            flag_mapper.map_global_flags(dataset)
+
+        return ProductWriter.write(ds, file, map_flags=map_flags, range_checker=DataUtility if check_ranges is True else None, compression_level=compression_level,
+                                   overwrite=overwrite, resume=resume, cache_encoding=cache_encoding, flag_statistics=flag_statistics, variable_statistics=variable_statistics,
+                                   profiler=profiler, scheduler=scheduler, access_pattern=access_pattern)
 
-        # set up compression parameter for ALL variables. Unfortunately, xarray does not allow
-        # one set of compression params per file, only per variable. tb 2017-01-25
-        if compression_level is None:
-            compression_level = 5
+    @staticmethod
+    def write_many(jobs, workers=None, memory_budget=None):
+        """
+        Save many datasets to NetCDF files concurrently, using a pool of worker processes.
+        :param jobs: iterable of WriteJob or (dataset, file) tuples. Instead of a dataset, a picklable callable producing the dataset in the worker process can be supplied,
+        its memory consumption is then taken from the WriteJob, e.g. as estimated by estimate_size()
+        :param workers: the maximal number of worker processes, default is the number of CPUs
+        :param memory_budget: the maximal number of bytes used by all concurrently running jobs, default is unlimited
+        :return list of the files written
+         """
+        batch_writer = BatchWriter(FCDRWriter.write, workers=workers, memory_budget=memory_budget)
+        return batch_writer.write(jobs)
 
-        comp = dict(zlib=True, complevel=compression_level)
-        encoding = dict()
-        for var_name in ds.data_vars:
-            var_encoding = dict(comp)
-            var_encoding.update(ds[var_name].encoding)
-            encoding.update({var_name: var_encoding})
+    @staticmethod
+    def submit(ds, file, compression_level=None, overwrite=False, check_ranges=False, resume=False, cache_encoding=True, variable_statistics=False, profiler=None, scheduler=None, access_pattern=None):
+        """
+        Save a dataset to NetCDF file in a background thread. Returns immediately unless the maximal number of
+        pending writes is reached. The dataset must not be modified until the returned future is done. Call flush() before
+        the program exits, writes still pending at interpreter exit cannot use thread pools and fail for dask backed data.
+        Parameters are the same as for write(), except flag_statistics, which is not supported: the result of the future is the file path.
+        :return concurrent.futures.Future, its result is the file path
+         """
+        async_writer = DefaultAsyncWriter.get(FCDRWriter.write)
+        return async_writer.submit(ds, file, compression_level=compression_level, overwrite=overwrite, check_ranges=check_ranges, resume=resume, cache_encoding=cache_encoding, variable_statistics=variable_statistics, profiler=profiler, scheduler=scheduler, access_pattern=access_pattern)
 
-        ds.to_netcdf(file, format='netCDF4', engine='netcdf4', encoding=encoding)
+    @staticmethod
+    def flush():
+        """
+        Wait until all datasets passed to submit() are written.
+         """
+        DefaultAsyncWriter.get(FCDRWriter.write).flush()
 
     @staticmethod
-    def createTemplateEasy(sensorType, height, srf_size=None, corr_dx=None, corr_dy=None, lut_size=None):
+    def createTemplateEasy(sensorType, height, srf_size=None, corr_dx=None, corr_dy=None, lut_size=None, shared_memory=False, pool=None, packed=False, chunked=False, disk_file=None):
         """
         Create a template dataset in EASY FCDR format for the sensor given as argument.
         :param sensorType: the sensor type to create the template for
@@ -55,42 +83,54 @@ class FCDRWriter:
         :param corr_dx: correlation length across track
         :param corr_dy: correlation length along track
         :param lut_size: size of a BT/radiance conversion lookup table
-        :return the template dataset
+        :param shared_memory: set true to allocate the data of all variables in one shared memory block, worker processes can attach with the descriptor and fill the data in parallel
+        :param pool: TemplatePool to take the template from instead of allocating it, optional. Return the dataset with pool.release() after writing
+        :param packed: set true to hold scaled variables in their packed integer data type, halving the memory needed. Read and write their physical values with PackedVariable
+        :param chunked: set true to hold all chunked variables in dask arrays chunked like their encoding, without allocating them. Fill them with ChunkedTemplate.map_blocks()
+        :param disk_file: the product file path. If set, the template data is memory mapped from a scratch file next to the product, for products larger than the memory.
+        Fill the dataset of the returned DiskTemplate, its close() writes the product, accepting the keyword arguments of write()
+        :return the template dataset, a SharedTemplate if shared_memory is set, a DiskTemplate if disk_file is set
          """
-        dataset = xr.Dataset()
-        WriterUtils.add_standard_global_attributes(dataset)
-
-        template_factory = TemplateFactory()
-
-        sensor_template = template_factory.get_sensor_template(sensorType)
-        sensor_template.add_original_variables(dataset, height, srf_size)
-        sensor_template.add_specific_global_metadata(dataset)
-        sensor_template.add_easy_fcdr_variables(dataset, height, corr_dx, corr_dy, lut_size)
-        sensor_template.add_template_key(dataset)
-
-        return dataset
+        return TemplateFactory().create_template(sensorType, EASY, height, srf_size, corr_dx, corr_dy, lut_size, shared_memory=shared_memory, pool=pool, packed=packed, chunked=chunked, disk_file=disk_file, write_function=FCDRWriter.write)
 
     @staticmethod
-    def createTemplateFull(sensorType, height):
+    def createTemplateFull(sensorType, height, shared_memory=False, pool=None, packed=False, chunked=False, disk_file=None):
         """
         Create a template dataset in FULL FCDR format for the sensor given as argument.
         :param sensorType: the sensor type to create the template for
         :param height the hheight in pixels of the data product
-        :return the template dataset
+        :param shared_memory: set true to allocate the data of all variables in one shared memory block, worker processes can attach with the descriptor and fill the data in parallel
+        :param pool: TemplatePool to take the template from instead of allocating it, optional. Return the dataset with pool.release() after writing
+        :param packed: set true to hold scaled variables in their packed integer data type, halving the memory needed. Read and write their physical values with PackedVariable
+        :param chunked: set true to hold all chunked variables in dask arrays chunked like their encoding, without allocating them. Fill them with ChunkedTemplate.map_blocks()
+        :param disk_file: the product file path. If set, the template data is memory mapped from a scratch file next to the product, for products larger than the memory.
+        Fill the dataset of the returned DiskTemplate, its close() writes the product, accepting the keyword arguments of write()
+        :return the template dataset, a SharedTemplate if shared_memory is set, a DiskTemplate if disk_file is set
          """
-        dataset = xr.Dataset()
-
-        WriterUtils.add_standard_global_attributes(dataset)
+        return TemplateFactory().create_template(sensorType, FULL, height, shared_memory=shared_memory, pool=pool, packed=packed, chunked=chunked, disk_file=disk_file, write_function=FCDRWriter.write)
 
+    @staticmethod
+    def estimate_size(sensorType, height, mode=EASY, srf_size=None, corr_dx=None, corr_dy=None, lut_size=None, compression_model=None, packed=False):
+        """
+        Estimate memory consumption and file size of a product without allocating the template.
+        :param sensorType: the sensor type
+        :param height: the height in pixels of the data product
+        :param mode: the product mode, "EASY" or "FULL"
+        :param srf_size: if set, the length of the spectral response function in frequency steps, EASY only
+        :param corr_dx: correlation length across track, EASY only
+        :param corr_dy: correlation length along track, EASY only
+        :param lut_size: size of a BT/radiance conversion lookup table, EASY only
+        :param compression_model: CompressionModel calibrated on sample products, optional. If None, the file size is the uncompressed size
+        :param packed: set true for templates in packed storage
+        :return the SizeEstimate
+         """
         template_factory = TemplateFactory()
+        schema = template_factory.get_schema(sensorType, mode, srf_size, corr_dx, corr_dy, lut_size, packed=packed)
+        if schema is None:
+            dataset = template_factory.create_template(sensorType, mode, height, srf_size, corr_dx, corr_dy, lut_size, packed=packed)
+            return SizeEstimator.estimate_dataset(dataset, compression_model)
 
-        sensor_template = template_factory.get_sensor_template(sensorType)
-        sensor_template.add_original_variables(dataset, height)
-        sensor_template.add_specific_global_metadata(dataset)
-        sensor_template.add_full_fcdr_variables(dataset, height)
-        sensor_template.add_template_key(dataset)
-
-        return dataset
+        return SizeEstimator.estimate_schema(schema, height, compression_model)
 
     @staticmethod
     def create_file_name_FCDR_easy(sensor, platform, start, end, version):
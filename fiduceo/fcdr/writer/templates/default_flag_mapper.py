@@ -1,13 +1,139 @@
+import threading
+
+import dask.array as da
 import numpy as np
 
+# number of pixels mapped per block, keeps the temporary lookup results in the CPU caches
+LOOKUP_BLOCK_ELEMENTS = 1 << 18
+
+
 class DefaultFlagMapper:
+    _lookup_tables = dict()
+    _lookup_tables_lock = threading.Lock()
 
     def map_global_flags(self, dataset):
         pass
 
     def evaluate_masks_uint8(self, avhrr_flag_data, global_flag_data, source_masks, target_masks):
+        if isinstance(avhrr_flag_data, da.Array) or isinstance(global_flag_data, da.Array):
+            return DefaultFlagMapper.evaluate_masks_lazy(avhrr_flag_data, global_flag_data, source_masks, target_masks)
+
+        if not DefaultFlagMapper._supports_lookup(avhrr_flag_data, global_flag_data):
+            for source_mask, target_mask in zip(source_masks, target_masks):
+                intermediate = np.bitwise_and(avhrr_flag_data, source_mask) > 0
+                intermediate = intermediate.astype(np.uint8) * target_mask
+                global_flag_data = np.bitwise_or(global_flag_data, intermediate)
+            return global_flag_data
+
+        lookup_table = DefaultFlagMapper.get_lookup_table(source_masks, target_masks, avhrr_flag_data.dtype)
+        return DefaultFlagMapper.apply_lookup_table(lookup_table, avhrr_flag_data, global_flag_data)
+
+    @staticmethod
+    def get_lookup_table(source_masks, target_masks, data_type):
+        """
+        Get the table mapping every possible sensor flag value to the global flags it sets. Tables are compiled once per mask table.
+        :param source_masks: the sensor flag masks
+        :param target_masks: the global flag masks, one per sensor flag mask
+        :param data_type: the sensor flag data type, 8 or 16 bit integer
+        :return uint8 array with 256 or 65536 entries
+         """
+        data_type = np.dtype(data_type)
+        key = (tuple(int(mask) for mask in source_masks), tuple(int(mask) for mask in target_masks), data_type.str)
+
+        with DefaultFlagMapper._lookup_tables_lock:
+            lookup_table = DefaultFlagMapper._lookup_tables.get(key)
+            if lookup_table is None:
+                lookup_table = DefaultFlagMapper.create_lookup_table(source_masks, target_masks, data_type)
+                DefaultFlagMapper._lookup_tables[key] = lookup_table
+
+        return lookup_table
+
+    @staticmethod
+    def create_lookup_table(source_masks, target_masks, data_type):
+        # table index is the bit pattern of the flag value - evaluate the masks on all values of the data type
+        data_type = np.dtype(data_type)
+        flag_values = np.arange(1 << (8 * data_type.itemsize), dtype=np.int64).astype("u" + str(data_type.itemsize)).view(data_type)
+        lookup_table = np.zeros(flag_values.shape, dtype=np.uint8)
         for source_mask, target_mask in zip(source_masks, target_masks):
-            intermediate = np.bitwise_and(avhrr_flag_data, source_mask) > 0
-            intermediate = intermediate.astype(np.uint8) * target_mask
-            global_flag_data = np.bitwise_or(global_flag_data, intermediate)
-        return global_flag_data
\ No newline at end of file
+            lookup_table[np.bitwise_and(flag_values, source_mask) > 0] |= np.uint8(target_mask)
+
+        lookup_table.flags.writeable = False
+        return lookup_table
+
+    @staticmethod
+    def apply_lookup_table(lookup_table, flag_data, global_flag_data):
+        """
+        Map sensor flags to global flags, combining them with the global flags already set. The global flag data is
+        modified in place, block by block.
+        :param lookup_table: the table as returned by get_lookup_table()
+        :param flag_data: the sensor flag data, 8 or 16 bit integers
+        :param global_flag_data: the global flag data, uint8, same shape as the sensor flags
+        :return the global flag data
+         """
+        flag_values = flag_data.view(np.dtype("u" + str(flag_data.dtype.itemsize)))
+
+        if not (flag_values.flags.c_contiguous and global_flag_data.flags.c_contiguous):
+            np.bitwise_or(global_flag_data, np.take(lookup_table, flag_values), out=global_flag_data)
+            return global_flag_data
+
+        flat_flags = flag_values.reshape(-1)
+        flat_global = global_flag_data.reshape(-1)
+        mapped = np.empty(min(LOOKUP_BLOCK_ELEMENTS, flat_flags.size), dtype=np.uint8)
+        for start in range(0, flat_flags.size, LOOKUP_BLOCK_ELEMENTS):
+            end = min(start + LOOKUP_BLOCK_ELEMENTS, flat_flags.size)
+            block_mapped = mapped[:end - start]
+            np.take(lookup_table, flat_flags[start:end], out=block_mapped, mode="clip")
+            np.bitwise_or(flat_global[start:end], block_mapped, out=flat_global[start:end])
+
+        return global_flag_data
+
+    @staticmethod
+    def evaluate_masks_lazy(flag_data, global_flag_data, source_masks, target_masks):
+        """
+        Map sensor flags to global flags as a lazy, chunk-wise dask operation. Nothing is computed until the result
+        is evaluated, e.g. when writing the dataset.
+        :param flag_data: the sensor flag data, numpy or dask array
+        :param global_flag_data: the global flag data, numpy or dask array, same shape as the sensor flags
+        :param source_masks: the sensor flag masks
+        :param target_masks: the global flag masks, one per sensor flag mask
+        :return dask array with the combined global flags
+         """
+        flag_data = DefaultFlagMapper._to_dask(flag_data, global_flag_data)
+        global_flag_data = DefaultFlagMapper._to_dask(global_flag_data, flag_data)
+
+        if flag_data.dtype.kind not in "iu" or flag_data.dtype.itemsize > 2:
+            # ufuncs on dask arrays are lazy already
+            for source_mask, target_mask in zip(source_masks, target_masks):
+                intermediate = np.bitwise_and(flag_data, source_mask) > 0
+                intermediate = intermediate.astype(np.uint8) * target_mask
+                global_flag_data = np.bitwise_or(global_flag_data, intermediate)
+            return global_flag_data
+
+        lookup_table = DefaultFlagMapper.get_lookup_table(source_masks, target_masks, flag_data.dtype)
+        return da.map_blocks(DefaultFlagMapper._map_block, flag_data, global_flag_data, lookup_table=lookup_table, dtype=np.result_type(global_flag_data.dtype, np.uint8))
+
+    @staticmethod
+    def _map_block(flag_block, global_block, lookup_table=None):
+        mapped = np.take(lookup_table, flag_block.view(np.dtype("u" + str(flag_block.dtype.itemsize))))
+        # blocks handed in by dask must not be modified
+        return np.bitwise_or(global_block, mapped)
+
+    @staticmethod
+    def _to_dask(data, other):
+        if isinstance(data, da.Array):
+            return data
+
+        if isinstance(other, da.Array):
+            return da.from_array(data, chunks=other.chunks, name=False)
+
+        return da.from_array(data, chunks=data.shape, name=False)
+
+    @staticmethod
+    def _supports_lookup(flag_data, global_flag_data):
+        if not isinstance(flag_data, np.ndarray) or not isinstance(global_flag_data, np.ndarray):
+            return False
+
+        if flag_data.dtype.kind not in "iu" or flag_data.dtype.itemsize > 2:
+            return False
+
+        return global_flag_data.dtype == np.uint8 and global_flag_data.flags.writeable and global_flag_data.shape == flag_data.shape
@@ -1,3 +1,4 @@
+import dask.array as da
 import numpy as np
 
 from fiduceo.fcdr.writer.global_flags import GlobalFlags as gf
@@ -48,39 +49,37 @@ class HIRS_FlagMapper(DefaultFlagMapper):
         if not "quality_channel_bitmask" in dataset.data_vars:  # special case for HIRS2, does not contain this variable tb 2018-02-19
             return global_flag_data
 
-        channel_flag_data = dataset["quality_channel_bitmask"].data
-        num_channels = channel_flag_data.shape[1]
-        for line in range(0, channel_flag_data.shape[0]):
-            for source_mask in self.source_channel_masks_dual:
-                flag_count = 0
-                flag_set = False
-                for channel in range(0, num_channels):
-                    channel_flag_set = np.bitwise_and(source_mask, channel_flag_data[line, channel]) > 0
-                    flag_set |= channel_flag_set
-                    flag_count += channel_flag_set.astype(np.uint8)
-
-                if flag_count == num_channels:
-                    global_flag_data[line, :] = np.bitwise_or(global_flag_data[line, :], gf.INVALID)
-                elif flag_set:
-                    global_flag_data[line, :] = np.bitwise_or(global_flag_data[line, :], gf.USE_WITH_CAUTION)
-
-            for source_mask in self.source_channel_masks:
-                flag_set = False
-                for channel in range(0, num_channels):
-                    channel_flag_set = np.bitwise_and(source_mask, channel_flag_data[line, channel]) > 0
-                    flag_set |= channel_flag_set
-
-                if flag_set:
-                    global_flag_data[line, :] = np.bitwise_or(global_flag_data[line, :], gf.USE_WITH_CAUTION)
+        # the per scanline flag variables are small - evaluate them, the pixel flags stay lazy
+        channel_flag_data = np.asarray(dataset["quality_channel_bitmask"].data)
+        line_flags = np.zeros(channel_flag_data.shape[0], dtype=np.uint8)
 
-        return global_flag_data
+        for source_mask in self.source_channel_masks_dual:
+            channel_flag_set = np.bitwise_and(channel_flag_data, source_mask) > 0
+            all_set = np.all(channel_flag_set, axis=1)
+            any_set = np.any(channel_flag_set, axis=1)
+            line_flags[all_set] |= gf.INVALID
+            line_flags[any_set & ~all_set] |= gf.USE_WITH_CAUTION
+
+        for source_mask in self.source_channel_masks:
+            any_set = np.any(np.bitwise_and(channel_flag_data, source_mask) > 0, axis=1)
+            line_flags[any_set] |= gf.USE_WITH_CAUTION
+
+        return self._apply_line_flags(global_flag_data, line_flags)
 
     def apply_scanline_flags(self, dataset, global_flag_data):
-        scanline_flag_data = dataset["quality_scanline_bitmask"].data
-        for line in range(0, scanline_flag_data.shape[0]):
-            for source_mask, target_mask in zip(self.source_scanline_masks, self.target_scanline_masks):
-                flag_set = np.bitwise_and(source_mask, scanline_flag_data[line]) > 0
-                if flag_set:
-                    global_flag_data[line, :] = np.bitwise_or(global_flag_data[line, :], target_mask)
+        scanline_flag_data = np.asarray(dataset["quality_scanline_bitmask"].data)
+        line_flags = np.zeros(scanline_flag_data.shape[0], dtype=np.uint8)
+
+        for source_mask, target_mask in zip(self.source_scanline_masks, self.target_scanline_masks):
+            line_flags[np.bitwise_and(scanline_flag_data, source_mask) > 0] |= target_mask
+
+        return self._apply_line_flags(global_flag_data, line_flags)
+
+    @staticmethod
+    def _apply_line_flags(global_flag_data, line_flags):
+        # broadcast the per scanline flags to all pixels of the line
+        if isinstance(global_flag_data, da.Array) or not global_flag_data.flags.writeable:
+            return np.bitwise_or(global_flag_data, line_flags[:, np.newaxis])
 
+        np.bitwise_or(global_flag_data, line_flags[:, np.newaxis], out=global_flag_data)
         return global_flag_data
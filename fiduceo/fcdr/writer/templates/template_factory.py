@@ -1,3 +1,11 @@
+import xarray as xr
+
+from fiduceo.common.writer.chunked_template import ChunkedTemplate
+from fiduceo.common.writer.disk_template import DiskTemplate
+from fiduceo.common.writer.packed_data import PackedData
+from fiduceo.common.writer.shared_template import SharedTemplate
+from fiduceo.common.writer.template_schema import TemplateSchema
+from fiduceo.common.writer.writer_utils import WriterUtils
 from fiduceo.fcdr.writer.templates.amsub_mhs import AMSUB_MHS
 from fiduceo.fcdr.writer.templates.avhrr import AVHRR
 from fiduceo.fcdr.writer.templates.avhrr_flag_mapper import AVHRR_FlagMapper
@@ -11,6 +19,9 @@ from fiduceo.fcdr.writer.templates.mviri_flag_mapper import MVIRI_FlagMapper
 from fiduceo.fcdr.writer.templates.mviri_static import MVIRI_STATIC
 from fiduceo.fcdr.writer.templates.ssmt2 import SSMT2
 
+EASY = "EASY"
+FULL = "FULL"
+
 
 class TemplateFactory:
     def __init__(self):
@@ -26,3 +37,96 @@ class TemplateFactory:
 
     def get_flag_mapper(self, name):
         return self.flag_mapper[name]
+
+    def get_schema(self, name, mode=EASY, srf_size=None, corr_dx=None, corr_dy=None, lut_size=None, packed=False):
+        """
+        Get the schema of a product, the layout is known without allocating a template.
+        :param name: the sensor name
+        :param mode: the product mode, "EASY" or "FULL"
+        :param srf_size: if set, the length of the spectral response function in frequency steps, EASY only
+        :param corr_dx: correlation length across track, EASY only
+        :param corr_dy: correlation length along track, EASY only
+        :param lut_size: size of a BT/radiance conversion lookup table, EASY only
+        :param packed: set true to hold scaled variables in their packed integer data type, see PackedData
+        :return the schema, None if the template cannot be represented by a schema
+         """
+        key, build_function = self._get_template_builder(name, mode, srf_size, corr_dx, corr_dy, lut_size, packed)
+        return TemplateSchema.get(key, build_function)
+
+    def create_template(self, name, mode, height, srf_size=None, corr_dx=None, corr_dy=None, lut_size=None, shared_memory=False, pool=None, packed=False, chunked=False, disk_file=None, write_function=None):
+        """
+        Create a template dataset.
+        :param name: the sensor name
+        :param mode: the product mode, "EASY" or "FULL"
+        :param height: the height in pixels of the data product
+        :param srf_size: if set, the length of the spectral response function in frequency steps, EASY only
+        :param corr_dx: correlation length across track, EASY only
+        :param corr_dy: correlation length along track, EASY only
+        :param lut_size: size of a BT/radiance conversion lookup table, EASY only
+        :param shared_memory: set true to allocate the template data in one shared memory block
+        :param pool: TemplatePool to take the template from, optional
+        :param packed: set true to hold scaled variables in their packed integer data type, see PackedData
+        :param chunked: set true to hold chunked variables in dask arrays, see ChunkedTemplate
+        :param disk_file: the product file path, if set the template data is memory mapped from a scratch file next to it, see DiskTemplate
+        :param write_function: the function writing the product when a disk backed template is closed
+        :return the template dataset, a SharedTemplate if shared_memory is set, a DiskTemplate if disk_file is set
+         """
+        key, build_function = self._get_template_builder(name, mode, srf_size, corr_dx, corr_dy, lut_size, packed)
+        if disk_file is not None:
+            if chunked is True or shared_memory is True or pool is not None:
+                raise ValueError("disk backed templates cannot be chunked, shared or pooled")
+            return DiskTemplate.create(key, build_function, height, disk_file, write_function)
+
+        if chunked is True:
+            if shared_memory is True or pool is not None:
+                raise ValueError("chunked templates cannot be shared or pooled")
+            return ChunkedTemplate.create(key, build_function, height)
+
+        if shared_memory is True:
+            if pool is not None:
+                raise ValueError("shared memory templates cannot be pooled")
+            return SharedTemplate.create(key, build_function, height)
+
+        if pool is not None:
+            return pool.acquire(key, build_function, height)
+
+        return TemplateSchema.create(key, build_function, height)
+
+    def _get_template_builder(self, name, mode, srf_size, corr_dx, corr_dy, lut_size, packed):
+        sensor_template = self.get_sensor_template(name)
+        if mode == EASY:
+            key = (EASY, name, srf_size, corr_dx, corr_dy, lut_size)
+            build_function = lambda height: TemplateFactory._build_template_easy(sensor_template, height, srf_size, corr_dx, corr_dy, lut_size)
+        elif mode == FULL:
+            key = (FULL, name)
+            build_function = lambda height: TemplateFactory._build_template_full(sensor_template, height)
+        else:
+            raise ValueError("unsupported product mode: " + str(mode))
+
+        if packed is True:
+            return PackedData.wrap_builder(key, build_function)
+        return key, build_function
+
+    @staticmethod
+    def _build_template_easy(sensor_template, height, srf_size, corr_dx, corr_dy, lut_size):
+        dataset = xr.Dataset()
+        WriterUtils.add_standard_global_attributes(dataset)
+
+        sensor_template.add_original_variables(dataset, height, srf_size)
+        sensor_template.add_specific_global_metadata(dataset)
+        sensor_template.add_easy_fcdr_variables(dataset, height, corr_dx, corr_dy, lut_size)
+        sensor_template.add_template_key(dataset)
+
+        return dataset
+
+    @staticmethod
+    def _build_template_full(sensor_template, height):
+        dataset = xr.Dataset()
+        WriterUtils.add_standard_global_attributes(dataset)
+
+        sensor_template.add_original_variables(dataset, height)
+        sensor_template.add_specific_global_metadata(dataset)
+        sensor_template.add_full_fcdr_variables(dataset, height)
+        sensor_template.add_template_key(dataset)
+
+        return dataset